@@ -0,0 +1,254 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# order statuses after which an order is no longer open
+DONE_STATUSES = ("FILLED", "CANCELED", "EXPIRED", "REJECTED")
+
+
+class Position:
+    def __init__(self, symbol, amount=0.0, entry_price=0.0, unrealized_pnl=0.0, margin_type="", leverage=0):
+        self.symbol = symbol
+        self.amount = amount
+        self.entry_price = entry_price
+        self.unrealized_pnl = unrealized_pnl
+        self.margin_type = margin_type
+        # reported by the REST snapshot and ACCOUNT_CONFIG_UPDATE events, 0 when unknown
+        self.leverage = leverage
+
+    def __repr__(self):
+        return f"Position({self.symbol}, amount={self.amount}, entry_price={self.entry_price})"
+
+
+# Local copy of the futures account, kept current by user data stream events. Positions, balances and
+# open orders become in-memory lookups, and waiters are woken the moment an event changes something.
+class AccountState:
+    def __init__(self, max_fills=1000):
+        self.positions = {}
+        self.balances = {}
+        self.orders = {}
+        self.fills = OrderedDict()
+        self.max_fills = max_fills
+        self.version = 0
+        # True once a REST snapshot has been loaded, before that an empty account means nothing
+        self.loaded = False
+        self.condition = threading.Condition()
+        self._on_order = []
+        self._on_position = []
+        self._on_account = []
+
+    # register a function called with (order event) for every ORDER_TRADE_UPDATE
+    def on_order(self, func):
+        self._on_order.append(func)
+
+    # register a function called with (position) whenever a position amount changes
+    def on_position(self, func):
+        self._on_position.append(func)
+
+    # register a function called with (the "a" object) for every ACCOUNT_UPDATE, after it has been applied
+    def on_account(self, func):
+        self._on_account.append(func)
+
+    def position(self, symbol):
+        return self.positions.get(symbol) or Position(symbol)
+
+    def position_amount(self, symbol):
+        return self.position(symbol).amount
+
+    def in_position(self, symbol):
+        return self.position_amount(symbol) != 0.0
+
+    def balance(self, asset="USDT"):
+        return self.balances.get(asset, 0.0)
+
+    def open_orders(self, symbol):
+        return [order for order in self.orders.values() if order["s"] == symbol]
+
+    def _changed(self):
+        self.version += 1
+        self.condition.notify_all()
+
+    # replace everything with a REST snapshot (positionRisk, balance and openOrders responses)
+    def load_snapshot(self, positions, balances, orders):
+        with self.condition:
+            self.positions = {p["symbol"]: Position(p["symbol"], float(p["positionAmt"]), float(p["entryPrice"]),
+                                                    float(p.get("unRealizedProfit", 0)), p.get("marginType", ""),
+                                                    int(p.get("leverage", 0)))
+                              for p in positions if p.get("positionSide", "BOTH") == "BOTH"}
+            self.balances = {b["asset"]: float(b["balance"]) for b in balances}
+            self.orders = {o["orderId"]: {"s": o["symbol"], "i": o["orderId"], "o": o["type"], "S": o["side"],
+                                          "X": o["status"], "q": o["origQty"], "sp": o.get("stopPrice", "0")}
+                           for o in orders}
+            self.loaded = True
+            self._changed()
+
+    def apply_account_update(self, data):
+        changed = []
+        with self.condition:
+            for balance in data["a"].get("B", []):
+                self.balances[balance["a"]] = float(balance["wb"])
+            for p in data["a"].get("P", []):
+                if p.get("ps", "BOTH") != "BOTH":
+                    continue
+                position = Position(p["s"], float(p["pa"]), float(p["ep"]), float(p.get("up", 0)), p.get("mt", ""),
+                                    self.position(p["s"]).leverage)
+                if position.amount != self.position_amount(p["s"]):
+                    changed.append(position)
+                self.positions[p["s"]] = position
+            self._changed()
+        for func in self._on_account:
+            func(data["a"])
+        for position in changed:
+            for func in self._on_position:
+                func(position)
+
+    def apply_order_update(self, data):
+        order = data["o"]
+        with self.condition:
+            if order["X"] in DONE_STATUSES:
+                self.orders.pop(order["i"], None)
+            else:
+                self.orders[order["i"]] = order
+            if order["X"] == "FILLED":
+                self.fills[order["i"]] = order
+                while len(self.fills) > self.max_fills:
+                    self.fills.popitem(last=False)
+            self._changed()
+        for func in self._on_order:
+            func(order)
+
+    # a leverage change (the "ac" object of an ACCOUNT_CONFIG_UPDATE)
+    def apply_config_update(self, data):
+        config = data.get("ac")
+        if config is None:
+            return
+        with self.condition:
+            position = self.positions.get(config["s"])
+            if position is None:
+                position = self.positions[config["s"]] = Position(config["s"])
+            position.leverage = int(config["l"])
+            self._changed()
+
+    def handle_event(self, data):
+        event = data.get("e")
+        if event == "ACCOUNT_UPDATE":
+            self.apply_account_update(data)
+        elif event == "ORDER_TRADE_UPDATE":
+            self.apply_order_update(data)
+        elif event == "ACCOUNT_CONFIG_UPDATE":
+            self.apply_config_update(data)
+
+    # block until any event changes the account after `version`, or the timeout passes. returns the new version
+    def wait_for_change(self, version=None, timeout=None):
+        with self.condition:
+            version = self.version if version is None else version
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    # block until the account shows an open position in symbol, False on timeout
+    def wait_for_position(self, symbol, timeout=5.0):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.in_position(symbol), timeout)
+
+    # average fill price of an order once the stream reports it filled, None on timeout
+    def wait_for_fill(self, order_id, timeout=5.0):
+        with self.condition:
+            if self.condition.wait_for(lambda: order_id in self.fills, timeout):
+                return float(self.fills[order_id]["ap"])
+        return None
+
+
+# Feeds an AccountState from the futures user data stream. The listen key is kept alive every 30 minutes,
+# and on every (re)connect the state is resynced from REST so nothing missed while offline is lost.
+class UserDataStream:
+    def __init__(self, exchange, account, url="wss://fstream.binance.com", keepalive_interval=1800):
+        self.exchange = exchange
+        self.account = account
+        self.url = url
+        self.keepalive_interval = keepalive_interval
+        self.connected = threading.Event()
+        self.listen_key = None
+        self._ws = None
+        self._running = False
+
+    # positions, balances and open orders of every market, requested together
+    def resync(self):
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="resync") as pool:
+            requests = [pool.submit(self.exchange.position_risk), pool.submit(self.exchange.balance),
+                        pool.submit(self.exchange.open_orders)]
+            self.account.load_snapshot(*(request.result() for request in requests))
+
+    def handle_message(self, message):
+        data = json.loads(message)
+        metrics.count("bot_user_events_total", event=data.get("e"))
+        if data.get("e") == "listenKeyExpired":
+            # reconnect with a new key
+            self._ws.close()
+            return
+        self.account.handle_event(data)
+
+    def _on_open(self, ws):
+        self.resync()
+        self.connected.set()
+
+    def _on_message(self, ws, message):
+        self.handle_message(message)
+
+    def _on_close(self, ws, status, reason):
+        self.connected.clear()
+
+    def _keepalive(self):
+        while self._running:
+            time.sleep(self.keepalive_interval)
+            try:
+                self.exchange.keepalive_listen_key()
+            except Exception:
+                logger.warning("listen key keepalive failed, reconnecting the user data stream", exc_info=True)
+                if self._ws is not None:
+                    self._ws.close()
+
+    def _run(self):
+        while self._running:
+            try:
+                self.listen_key = self.exchange.new_listen_key()
+            except Exception:
+                logger.error("can't get a listen key for the user data stream, retrying", exc_info=True)
+                time.sleep(5)
+                continue
+            self._ws = websocket.WebSocketApp(f"{self.url}/ws/{self.listen_key}",
+                                              on_open=self._on_open,
+                                              on_message=self._on_message,
+                                              on_close=self._on_close)
+            self._ws.run_forever(ping_interval=60, ping_timeout=10)
+            self.connected.clear()
+            if self._running:
+                time.sleep(1)
+
+    # connect, resync and keep streaming in background threads. waits for the first resync, if the stream
+    # hasn't connected and resynced by the timeout the account is loaded over REST here, so it is always loaded
+    # when start returns. raises if that resync fails
+    def start(self, timeout=30):
+        self._running = True
+        threading.Thread(target=self._run, name="user-data", daemon=True).start()
+        threading.Thread(target=self._keepalive, name="listen-key-keepalive", daemon=True).start()
+        if not self.connected.wait(timeout):
+            self.resync()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._ws is not None:
+            self._ws.close()
+        try:
+            self.exchange.close_listen_key()
+        except Exception:
+            logger.warning("can't close the listen key", exc_info=True)
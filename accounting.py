@@ -0,0 +1,229 @@
+import threading
+from collections import namedtuple
+
+import bot_functions as bf
+import metrics
+
+# Running profit and loss, fees, funding and exposure per market and in total, kept current one event at a
+# time instead of being worked out from the trade log. Realized profit and commission are the ones binance
+# reports with every fill, funding is the balance change of a FUNDING_FEE account update, positions come from
+# the account updates and unrealized profit and exposure from the mark price.
+# An event only touches its own market: the totals are moved by that market's change, so an event costs the
+# same however many markets are traded. totals() is a few additions, snapshot() is rebuilt only after a change.
+
+QUOTE_ASSET = "USDT"
+
+Totals = namedtuple("Totals", ["realized_pnl", "unrealized_pnl", "commission", "funding", "net_pnl", "exposure",
+                               "net_exposure"])
+MarketTotals = namedtuple("MarketTotals", ["market", "amount", "entry_price", "mark_price", "realized_pnl",
+                                           "unrealized_pnl", "commission", "funding", "net_pnl", "exposure",
+                                           "net_exposure", "fills", "volume"])
+Snapshot = namedtuple("Snapshot", ["totals", "markets", "other_commissions"])
+
+
+# the books of one market
+class Book:
+    def __init__(self, market):
+        self.market = market
+        self.amount = 0.0
+        self.entry_price = 0.0
+        self.mark_price = 0.0
+        # what the account update reported, used until there is a mark price
+        self.reported_pnl = 0.0
+        self.realized_pnl = 0.0
+        self.commission = 0.0
+        self.funding = 0.0
+        self.fills = 0
+        self.volume = 0.0
+
+    @property
+    def unrealized_pnl(self):
+        if not self.mark_price:
+            return self.reported_pnl
+        return (self.mark_price - self.entry_price) * self.amount
+
+    # signed notional of the position, at the entry price until there is a mark price
+    @property
+    def net_exposure(self):
+        return self.amount * (self.mark_price or self.entry_price)
+
+    @property
+    def net_pnl(self):
+        return self.realized_pnl + self.unrealized_pnl - self.commission + self.funding
+
+    def totals(self):
+        return MarketTotals(self.market, self.amount, self.entry_price, self.mark_price, self.realized_pnl,
+                            self.unrealized_pnl, self.commission, self.funding, self.net_pnl,
+                            abs(self.net_exposure), self.net_exposure, self.fills, self.volume)
+
+
+class Accounting:
+    def __init__(self, log_trades=False):
+        self.log_trades = log_trades
+        # the account.AccountState attached to, the exits are logged with its positions' leverage
+        self.account = None
+        self.books = {}
+        self.lock = threading.Lock()
+        self.realized_pnl = 0.0
+        self.unrealized_pnl = 0.0
+        self.commission = 0.0
+        self.funding = 0.0
+        self.exposure = 0.0
+        self.net_exposure = 0.0
+        # commissions paid in other assets (BNB), not included in the USDT figures
+        self.other_commissions = {}
+        self.version = 0
+        self._totals = None
+        self._snapshot = None
+
+    def book(self, market):
+        book = self.books.get(market)
+        if book is None:
+            book = self.books[market] = Book(market)
+        return book
+
+    # apply func(book) to a market's books and move the totals by the change of its position values
+    def _reprice(self, book, func):
+        unrealized, net_exposure = book.unrealized_pnl, book.net_exposure
+        func(book)
+        self.unrealized_pnl += book.unrealized_pnl - unrealized
+        self.net_exposure += book.net_exposure - net_exposure
+        self.exposure += abs(book.net_exposure) - abs(net_exposure)
+
+    def _changed(self, book):
+        self.version += 1
+        metrics.gauge("bot_realized_pnl", book.realized_pnl, market=book.market)
+        metrics.gauge("bot_unrealized_pnl", book.unrealized_pnl, market=book.market)
+        metrics.gauge("bot_exposure", abs(book.net_exposure), market=book.market)
+
+    # start from the positions of an account.AccountState, e.g. right after its first resync
+    def load(self, account):
+        with self.lock:
+            for market, position in account.positions.items():
+                if position.amount == 0.0 and market not in self.books:
+                    continue
+                self._reprice(self.book(market), lambda book: self._set_position(
+                    book, position.amount, position.entry_price, position.unrealized_pnl))
+            self.version += 1
+
+    @staticmethod
+    def _set_position(book, amount, entry_price, reported_pnl):
+        book.amount = amount
+        book.entry_price = entry_price
+        book.reported_pnl = reported_pnl
+
+    # keep the books current from the user data stream events the account state receives
+    def attach(self, account):
+        self.account = account
+        account.on_order(self.on_order)
+        account.on_account(self.on_account_update)
+        return self
+
+    # follow the mark prices of a market_data.MarketData
+    def watch(self, market_data):
+        market_data.on_mark_price(self.mark)
+        if market_data.mark_price:
+            self.mark(market_data.market, market_data.mark_price)
+        return self
+
+    def mark(self, market, price):
+        with self.lock:
+            book = self.books.get(market)
+            if book is None or book.mark_price == price:
+                return
+            self._reprice(book, lambda book: setattr(book, "mark_price", price))
+            self._changed(book)
+
+    # an ORDER_TRADE_UPDATE ("o" object). only executions carry a fill
+    def on_order(self, order):
+        if order.get("x") != "TRADE":
+            return
+        realized, commission = float(order.get("rp", 0)), float(order.get("n", 0))
+        qty, price = float(order["l"]), float(order["L"])
+        with self.lock:
+            book = self.book(order["s"])
+            book.realized_pnl += realized
+            self.realized_pnl += realized
+            if order.get("N", QUOTE_ASSET) == QUOTE_ASSET:
+                book.commission += commission
+                self.commission += commission
+            else:
+                self.other_commissions[order["N"]] = self.other_commissions.get(order["N"], 0.0) + commission
+            book.fills += 1
+            book.volume += qty * price
+            self._changed(book)
+        metrics.count("bot_fills_total", market=order["s"], side=order["S"])
+        # entries are logged by the entry pipeline, exits are only seen here
+        if self.log_trades and (order.get("R") or order.get("cp") or realized):
+            bf.log_trade(_qty=qty, _market=order["s"], _leverage=self._leverage(order["s"]),
+                         _side=1 if order["S"] == "BUY" else -1,
+                         _cause=order.get("o", "fill"), _trigger_price=float(order.get("sp", 0)),
+                         _market_price=price, _type="exit", _pnl=realized, _fee=commission)
+
+    # the leverage of a market's position, left empty in the log when the account doesn't know it
+    def _leverage(self, market):
+        if self.account is None:
+            return ""
+        return self.account.position(market).leverage or ""
+
+    # an ACCOUNT_UPDATE ("a" object): positions, and the payment of a FUNDING_FEE update
+    def on_account_update(self, data):
+        positions = [p for p in data.get("P", []) if p.get("ps", "BOTH") == "BOTH"]
+        with self.lock:
+            for p in positions:
+                book = self.book(p["s"])
+                self._reprice(book, lambda book: self._set_position(book, float(p["pa"]), float(p["ep"]),
+                                                                    float(p.get("up", 0))))
+                self._changed(book)
+            if data.get("m") != "FUNDING_FEE":
+                return
+            paid = sum(float(b.get("bc", 0)) for b in data.get("B", []) if b["a"] == QUOTE_ASSET)
+            shares = self._fund(paid, [p["s"] for p in positions])
+        # one row per market, so the log adds up per market like the books do
+        if self.log_trades:
+            for market, share in shares:
+                bf.log_trade(_market=market, _side=0, _cause="funding", _type="funding", _pnl=share)
+
+    # a cross margin funding update doesn't say which positions it is for (isolated ones list theirs), so the
+    # payment is split over the open positions by notional. returns the (market, share) it was booked as
+    def _fund(self, paid, markets):
+        books = [self.books[market] for market in markets] or [b for b in self.books.values() if b.amount]
+        self.funding += paid
+        total = sum(abs(book.net_exposure) for book in books)
+        shares = []
+        for book in books:
+            share = paid * abs(book.net_exposure) / total if total else paid / len(books)
+            book.funding += share
+            shares.append((book.market, share))
+            self._changed(book)
+        if not books:
+            self.version += 1
+        return shares
+
+    def _current_totals(self):
+        totals = self._totals
+        if totals is None or totals[0] != self.version:
+            net = self.realized_pnl + self.unrealized_pnl - self.commission + self.funding
+            totals = self._totals = (self.version, Totals(self.realized_pnl, self.unrealized_pnl, self.commission,
+                                                          self.funding, net, self.exposure, self.net_exposure))
+        return totals[1]
+
+    # the totals over every market, recomputed only after a change
+    def totals(self):
+        with self.lock:
+            return self._current_totals()
+
+    # the totals and every market's figures, the same object until something changes
+    def snapshot(self):
+        with self.lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot[0] != self.version:
+                markets = {market: book.totals() for market, book in self.books.items()}
+                snapshot = self._snapshot = (self.version, Snapshot(self._current_totals(), markets,
+                                                                    dict(self.other_commissions)))
+            return snapshot[1]
+
+    def market(self, market):
+        with self.lock:
+            book = self.books.get(market)
+            return book.totals() if book is not None else Book(market).totals()
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import ssl
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import metrics
+import rate_limit
+from exchange import ExchangeClient, ExchangeError
+
+# REST client on asyncio with a pool of keep-alive connections, so requests skip the TCP and TLS handshakes
+# urllib pays on every call and any number of them can be in flight at once on one event loop.
+# AsyncExchangeClient has the ExchangeClient endpoint methods as coroutines, Client is a synchronous facade
+# with the binance_f RequestClient methods the bot uses, running the async client on a background loop.
+
+# methods that are safe to send again when a reused connection turns out to be closed
+IDEMPOTENT = ("GET", "PUT", "DELETE")
+
+
+class ConnectionPool:
+    def __init__(self, url, size=8, timeout=10, max_idle=30.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.https = parts.scheme == "https"
+        self.port = parts.port or (443 if self.https else 80)
+        self.ssl = ssl.create_default_context() if self.https else None
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._semaphore = None
+
+    async def _connect(self):
+        metrics.count("bot_http_connections_total", host=self.host)
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+
+    # an idle connection the server hasn't had time to drop, else a new one. returns (reader, writer, reused)
+    async def _get(self):
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if now - last_used < self.max_idle and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._connect()
+        return reader, writer, False
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip()] = value.strip()
+        lower = {name.lower(): value for name, value in headers.items()}
+        if lower.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            body = b"".join(chunks)
+        elif "content-length" in lower:
+            body = await reader.readexactly(int(lower["content-length"]))
+        else:
+            body = await reader.read()
+        keep_alive = lower.get("connection", "").lower() != "close" and (
+            "content-length" in lower or "transfer-encoding" in lower)
+        return status, headers, body, keep_alive
+
+    # send one request on a pooled connection and return (status, headers, body)
+    async def request(self, method, target, body=b"", headers=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        head = [f"{method} {target} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        payload = ("\r\n".join(head) + "\r\n\r\n").encode() + body
+        async with self._semaphore:
+            while True:
+                reader, writer, reused = await self._get()
+                try:
+                    writer.write(payload)
+                    await writer.drain()
+                    status, response_headers, response, keep_alive = await asyncio.wait_for(
+                        self._read_response(reader), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    # the server closed the idle connection before reading the request
+                    if reused and method in IDEMPOTENT and not getattr(e, "partial", b""):
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self._idle.append((reader, writer, time.monotonic()))
+                else:
+                    writer.close()
+                return status, response_headers, response
+
+    async def close(self):
+        while self._idle:
+            _, writer, _ = self._idle.pop()
+            writer.close()
+
+
+# The ExchangeClient endpoints (klines, new_order, batch_orders, ...) as coroutines: they are inherited, and with
+# request being a coroutine they return awaitables. Signing and the rate limits work as in ExchangeClient,
+# identical market data requests in flight are sent once.
+class AsyncExchangeClient(ExchangeClient):
+    def __init__(self, api_key="", secret_key="", url="https://fapi.binance.com", recv_window=5000, timeout=10,
+                 limiter=None, pool_size=8):
+        super().__init__(api_key, secret_key, url, recv_window, timeout, limiter)
+        self.pool = ConnectionPool(self.url, pool_size, timeout)
+        self._in_flight = {}
+
+    async def request_raw(self, method, path, params=None, signed=False):
+        key = None
+        if method == "GET" and not signed:
+            key = (path, tuple(sorted((params or {}).items())))
+            future = self._in_flight.get(key)
+            if future is not None:
+                return await asyncio.shield(future)
+            future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            if self.limiter is not None:
+                priority, weight, orders = rate_limit.endpoint_cost(method, path, params)
+                if not self.limiter.try_acquire(weight, orders, priority):
+                    await asyncio.to_thread(self.limiter.acquire, weight, orders, priority)
+            body = await self.send(method, path, params, signed)
+            if key is not None:
+                future.set_result(body)
+            return body
+        except Exception as e:
+            if key is not None:
+                future.set_exception(e)
+                # mark it retrieved, there may be nobody else waiting for it
+                future.exception()
+            raise
+        finally:
+            if key is not None:
+                if not future.done():
+                    future.cancel()
+                self._in_flight.pop(key, None)
+
+    async def send(self, method, path, params=None, signed=False):
+        query = self.encode(params, signed)
+        target, body = path, b""
+        if method in ("POST", "PUT"):
+            body = query.encode()
+        elif query:
+            target += "?" + query
+        headers = {"X-MBX-APIKEY": self.api_key, "Content-Type": "application/x-www-form-urlencoded"}
+        endpoint = f"{method} {path}"
+        sent = time.time()
+        with metrics.timer("bot_rest_request_seconds", client="async", endpoint=endpoint):
+            status, self.headers, response = await self.pool.request(method, target, body, headers)
+        if self.limiter is not None:
+            self.limiter.update(self.headers, sent)
+        if status < 400:
+            return response
+        if self.limiter is not None and status in (418, 429):
+            self.limiter.back_off(status, self.headers.get("Retry-After"))
+        try:
+            error = json.loads(response)
+        except ValueError:
+            error = {"code": status, "msg": response.decode(errors="replace")}
+        metrics.count("bot_rest_errors_total", client="async", endpoint=endpoint, code=error.get("code"))
+        raise ExchangeError(error.get("code"), error.get("msg"), status)
+
+    async def request(self, method, path, params=None, signed=False):
+        return json.loads(await self.request_raw(method, path, params, signed))
+
+    async def new_listen_key(self):
+        return (await self.request("POST", "/fapi/v1/listenKey"))["listenKey"]
+
+    async def close(self):
+        await self.pool.close()
+
+
+# the fields binance sends as strings that binance_f parses into floats. Everything else is left as it came, an id
+# like clientOrderId or a symbol may well be all digits
+NUMERIC_FIELDS = frozenset((
+    "markPrice", "indexPrice", "estimatedSettlePrice", "lastFundingRate", "interestRate", "price",
+    "balance", "crossWalletBalance", "crossUnPnl", "availableBalance", "maxWithdrawAmount",
+    "positionAmt", "entryPrice", "unRealizedProfit", "liquidationPrice", "leverage", "maxNotionalValue",
+    "isolatedMargin", "notional", "isolatedWallet",
+    "origQty", "executedQty", "cumQty", "cumQuote", "avgPrice", "stopPrice", "activatePrice", "priceRate",
+))
+
+
+def _number(key, value):
+    if key in NUMERIC_FIELDS and isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+# json objects as attribute objects, with the numeric fields binance sends as strings turned into floats like
+# binance_f does
+def _namespace(data):
+    return json.loads(json.dumps(data), object_hook=lambda d: SimpleNamespace(**{
+        key: _number(key, value) for key, value in d.items()}))
+
+
+# field names binance_f gives the rows of a klines response
+CANDLE_FIELDS = ("openTime", "open", "high", "low", "close", "volume", "closeTime", "quoteAssetVolume", "numTrades",
+                 "takerBuyBaseAssetVolume", "takerBuyQuoteAssetVolume", "ignore")
+
+
+# Synchronous stand-in for binance_f.RequestClient, for the methods the bot calls. Responses come back as
+# objects with the json field names, which are the attribute names binance_f uses. Any other ExchangeClient
+# method (new_order, batch_orders, balance, ...) works as it does there, so one Client can replace both clients.
+# Calls from any thread run on one event loop, so calls made from several threads overlap on the pool.
+class Client:
+    def __init__(self, api_key="", secret_key="", url="https://fapi.binance.com", limiter=None, pool_size=8,
+                 timeout=10):
+        self.exchange = AsyncExchangeClient(api_key, secret_key, url, limiter=limiter, pool_size=pool_size,
+                                            timeout=timeout)
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="async-client", daemon=True).start()
+
+    # run a coroutine on the client's loop and wait for its result
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # run several coroutines concurrently, e.g. client.gather(client.exchange.klines_raw(...), ...)
+    def gather(self, *coroutines):
+        async def gather():
+            return await asyncio.gather(*coroutines)
+        return self.run(gather())
+
+    def close(self):
+        self.run(self.exchange.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    @property
+    def headers(self):
+        return self.exchange.headers
+
+    # the ExchangeClient methods, run synchronously
+    def __getattr__(self, name):
+        attribute = getattr(self.exchange, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            return self.run(result) if asyncio.iscoroutine(result) else result
+        return call
+
+    # the raw payload, so market_data.fetch_candles can parse it without building candle objects
+    def klines_raw(self, symbol, interval="1m", limit=1000, start_time=None, end_time=None):
+        return self.run(self.exchange.klines_raw(symbol, interval, limit, start_time, end_time))
+
+    def get_candlestick_data(self, symbol, interval="1m", startTime=None, endTime=None, limit=None):
+        rows = self.run(self.exchange.klines(symbol, interval, limit, startTime, endTime))
+        return [SimpleNamespace(**dict(zip(CANDLE_FIELDS, row))) for row in rows]
+
+    def get_mark_price(self, symbol):
+        return _namespace(self.run(self.exchange.mark_price(symbol)))
+
+    def get_symbol_price_ticker(self, symbol=None):
+        result = self.run(self.exchange.ticker_price(symbol))
+        return _namespace(result if isinstance(result, list) else [result])
+
+    def get_exchange_information(self):
+        return _namespace(self.run(self.exchange.exchange_info()))
+
+    def get_balance(self):
+        return _namespace(self.run(self.exchange.balance()))
+
+    def get_position_v2(self):
+        return _namespace(self.run(self.exchange.position_risk()))
+
+    def get_open_orders(self, symbol=None):
+        return _namespace(self.run(self.exchange.open_orders(symbol)))
+
+    def change_initial_leverage(self, symbol, leverage):
+        return _namespace(self.run(self.exchange.change_leverage(symbol, leverage)))
+
+    def change_margin_type(self, symbol, marginType):
+        return _namespace(self.run(self.exchange.change_margin_type(symbol, marginType)))
+
+    # binance_f calls the order type "ordertype"
+    def post_order(self, symbol, side, ordertype, **params):
+        return _namespace(self.run(self.exchange.new_order(symbol=symbol, side=side, type=ordertype, **params)))
+
+    def cancel_all_orders(self, symbol):
+        return _namespace(self.run(self.exchange.cancel_all_orders(symbol)))
@@ -0,0 +1,274 @@
+import argparse
+import glob
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import talib
+
+import config as cfg
+import rules
+from candle_store import CandleFile
+from market_data import OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME, COLUMNS
+
+# Offline replay of the scalp()/trade() entry logic and the EntryPipeline exits over historical klines.
+# Indicators are computed once over the whole history as arrays, entries become one signal array, and only
+# the bars spent in a trade are stepped through one by one to simulate the stop loss and trailing take profit.
+
+# calculate_position_size only puts 40% of the balance to work
+POSITION_FRACTION = 0.40
+# binance futures taker fee
+TAKER_FEE = 0.0004
+
+# kline csv layout of data.binance.vision and of the REST klines endpoint
+KLINE_CSV_COLUMNS = ["open_time", "open", "high", "low", "close", "volume", "close_time", "quote_volume",
+                     "trades", "taker_buy_volume", "taker_buy_quote_volume", "ignore"]
+
+
+# load kline csv files (with or without header), .npy arrays and candle_store .candles files into one array
+# in the market_data column layout, sorted by open time with duplicate candles removed
+def load_klines(paths):
+    frames = []
+    for path in paths:
+        if path.endswith(".npy"):
+            frames.append(np.load(path))
+            continue
+        if path.endswith(".candles"):
+            frames.append(CandleFile.open(path).candles())
+            continue
+        with open(path) as f:
+            has_header = not f.readline()[:1].isdigit()
+        df = pd.read_csv(path, header=0 if has_header else None, names=KLINE_CSV_COLUMNS)
+        frames.append(df[list(COLUMNS)].to_numpy(dtype=np.float64).T)
+    data = np.concatenate(frames, axis=1)
+    _, index = np.unique(data[OPEN_TIME], return_index=True)
+    return np.ascontiguousarray(data[:, index])
+
+
+# every indicator scalp() hands trade(), by the same names, as arrays over the whole history, so a rule
+# backtests on any of them. MACDEXT runs with the TA-Lib defaults (12/26/9 SMAs) like it does in scalp.
+# cache is an optional dict that keeps each array between calls, so sweeps only compute the ones they change
+def scalp_indicators(data, ma_period=50, ma_close_period=20, macd_fast=12, macd_slow=26, macd_signal=9, cache=None):
+    cache = {} if cache is None else cache
+    high, low, close = data[HIGH], data[LOW], data[CLOSE]
+
+    def cached(key, compute):
+        if key not in cache:
+            cache[key] = compute()
+        return cache[key]
+
+    def sma(column, period):
+        return cached(('sma', column, period), lambda: talib.SMA(data[column], timeperiod=period))
+
+    def ema(column, period):
+        return cached(('ema', column, period), lambda: talib.EMA(data[column], timeperiod=period))
+
+    def macd_arrays():
+        macd, macdsignal, macdhist = talib.MACDEXT(close, fastperiod=macd_fast, slowperiod=macd_slow,
+                                                   signalperiod=macd_signal)
+        macdhist_last = np.empty_like(macdhist)
+        macdhist_last[0] = np.nan
+        macdhist_last[1:] = macdhist[:-1]
+        return macd, macdsignal, macdhist, macdhist_last
+
+    macd, macdsignal, macdhist, macdhist_last = cached(('macd', macd_fast, macd_slow, macd_signal), macd_arrays)
+    fastk, fastd = cached('stochf', lambda: talib.STOCHF(high, low, close, fastk_period=5, fastd_period=3,
+                                                         fastd_matype=0))
+    return {
+        'ma_fiftyhigh': sma(HIGH, ma_period),
+        'ma_fiftylow': sma(LOW, ma_period),
+        'ma_nineclose': sma(CLOSE, ma_close_period),
+        'ema_uptrendhigher': ema(CLOSE, 200),
+        'ema_uptrendlower': ema(HIGH, 50),
+        'ema_suptrendhigher': ema(LOW, 9),
+        'ema_suptrendlower': ema(HIGH, 3),
+        'ema_downtrendhigher': ema(HIGH, 200),
+        'ema_downtrendlower': ema(LOW, 50),
+        'ema_sdowntrendhigher': ema(HIGH, 9),
+        'ema_sdowntrendlower': ema(LOW, 3),
+        'ema_high': ema(HIGH, 5),
+        'ema_close': ema(CLOSE, 5),
+        'ema_low': ema(LOW, 5),
+        'fastd': fastd,
+        'fastk': fastk,
+        'adx': cached('adx', lambda: talib.ADX(high, low, close, timeperiod=14)),
+        'cci': cached('cci', lambda: talib.CCI(high, low, close, timeperiod=20)),
+        'rsi': cached('rsi', lambda: talib.RSI(close, timeperiod=14)),
+        'mfi': cached('mfi', lambda: talib.MFI(high, low, close, data[VOLUME], timeperiod=14)),
+        'MACD': macd,
+        'macdsignal': macdsignal,
+        'macdhist_current': macdhist,
+        'macdhist_last': macdhist_last,
+        'open': data[OPEN],
+        'current_price': close,
+    }
+
+
+# trade() over arrays: 1 long, -1 short, 0 nothing, from the same rules (rules.Strategy) the bot trades on
+def scalp_signals(ind, strategy=None):
+    return (strategy or rules.DEFAULT).signals(ind)
+
+
+# get_protective_prices' price rounding: down to the price precision below 1, else half up to a whole number
+def round_price(value, price_precision):
+    if value < 1:
+        factor = 10 ** price_precision
+        return math.floor(value * factor) / factor
+    return float(int(value + 0.5))
+
+
+# stop loss and take profit activation prices exactly as the entry pipeline places them
+def protective_prices(entry_price, side, take_profit, stop_loss, price_precision=2):
+    if side == -1:
+        stop_loss = -stop_loss
+        take_profit = -take_profit
+    stop_price = round_price(entry_price * ((100 - stop_loss) / 100), price_precision)
+    activation_price = round_price(entry_price * ((100 + take_profit) / 100), price_precision)
+    return stop_price, activation_price
+
+
+# Step through the bars of one trade until the STOP_MARKET or TRAILING_STOP_MARKET order fills.
+# Bars are only known as OHLC, so within a bar the worst case is assumed: exits are checked against the
+# adverse extreme before the favourable extreme moves the trailing stop, and a trailing stop activated
+# in a bar can only trigger from the next bar on.
+def simulate_exit(high, low, close, start, side, stop_price, activation_price, callback_rate):
+    callback = callback_rate / 100
+    active = False
+    extreme = 0.0
+    for i in range(start, len(close)):
+        if side == 1:
+            if active and low[i] <= extreme * (1 - callback):
+                return i, extreme * (1 - callback), "Trailing Stop"
+            if low[i] <= stop_price:
+                return i, stop_price, "Stop Loss"
+            if not active and high[i] >= activation_price:
+                active = True
+            if active:
+                extreme = max(extreme, high[i])
+        else:
+            if active and high[i] >= extreme * (1 + callback):
+                return i, extreme * (1 + callback), "Trailing Stop"
+            if high[i] >= stop_price:
+                return i, stop_price, "Stop Loss"
+            if not active and low[i] <= activation_price:
+                active = True
+                extreme = low[i]
+            if active:
+                extreme = min(extreme, low[i])
+    return len(close) - 1, close[-1], "End Of Data"
+
+
+# Replay the signals. A trade is entered at the close of the signal bar, like the live bot acting on the
+# newest candle, and while in a trade no new signals are taken. Returns the trade list and the equity
+# curve (balance marked to the close of every bar)
+def simulate(data, signals, leverage=3, take_profit=1.6, stop_loss=1.3, callback_rate=0.4, fee_rate=TAKER_FEE,
+             balance=1000.0, price_precision=2):
+    open_time, high, low, close = data[OPEN_TIME], data[HIGH].tolist(), data[LOW].tolist(), data[CLOSE]
+    closes = close.tolist()
+    entries = np.flatnonzero(signals)
+    trades = []
+    equity = np.empty(len(closes))
+    booked = 0
+    i = 0
+    while True:
+        # jump straight to the next signal instead of walking the bars in between
+        k = np.searchsorted(entries, i)
+        if k == len(entries) or balance <= 0:
+            break
+        i = int(entries[k])
+        side = int(signals[i])
+        entry_price = closes[i]
+        qty = balance / entry_price * leverage * POSITION_FRACTION
+        stop_price, activation_price = protective_prices(entry_price, side, take_profit, stop_loss, price_precision)
+        exit_index, exit_price, cause = simulate_exit(high, low, closes, i + 1, side, stop_price,
+                                                      activation_price, callback_rate)
+        fees = (entry_price + exit_price) * qty * fee_rate
+        pnl = (exit_price - entry_price) * qty * side - fees
+
+        equity[booked:i + 1] = balance
+        equity[i + 1:exit_index] = balance + (close[i + 1:exit_index] - entry_price) * qty * side
+        balance += pnl
+        equity[exit_index] = balance
+        booked = exit_index + 1
+
+        trades.append({
+            'entry_time': int(open_time[i]),
+            'exit_time': int(open_time[exit_index]),
+            'side': side,
+            'qty': qty,
+            'entry_price': entry_price,
+            'exit_price': exit_price,
+            'cause': cause,
+            'fees': fees,
+            'pnl': pnl,
+            'balance': balance,
+        })
+        i = exit_index + 1
+    equity[booked:] = balance
+    return trades, equity
+
+
+def max_drawdown(equity):
+    if len(equity) == 0:
+        return 0.0
+    peak = np.maximum.accumulate(equity)
+    return float(np.max((peak - equity) / peak))
+
+
+def summarise(trades, equity, start_balance):
+    pnl = np.array([trade['pnl'] for trade in trades])
+    return {
+        'trades': len(trades),
+        'wins': int(np.sum(pnl > 0)),
+        'win_rate': float(np.mean(pnl > 0)) if len(pnl) else 0.0,
+        'pnl': float(np.sum(pnl)),
+        'fees': float(sum(trade['fees'] for trade in trades)),
+        'return': float(equity[-1] / start_balance - 1) if len(equity) else 0.0,
+        'max_drawdown': max_drawdown(equity),
+    }
+
+
+def run_backtest(data, leverage=3, take_profit=1.6, stop_loss=1.3, callback_rate=0.4, fee_rate=TAKER_FEE,
+                 balance=1000.0, price_precision=2, strategy=None, **indicator_periods):
+    signals = scalp_signals(scalp_indicators(data, **indicator_periods), strategy)
+    trades, equity = simulate(data, signals, leverage=leverage, take_profit=take_profit, stop_loss=stop_loss,
+                              callback_rate=callback_rate, fee_rate=fee_rate, balance=balance,
+                              price_precision=price_precision)
+    return trades, equity, summarise(trades, equity, balance)
+
+
+def main():
+    settings = cfg.getBotSettings()
+    parser = argparse.ArgumentParser(description="Replay the scalp strategy over historical klines")
+    parser.add_argument("files", nargs="+", help="kline csv/npy/.candles files, globs are expanded")
+    parser.add_argument("--leverage", type=int, default=int(settings.leverage))
+    parser.add_argument("--take-profit", type=float, default=float(settings.take_profit))
+    parser.add_argument("--stop-loss", type=float, default=float(settings.stop_loss))
+    parser.add_argument("--callback-rate", type=float, default=float(settings.trailing_percentage))
+    parser.add_argument("--fee", type=float, default=TAKER_FEE)
+    parser.add_argument("--balance", type=float, default=1000.0)
+    parser.add_argument("--price-precision", type=int, default=2)
+    parser.add_argument("--trades", help="write the trade list to this csv file")
+    args = parser.parse_args()
+
+    paths = sorted(path for pattern in args.files for path in glob.glob(pattern))
+    started = time.perf_counter()
+    data = load_klines(paths)
+    loaded = time.perf_counter()
+    trades, equity, summary = run_backtest(data, leverage=args.leverage, take_profit=args.take_profit,
+                                           stop_loss=args.stop_loss, callback_rate=args.callback_rate,
+                                           fee_rate=args.fee, balance=args.balance,
+                                           price_precision=args.price_precision,
+                                           strategy=rules.load_strategy(settings))
+    finished = time.perf_counter()
+
+    print(f"{data.shape[1]} candles loaded in {loaded - started:.2f}s, replayed in {finished - loaded:.2f}s")
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    if args.trades:
+        pd.DataFrame(trades).to_csv(args.trades, index=False)
+
+
+if __name__ == "__main__":
+    main()
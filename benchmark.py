@@ -0,0 +1,302 @@
+import argparse
+import gc
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import talib.abstract as ta
+
+import bot_functions as bf
+import metrics
+import vectorized
+from indicators import ScalpIndicators, TalonSniper
+from market_data import (CandleBuffer, COLUMNS, candles_to_array, parse_klines, OPEN_TIME, OPEN, HIGH, LOW, CLOSE,
+                         VOLUME, TRADES)
+from mock_exchange import synthetic_klines
+
+# Timings of every stage of the signal path on fixed candle fixtures, from the REST candle objects to the
+# entry decision. Each stage is timed on its own with its inputs prepared beforehand, then run once more
+# under tracemalloc for its peak memory. Results can be stored as a baseline, later runs fail (exit code 1)
+# when a stage gets slower or uses more memory than the baseline allows.
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+BASELINE_PATH = "benchmark_baseline.json"
+
+
+# candles shaped like the binance_f objects get_candlestick_data returns, with the values still strings
+def fixture_candles(data):
+    return [SimpleNamespace(openTime=int(row[OPEN_TIME]), open=f"{row[OPEN]:.2f}", high=f"{row[HIGH]:.2f}",
+                            low=f"{row[LOW]:.2f}", close=f"{row[CLOSE]:.2f}", volume=f"{row[VOLUME]:.3f}",
+                            closeTime=int(row[OPEN_TIME]) + 59999, numTrades=int(row[TRADES]))
+            for row in data.T]
+
+
+# the raw /fapi/v1/klines response body for the same candles
+def fixture_payload(data):
+    return json.dumps([[int(row[OPEN_TIME]), f"{row[OPEN]:.2f}", f"{row[HIGH]:.2f}", f"{row[LOW]:.2f}",
+                        f"{row[CLOSE]:.2f}", f"{row[VOLUME]:.3f}", int(row[OPEN_TIME]) + 59999, "0",
+                        int(row[TRADES]), "0", "0", "0"] for row in data.T], separators=(",", ":")).encode()
+
+
+# the newest `size` candles of the kline files, or a seeded random walk when no files are given
+def load_fixture(paths, size, seed=0):
+    if not paths:
+        return synthetic_klines(size, seed=seed)
+    from backtest import load_klines
+    data = load_klines(paths)
+    if data.shape[1] < size:
+        raise ValueError(f"the fixture files hold {data.shape[1]} candles, {size} were asked for")
+    return data[:, -size:]
+
+
+# stands in for the binance_f client, answering get_signal's requests from the fixture
+class StubClient:
+    def __init__(self, candles, mark_price):
+        self.candles = candles
+        self.mark_price = mark_price
+
+    # like the klines endpoint: the newest `limit` candles (500 by default) up to endTime, or the first `limit`
+    # from startTime on
+    def get_candlestick_data(self, symbol, interval="1m", startTime=None, endTime=None, limit=None):
+        limit = limit or 500
+        candles = self.candles
+        if startTime is not None or endTime is not None:
+            candles = [candle for candle in candles if (startTime is None or candle.openTime >= startTime)
+                       and (endTime is None or candle.openTime <= endTime)]
+        return candles[:limit] if startTime is not None else candles[-limit:]
+
+    def get_mark_price(self, symbol):
+        return SimpleNamespace(markPrice=self.mark_price)
+
+
+# everything the stages take as input, computed once per fixture size
+def prepare(data, sink):
+    context = SimpleNamespace(sink=sink)
+    context.candles = fixture_candles(data)
+    context.payload = fixture_payload(data)
+    context.parsed = np.empty((len(COLUMNS), data.shape[1]))
+    context.ohlcv = bf.convert_candles(context.candles)
+    context.dataframe = bf.to_dataframe(*context.ohlcv)
+    context.heikin_ashi = bf.construct_heikin_ashi(*context.ohlcv[:4])
+    context.arrays = [np.asarray(values) for values in context.ohlcv]
+    context.heikin_ashi_arrays = vectorized.construct_heikin_ashi(*context.arrays[:4])
+    context.client = StubClient(context.candles, float(context.ohlcv[3][-1]))
+    context.buffer = CandleBuffer(size=len(context.candles))
+    context.indicators = ScalpIndicators().attach(context.buffer)
+    context.buffer.seed(context.candles)
+    context.talon_sniper = TalonSniper()
+    for candle in zip(*context.ohlcv[:4]):
+        context.talon_sniper.update(*candle)
+    return context
+
+
+# the indicator calls scalp() makes, one stage each
+SCALP_INDICATORS = {
+    "ma_fiftyhigh": lambda df: ta.MA(df, timeperiod=50, price='high'),
+    "ma_fiftylow": lambda df: ta.MA(df, timeperiod=50, price='low'),
+    "ma_nineclose": lambda df: ta.MA(df, timeperiod=20, price='close'),
+    "ema_uptrendhigher": lambda df: ta.EMA(df, timeperiod=200, price='close'),
+    "ema_uptrendlower": lambda df: ta.EMA(df, timeperiod=50, price='high'),
+    "ema_suptrendhigher": lambda df: ta.EMA(df, timeperiod=9, price='low'),
+    "ema_suptrendlower": lambda df: ta.EMA(df, timeperiod=3, price='high'),
+    "ema_downtrendhigher": lambda df: ta.EMA(df, timeperiod=200, price='high'),
+    "ema_downtrendlower": lambda df: ta.EMA(df, timeperiod=50, price='low'),
+    "ema_sdowntrendhigher": lambda df: ta.EMA(df, timeperiod=9, price='high'),
+    "ema_sdowntrendlower": lambda df: ta.EMA(df, timeperiod=3, price='low'),
+    "ema_high": lambda df: ta.EMA(df, timeperiod=5, price='high'),
+    "ema_close": lambda df: ta.EMA(df, timeperiod=5, price='close'),
+    "ema_low": lambda df: ta.EMA(df, timeperiod=5, price='low'),
+    "stochf": lambda df: ta.STOCHF(df['high'], df['low'], df['close'], fastk_period=5, fastd_period=3,
+                                   fastd_matype=0),
+    "adx": lambda df: ta.ADX(df),
+    "cci": lambda df: ta.CCI(df, timeperiod=20),
+    "rsi": lambda df: ta.RSI(df, timeperiod=14),
+    "mfi": lambda df: ta.MFI(df),
+    "macdext": lambda df: ta.MACDEXT(df, fast_matype=5, slow_period=7, signal_period=9, price='close'),
+}
+
+
+def _get_signal(context):
+    return bf.get_signal(context.client, "ETHUSDT", "1m", std=context.sink)
+
+
+def _scalp_incremental(context):
+    return bf.scalp_incremental(context.indicators, context.buffer, context.client.mark_price, context.sink)
+
+
+# the whole fixture through a fresh TalonSniper, one candle at a time
+def _talon_sniper(context):
+    signal = TalonSniper()
+    for candle in zip(*context.ohlcv[:4]):
+        signal.update(*candle)
+    return signal.value
+
+
+# the entries of a streamed TalonSniper that differ from trading_signal and its vectorized version, as
+# (use_last, candle index, streamed, batch). an empty list means they match
+def check_talon_sniper(data):
+    ohlc = [data[column].tolist() for column in (OPEN, HIGH, LOW, CLOSE)]
+    heikin_ashi = bf.construct_heikin_ashi(*ohlc)
+    heikin_ashi_arrays = vectorized.construct_heikin_ashi(*ohlc)
+    mismatches = []
+    for use_last in (False, True):
+        signal = TalonSniper(use_last=use_last)
+        streamed = [signal.update(*candle) for candle in zip(*ohlc)][1:]
+        for batch in (bf.trading_signal(*heikin_ashi, use_last=use_last),
+                      vectorized.trading_signal(*heikin_ashi_arrays, use_last=use_last).tolist()):
+            mismatches.extend((use_last, i + 1, value, expected)
+                              for i, (value, expected) in enumerate(zip(streamed, batch)) if value != expected)
+    return mismatches
+
+
+# stage name -> (function of the prepared context, smallest size it can run on)
+STAGES = {
+    "convert_candles": (lambda ctx: bf.convert_candles(ctx.candles), 1),
+    "to_dataframe": (lambda ctx: bf.to_dataframe(*ctx.ohlcv), 1),
+    "get_dataframe": (lambda ctx: bf.get_dataframe(ctx.candles), 1),
+    "parse_klines": (lambda ctx: parse_klines(ctx.payload, ctx.parsed), 1),
+    "candles_to_array": (lambda ctx: candles_to_array(ctx.candles), 1),
+    "construct_heikin_ashi": (lambda ctx: bf.construct_heikin_ashi(*ctx.ohlcv[:4]), 1),
+    "avarage_true_range": (lambda ctx: bf.avarage_true_range(*ctx.heikin_ashi[1:]), 2),
+    "trading_signal": (lambda ctx: bf.trading_signal(*ctx.heikin_ashi), 3),
+    **{f"scalp.{name}": (lambda ctx, func=func: func(ctx.dataframe), 1)
+       for name, func in SCALP_INDICATORS.items()},
+    # scalp reads row 999 of every indicator, so the full path needs at least 1000 candles
+    "get_signal": (_get_signal, 1000),
+    "vectorized.construct_heikin_ashi": (lambda ctx: vectorized.construct_heikin_ashi(*ctx.arrays[:4]), 1),
+    "vectorized.avarage_true_range": (lambda ctx: vectorized.avarage_true_range(*ctx.heikin_ashi_arrays[1:]), 2),
+    "vectorized.trading_signal": (lambda ctx: vectorized.trading_signal(*ctx.heikin_ashi_arrays), 3),
+    "scalp_incremental": (_scalp_incremental, 1000),
+    "talon_sniper": (_talon_sniper, 1),
+    # one closed candle on a signal that has seen the whole fixture
+    "talon_sniper.update": (lambda ctx: ctx.talon_sniper.update(*(values[-1] for values in ctx.ohlcv[:4])), 2),
+}
+
+
+# best and median wall time over at least min_repeats runs, repeating until min_time seconds were spent
+def time_stage(func, context, min_repeats=3, min_time=0.2, max_repeats=1000):
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(times) < min_repeats or (sum(times) < min_time and len(times) < max_repeats):
+            started = time.perf_counter()
+            func(context)
+            times.append(time.perf_counter() - started)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return min(times), statistics.median(times)
+
+
+def peak_memory(func, context):
+    tracemalloc.start()
+    try:
+        func(context)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, stages, paths=None, seed=0, min_repeats=3, min_time=0.2):
+    results = {}
+    # the decisions trade() reports go nowhere
+    sink = open(os.devnull, "w")
+    metrics.setup_logging(sink)
+    for size in sizes:
+        context = prepare(load_fixture(paths, size, seed), sink)
+        for name in stages:
+            func, min_size = STAGES[name]
+            if size < min_size:
+                continue
+            best, median = time_stage(func, context, min_repeats, min_time)
+            peak = peak_memory(func, context)
+            results.setdefault(name, {})[str(size)] = {"seconds": best, "median": median, "peak_bytes": peak}
+            print(f"{name:<36} {size:>8} {best * 1000:>12.3f}ms {median * 1000:>12.3f}ms "
+                  f"{peak / 1024:>12.1f}KiB", flush=True)
+    return results
+
+
+# stages that got slower or use more memory than the baseline plus the tolerance
+def regressions(results, baseline, tolerance=0.3, memory_tolerance=0.1):
+    found = []
+    for name, sizes in results.items():
+        for size, result in sizes.items():
+            reference = baseline.get(name, {}).get(size)
+            if reference is None:
+                continue
+            if result["seconds"] > reference["seconds"] * (1 + tolerance):
+                found.append(f"{name} @ {size}: {result['seconds'] * 1000:.3f}ms, "
+                             f"baseline {reference['seconds'] * 1000:.3f}ms")
+            if result["peak_bytes"] > reference["peak_bytes"] * (1 + memory_tolerance) + 4096:
+                found.append(f"{name} @ {size}: peak {result['peak_bytes'] / 1024:.1f}KiB, "
+                             f"baseline {reference['peak_bytes'] / 1024:.1f}KiB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the signal pipeline")
+    parser.add_argument("files", nargs="*", help="kline csv/npy/.candles fixture files, a seeded random walk if none")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma separated candle counts")
+    parser.add_argument("--stages", help="comma separated stage names, all of them by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-repeats", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to keep repeating each stage")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown, 0.3 is 30%%")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1, help="allowed peak memory increase")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--check", action="store_true",
+                        help="check the streamed TalonSniper entries against trading_signal instead of timing")
+    args = parser.parse_args()
+
+    paths = sorted(path for pattern in args.files for path in glob.glob(pattern))
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if args.check:
+        failed = False
+        for size in sizes:
+            mismatches = check_talon_sniper(load_fixture(paths, size, args.seed))
+            for use_last, index, value, expected in mismatches[:10]:
+                print(f"MISMATCH {size} candles, use_last={use_last}, candle {index}: {value}, expected {expected}")
+            print(f"talon_sniper {size:>8} candles: {'match' if not mismatches else f'{len(mismatches)} mismatches'}")
+            failed = failed or bool(mismatches)
+        sys.exit(1 if failed else 0)
+    stages = args.stages.split(",") if args.stages else list(STAGES)
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages {', '.join(unknown)}, choose from {', '.join(STAGES)}")
+
+    print(f"{'stage':<36} {'candles':>8} {'best':>14} {'median':>14} {'peak':>15}")
+    results = run(sizes, stages, paths, args.seed, args.min_repeats, args.min_time)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    found = regressions(results, baseline, args.tolerance, args.memory_tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    if found:
+        sys.exit(1)
+    print("no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
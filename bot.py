@@ -1,14 +1,24 @@
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
 import bot_functions as bf
 import config as cfg
 import logging
+import metrics
+from market_data import MarketData
+from indicators import ScalpIndicators
+from symbols import SymbolRegistry
+from orders import EntryPipeline, EntryError
+from account import AccountState, UserDataStream
+from scheduler import Scheduler
+from bot_state import BotState, STATE_PATH, RESUMED, UNPROTECTED, CLOSED
+from accounting import Accounting
 
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
 
 # Connect to the binance api and produce a client
 client = bf.init_client()
+exchange = bf.init_exchange()
+store = bf.init_candle_store()
 
 # Load settings from settings.json
 settings = cfg.getBotSettings()
@@ -22,61 +32,142 @@ trailing_percentage = float(settings.trailing_percentage)
 #trailing_percentage = settings.trailing_percentage
 
 
-# turn off print unless we really need to print something
+# turn off print unless we really need to print something, our own output goes through the queue logger
 std = bf.getStdOut()
+metrics.setup_logging(std)
 bf.blockPrint()
 bf.singlePrint("Bot Started", std)
 
+# export the timings and counters if settings.json asks for it
+metrics.export(getattr(settings, "metrics_port", None), getattr(settings, "metrics_file", None))
+
 # global values used by bot to keep track of state
 entry_price = 0
 exit_price_trigger = 0
 liquidation_price = 0
 in_position = False
 side = 0
+qty = 0
+
+# The position, its protective orders and the last evaluated candles, saved on every change
+state = BotState(getattr(settings, "state_file", STATE_PATH))
+
+# Load the exchange information once so entering a trade needs no metadata requests
+registry = SymbolRegistry(client)
+
+# Positions, balances and orders are kept in memory from the user data stream
+account = AccountState()
+# Profit, fees, funding and exposure, booked from the same events. Exits and funding go to the trade log
+accounting = Accounting(log_trades=True).attach(account)
+user_stream = UserDataStream(exchange, account, url=getattr(settings, "ws_url", "wss://fstream.binance.com"))
+
+# Seed the candle buffers once and keep them and the scalp indicators current from the websocket streams
+market_data = MarketData(client, market=market, intervals=confirmation_periods + ["1m"],
+                         url=getattr(settings, "ws_url", "wss://fstream.binance.com"), exchange=exchange,
+                         store=store, resample=getattr(settings, "resample_candles", False))
+market_data.track_indicators(ScalpIndicators, confirmation_periods)
+accounting.watch(market_data)
+
+# None of these depend on each other, so start-up takes as long as the slowest of them. The account is loaded
+# when user_stream.start returns, it raises (and the bot stops here) if the account can't be read
+with ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup") as startup:
+    for future in [startup.submit(registry.load), startup.submit(user_stream.start), startup.submit(market_data.start)]:
+        future.result()
+accounting.load(account)
+
+# Initialise the market leverage and margin type, unless the account already has them
+if account.position(market).leverage != leverage or account.position(market).margin_type != "cross":
+    bf.initialise_futures(client, _market=market, _leverage=leverage)
 
-# Initialise the market leverage and margin type.
-bf.initialise_futures(client, _market=market, _leverage=leverage)
-time.sleep(3)
-iteration = 1
-while True:
+# Everything needed to enter is prepared ahead, a signal only has to place the orders
+pipeline = EntryPipeline(exchange, registry, std, market=market, leverage=leverage, take_profit=take_profit,
+                         stop_loss=stop_loss, callback_rate=trailing_percentage, account=account).prepare()
+
+# Carry on from the last run: an open position is watched again (and protected if its stop loss is missing),
+# the orders of a position that closed while the bot was down are cancelled
+status = state.reconcile(market, account)
+if status in (RESUMED, UNPROTECTED):
+    position = account.position(market)
+    side, qty, entry_price, in_position = state.market(market)["side"], abs(position.amount), position.entry_price, True
+    bf.singlePrint(f"Resuming {market} position: {position.amount} ${entry_price}", std)
+    if status == UNPROTECTED:
+        bf.singlePrint("The position has no stop loss, placing the protective orders", std)
+        client.cancel_all_orders(market)
+        state.entered(market, side, qty, entry_price, pipeline.protect_position(position.amount, entry_price))
+elif status == CLOSED and account.open_orders(market):
+    bf.singlePrint(f"The {market} position closed while the bot was stopped, cancelling its orders", std)
+    client.cancel_all_orders(market)
+
+
+# open time of the candle in progress of every trading period
+def current_candles():
+    return {period: market_data.buffer(period).last_open_time() for period in confirmation_periods}
+
+
+# look for an entry each time a candle of a trading period closes
+def on_candle_close():
+    global qty, side, in_position
+    if in_position:
+        return
     try:
-        bf.singlePrint(f"ITERATION {iteration}:\n", std)
-        # if not currently in a position then execute this set of logic
-        if not in_position:
-            # generate signal data for the last 1000 candles
-            entry = bf.get_multi_scale_signal(client, _market=market, _periods=confirmation_periods, std=std)
-            # entry = 1
-
-            # if the entry is -1, then open a SHORT
-            if entry == -1:
-                qty, side, in_position = bf.handle_signal(client, std,
-                                                          market=market, leverage=leverage,
-                                                          order_side="SELL", stop_side="BUY",
-                                                          take_profit=take_profit, stop_loss=stop_loss, _callbackRate=trailing_percentage)
-
-            # if the entry is 1, then open a LONG
-            elif entry == 1:
-                qty, side, in_position = bf.handle_signal(client, std,
-                                                          market=market, leverage=leverage,
-                                                          order_side="BUY", stop_side="SELL",
-                                                          take_profit=take_profit, stop_loss=stop_loss, _callbackRate=trailing_percentage)
-            else:
-                bf.singlePrint("Conditions not matched, no trade will be taken\n", std)
-
-        # If already in a position then check market and wait for the trade to complete
-        elif in_position:
-            position_active = bf.check_in_position(client, market)
-            if not position_active:
-                client.cancel_all_orders(market)
-                bf.singlePrint("There is no open trade currently, checking to enter a new trade.\n", std)
-                in_position = False
-            else:
-                bf.singlePrint(f"There is an open trade in progress for {market}. No new trade will be attempted.\n", std)
-        bf.singlePrint("*" * 100, std)
-        bf.singlePrint("", std)
-        iteration += 1
-        time.sleep(10)
+        registry.refresh_if_stale()
+        state.evaluated(market, current_candles())
+
+        # generate signal data for the last 1000 candles
+        entry = bf.get_multi_scale_signal(client, _market=market, _periods=confirmation_periods, std=std,
+                                           market_data=market_data)
+        # entry = 1
+
+        # if the entry is -1, then open a SHORT
+        if entry == -1:
+            qty, side, in_position = pipeline.enter("SELL", market_data.mark_price)
+            state.entered(market, side, qty, pipeline.entry_price, pipeline.order_ids)
+
+        # if the entry is 1, then open a LONG
+        elif entry == 1:
+            qty, side, in_position = pipeline.enter("BUY", market_data.mark_price)
+            state.entered(market, side, qty, pipeline.entry_price, pipeline.order_ids)
+        else:
+            bf.singlePrint("Conditions not matched, no trade will be taken\n", std)
+    except EntryError as e:
+        # the order filled, the position is watched like any other (check_position drops it if it is gone)
+        logger.error(str(e), exc_info=True)
+        bf.singlePrint(f"Encountered Exception {e}", std)
+        qty, side, in_position = e.qty, e.side, True
+        state.entered(market, side, qty, e.entry_price, e.order_ids)
+    except Exception as e:
+        logger.error(str(e), exc_info=True)
+        bf.singlePrint(f"Encountered Exception {e}", std)
+    bf.singlePrint("*" * 100, std)
+
+
+# when an order fills or the position changes, see whether the trade has completed
+def check_position():
+    global in_position
+    if not in_position or account.in_position(market):
+        return
+    try:
+        client.cancel_all_orders(market)
+        bf.singlePrint("There is no open trade currently, checking to enter a new trade.\n", std)
+        in_position = False
+        state.exited(market)
+        totals = accounting.totals()
+        bf.singlePrint(f"Session PnL {totals.net_pnl:.4f} USDT: realized {totals.realized_pnl:.4f}, "
+                       f"fees {totals.commission:.4f}, funding {totals.funding:.4f}", std)
+        pipeline.prepare()
     except Exception as e:
         logger.error(str(e), exc_info=True)
         bf.singlePrint(f"Encountered Exception {e}", std)
-        time.sleep(15)
+
+
+# Nothing runs between events: entries are evaluated on candle closes and the trade is checked on fills,
+# with a check every resync_interval seconds in case the user data stream resynced without reporting one
+resync_interval = float(getattr(settings, "resync_interval", 60))
+scheduler = Scheduler()
+scheduler.on_candle_close(market_data, confirmation_periods, on_candle_close)
+scheduler.on_fill(account, check_position)
+scheduler.every(resync_interval, check_position)
+# the first evaluation doesn't wait for a candle to close, unless the last run already decided on these candles
+if not state.already_evaluated(market, current_candles()):
+    scheduler.post("candle", on_candle_close)
+scheduler.run()
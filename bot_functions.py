@@ -1,25 +1,42 @@
 import math
 
-from binance_f import RequestClient
-from binance_f.constant.test import *
-from binance_f.base.printobject import *
-from binance_f.model.constant import *
-import talib.abstract as ta
-import pandas as pd
 import numpy as np
 import time
 import sys, os
 import config as cfg
-from decimal import Decimal, getcontext, ROUND_DOWN
+import async_client
+import metrics
+import rate_limit
+import rules
+from journal import TradeJournal
+from exchange import ExchangeClient
+from market_data import fetch_candles, candle_inputs
+from candle_store import CandleStore
+from decimal import Decimal, ROUND_DOWN
 import datetime
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+# binance_f, talib and pandas take most of a second to import, so they are imported by the functions that use
+# them. A bot on the async client and streaming indicators reaches its first decision without loading them
+
+# shared pool for the market data requests made while building a signal
+_fetch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fetch")
 
 
 def getStdOut():
     return sys.stdout
 
 
+# one devnull handle for the whole process, opening one per call leaked a file descriptor every time
+_devnull = None
+
+
 def blockPrint():
-    sys.stdout = open(os.devnull, 'w')
+    global _devnull
+    if _devnull is None:
+        _devnull = open(os.devnull, 'w')
+    sys.stdout = _devnull
 
 
 # Restore
@@ -27,16 +44,46 @@ def enablePrint(std):
     sys.stdout = std
 
 
+# print to the console through the queue based logger, without touching sys.stdout
 def singlePrint(string, std):
-    enablePrint(std)
-    print(string)
-    blockPrint()
+    metrics.console(std).info(string)
+
 
+# the pooled keep-alive client serving as both clients when settings.json has "async_client": true
+_async_client = None
 
-# create a binance request client
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = async_client.Client(api_key=cfg.getPublicKey(), secret_key=cfg.getPrivateKey(),
+                                            url=cfg.getBotSettings().api_url, limiter=rate_limit.limiter)
+    return _async_client
+
+
+# create a binance request client, every call it makes is timed per method in the metrics and
+# waits for its share of the rate limits
 def init_client():
+    if getattr(cfg.getBotSettings(), "async_client", False):
+        return get_async_client()
+    from binance_f import RequestClient
     client = RequestClient(api_key=cfg.getPublicKey(), secret_key=cfg.getPrivateKey(), url=cfg.getBotSettings().api_url)
-    return client
+    return rate_limit.limit(metrics.instrument(client, "binance_f"))
+
+
+# create the signed REST client used for the order endpoints binance_f does not support
+def init_exchange():
+    if getattr(cfg.getBotSettings(), "async_client", False):
+        return get_async_client()
+    exchange = ExchangeClient(api_key=cfg.getPublicKey(), secret_key=cfg.getPrivateKey(),
+                              url=cfg.getBotSettings().api_url, limiter=rate_limit.limiter)
+    return exchange
+
+
+# the local candle store configured by settings.json "candle_store" (a directory), None without one
+def init_candle_store():
+    root = getattr(cfg.getBotSettings(), "candle_store", None)
+    return CandleStore(root) if root else None
 
 
 # Get futures balances. We are interested in USDT by default as this is what we use as margin.
@@ -135,13 +182,13 @@ def execute_market_order(client, _price, _stop_price, _qty, _market, _type, _sid
                       ordertype=_type,
                       side=_side,
                       stopPrice=_stop_price,
-                      workingType=WorkingType.MARK_PRICE,
+                      workingType="MARK_PRICE",
                       closePosition=True
                       )
 
 
 def execute_limit_order(client, _stop_price, _qty, _market="ETHUSDT", _type="LIMIT", _side="SELL",
-                        time_in_force=TimeInForce.GTC, reduce_only=True):
+                        time_in_force="GTC", reduce_only=True):
     client.post_order(symbol=_market,
                       ordertype=_type,
                       side=_side,
@@ -152,7 +199,7 @@ def execute_limit_order(client, _stop_price, _qty, _market="ETHUSDT", _type="LIM
 
 
 def submit_trailing_order(client, _stop_price, _qty=1.0, _market="ETHUSDT", _type="TRAILING_STOP_MARKET", _side="BUY",
-         _callbackRate=0.4, time_in_force=TimeInForce.GTC, reduce_only=True):
+         _callbackRate=0.4, time_in_force="GTC", reduce_only=True):
     client.post_order(symbol=_market,
                       ordertype=_type,
                       side=_side,
@@ -197,7 +244,10 @@ def get_market_price(client, _market="ETHUSDT"):
 
 
 # get the precision of the market, this is needed to avoid errors when creating orders
-def get_market_precision(client, _market="ETHUSDT"):
+# with a symbols.SymbolRegistry the value comes from the cached exchange information
+def get_market_precision(client, _market="ETHUSDT", registry=None):
+    if registry is not None:
+        return registry.get(_market).quantity_precision
     market_data = client.get_exchange_information()
     precision = 3
     for market in market_data.symbols:
@@ -207,7 +257,9 @@ def get_market_precision(client, _market="ETHUSDT"):
     return precision
 
 
-def get_price_precision(client, _market="ETHUSDT"):
+def get_price_precision(client, _market="ETHUSDT", registry=None):
+    if registry is not None:
+        return registry.get(_market).price_precision
     market_data = client.get_exchange_information()
     precision = 2
     for market in market_data.symbols:
@@ -290,91 +342,30 @@ def get_decimal_value(value, price_precision):
     return Decimal(str(value)).quantize(Decimal(get_str_decimal(price_precision)), rounding=ROUND_DOWN)
 
 
-def handle_signal(client, std, market="ETHUSDT", leverage=3, order_side="BUY",
-                  stop_side="SELL", take_profit=4.0, stop_loss=5.0, _callbackRate=0.4):
-    initialise_futures(client, _market=market, _leverage=leverage)
-
-    # close any open trailing stops we have
-    client.cancel_all_orders(market)
-
-    # close_position(client, _market=market)
-
-    qty = calculate_position(client, market, _leverage=leverage)
-
-    enablePrint(std)
-
-    """ ******** ENTERING POSITION ********* """
-    execute_order(client, _qty=qty, _side=order_side, _market=market)
-
-    blockPrint()
-
-    time.sleep(3)
-
-    entry_price = get_specific_positon(client, market).entryPrice
-    price_precision = get_price_precision(client, market)
-
-    side = -1
-    if order_side == "BUY":
-        side = 1
-    else:
-        side = -1
-
-    in_position = True
-
-    singlePrint(f"{order_side}: {qty} ${entry_price} using x{leverage} leverage", std)
-
-    time.sleep(3)
-
-    log_trade(_qty=qty, _market=market, _leverage=leverage, _side=side,
-              _cause="Signal Change", _trigger_price=0,
-              _market_price=entry_price, _type=order_side)
-
-    # Let the order execute and then create a trailing stop market order.
-    # submit_trailing_order(client, _market=market, _qty=qty, _side=stop_side,
-    #                       _callbackRate=_callbackRate)
-
-    """********* STOP LOSS **********"""
+# stop loss and take profit (trailing stop activation) prices for a position entered at entry_price
+def get_protective_prices(entry_price, order_side, take_profit, stop_loss, price_precision):
     if order_side == "SELL":
         stop_loss = -stop_loss
+        take_profit = -take_profit
+
     stop_loss_raw = (entry_price * ((100 - stop_loss) / 100))
-    stop_loss_price = 0
-    entry_price_decimal = 0
     if stop_loss_raw < 1:
         stop_loss_price = get_decimal_value(stop_loss_raw, price_precision)
-        entry_price_decimal = get_decimal_value(entry_price, price_precision)
     else:
         stop_loss_price = get_decimal_half(stop_loss_raw)
-        entry_price_decimal = get_decimal_half(entry_price)
-
-    execute_market_order(client, entry_price_decimal, stop_loss_price, qty, _market=market,
-                         _type="STOP_MARKET", _side=stop_side)
-
-    singlePrint(f"Stop Loss ${stop_loss_price} is created", std)
-
-    time.sleep(3)
 
-    """********* TAKE PROFIT **********"""
-    if order_side == "SELL":
-        take_profit = -take_profit
     take_profit_raw = (entry_price * ((100 + take_profit) / 100))
-    take_profit_price = 0
     if take_profit_raw < 1:
         take_profit_price = get_decimal_value(take_profit_raw, price_precision)
     else:
         take_profit_price = get_decimal_half(take_profit_raw)
-   # execute_limit_order(client, take_profit_price, qty, _market=market, _type="LIMIT", _side=stop_side)
-    submit_trailing_order(client, take_profit_price, qty, _market=market, _type="TRAILING_STOP_MARKET", _side=stop_side, _callbackRate="0.4")
-
-
-
 
-    singlePrint(f"Take Profit ${take_profit_price} is created", std)
-
-    return qty, side, in_position
+    return stop_loss_price, take_profit_price
 
 
 # create a dataframe for our candles
 def to_dataframe(o, h, l, c, v):
+    import pandas as pd
     df = pd.DataFrame()
 
     df['open'] = o
@@ -424,7 +415,6 @@ def avarage_true_range(high, low, close):
 # signals are -1 for short, 1 for long and 0 for do nothing
 def trading_signal(h_o, h_h, h_l, h_c, use_last=False):
     factor = 1
-    pd = 1
 
     hl2 = (np.array(h_h) + np.array(h_l)) / 2
     hl2 = hl2[1:]
@@ -489,15 +479,6 @@ def dictToString(dict):
     return str(dict).replace(', ', '\r\n').replace("u'", "").replace("'", "")[1:-1]
 
 
-def print_condition(my_dict, ind1, ind2, symbol):
-    if isinstance(ind2, str):
-        print(
-            f"{ind1} {symbol} {ind2} | {my_dict[ind1]} {symbol} {my_dict[ind2]} | {eval(str(my_dict[ind1]) + symbol + str(my_dict[ind2]))}")
-    else:
-        print(
-            f"{ind1} {symbol} {ind2} | {my_dict[ind1]} {symbol} {ind2} | {eval(str(my_dict[ind1]) + symbol + str(ind2))}")
-
-
 def get_remainder_from_5thMinute():
     return datetime.datetime.now().minute % 5
 
@@ -512,139 +493,87 @@ class bcolors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
-def trade(my_dict, std):
-    entry = 0
-    enablePrint(std)
-    print("INDICATOR VALUES:")
-    print(dictToString(my_dict))
-    print("\n************* Long Position Check *******************")
-    # print_condition(my_dict, "ema_uptrendlower", "ema_uptrendhigher", ">")
-    print_condition(my_dict, "ma_fiftylow", "current_price", "<")
-    print_condition(my_dict, "ma_nineclose", "current_price", "<")
-    # print_condition(my_dict, "open", "ema_low", "<")
-    # print_condition(my_dict, "macd", "macdsignal", ">")
-    # print_condition(my_dict, "adx", 25, ">")
-    # print_condition(my_dict, "mfi", 30, "<")
-    # print_condition(my_dict, "fastk", 30, "<")
-    # print_condition(my_dict, "fastd", 30, "<")
-    # print_condition(my_dict, "fastk", "fastd", ">")
-    # print_condition(my_dict, "cci", -150, "<")
-    # print_condition(my_dict, "macdhist998", 0, "<")
-    print_condition(my_dict, "macdhist_current", 0, ">")
-    print_condition(my_dict, "macdhist_last", 0, "<")
-    # print_condition(my_dict, "macdhist_2ndlast", 0, "<")
-    # print_condition(my_dict, "macdhist_last", 0, "<")
-    # print_condition(my_dict, "macdhist_current", 0, "<")
-    # print_condition(my_dict, "macdhist_current", "macdhist_last", ">")
-    # print_condition(my_dict, "macdhist_2ndlast", "macdhist_last", ">")
-    # print_condition(my_
-    # 'dict, "macdhist996", "macdhist997", "<")
-    # Long condition
-    if ((my_dict['ma_fiftylow'] < my_dict['current_price']) and
-            (my_dict['ma_nineclose'] < my_dict['current_price']) and
-            # (my_dict['current_price'] < my_dict['ema_low']) and
-            # my_dict['macdhist_2ndlast'] < 0) and
-            (my_dict['macdhist_current'] > 0) and
-            (my_dict['macdhist_last'] < 0)
-            # (my_dict['macdhist_last'] < 0) and
-            # (my_dict['macdhist_current'] < 0) and
-            # (my_dict['macdhist998'] < 0) and
-            # (my_dict['macdhist999'] < 0) and
-            # (my_dict['macdhist_2ndlast'] > my_dict['macdhist_last']) and
-            # (my_dict['macdhist_current'] > my_dict['macdhist_last'])
-            # my_dict['open'] < my_dict['ema_low'] and
-            # my_dict['macd'] > my_dict['macdsignal'] and
-            # (my_dict['adx'] > 25) and
-            # (my_dict['mfi'] < 30) and
-            # (my_dict['fastk'] < 30) and
-            # (my_dict['fastd'] < 30) and
-            # (my_dict['fastk'] > my_dict['fastd']) and
-            # (my_dict['cci'] < -150)
-    ):
-        entry = 1
-        print(bcolors.OKGREEN + "************* Long Position Matched *******************" + bcolors.ENDC)
-    else:
-        print(bcolors.FAIL + "************* Long Position Not Matched *******************" + bcolors.ENDC)
-
-    print("\n************* Short Position Check *******************")
-    print_condition(my_dict, "ma_fiftyhigh", "current_price", ">")
-    print_condition(my_dict, "ma_nineclose", "current_price", ">")
-    # print_condition(my_dict, "ema_high", "open", "<")
-    # print_condition(my_dict, "macd", "macdsignal", "<")
-    # print_condition(my_dict, "adx", 25, ">")
-    # print_condition(my_dict, "mfi", 70, ">")
-    # print_condition(my_dict, "fastk", 70, ">")
-    # print_condition(my_dict, "fastd", 70, ">")
-    # print_condition(my_dict, "fastk", "fastd", "<")
-    # print_condition(my_dict, "cci", 150, ">")
-    # print_condition(my_dict, "macdhist998", 0, ">")
-    # print_condition(my_dict, "macdhist998", 0, ">")
-    print_condition(my_dict, "macdhist_current", 0, "<")
-    print_condition(my_dict, "macdhist_last", 0, ">")
-    # print_condition(my_dict, "macdhist_2ndlast", 0, ">")
-    # print_condition(my_dict, "macdhist_last", 0, ">")
-    # print_condition(my_dict, "macdhist_current", 0, ">")
-    # print_condition(my_dict, "macdhist_2ndlast", "macdhist_last", "<")
-    # print_condition(my_dict, "macdhist_current", "macdhist_last", "<")
-
-    # Short Condition
-    if ((my_dict['ma_fiftyhigh'] > my_dict['current_price']) and
-            (my_dict['ma_nineclose'] > my_dict['current_price']) and
-            (my_dict['macdhist_current'] < 0) and
-            (my_dict['macdhist_last'] > 0)
-            # my_dict['ema_downtrendlower'] < my_dict['ema_downtrendhigher'] and
-            # (my_dict['ema_high'] < my_dict['current_price']) and
-            # (my_dict['macdhist_2ndlast'] > 0) and
-            # (my_dict['macdhist_last'] > 0) and
-            # (my_dict['macdhist_current'] > 0) and
-            # (my_dict['macdhist999'] > 0) and
-            # (my_dict['macdhist_2ndlast'] < my_dict['macdhist_last']) and
-            # (my_dict['macdhist_current'] < my_dict['macdhist_last'])
-            # (my_dict['ema_high'] < my_dict['open']) and
-            # my_dict['macd'] < my_dict['macdsignal'] and
-            # (my_dict['adx'] > 25) and
-            # (my_dict['mfi'] > 70) and
-            # (my_dict['fastk'] > 70) and
-            # (my_dict['fastd'] > 70) and
-            # (my_dict['fastd'] < my_dict['fastk']) and
-            # (my_dict['cci'] > 150)
-    ):
-        entry = -1
-        print(bcolors.OKGREEN + "************* Short Position Matched *******************" + bcolors.ENDC)
-    else:
-        print(bcolors.FAIL + "************* Short Position Not Matched *******************" + bcolors.ENDC)
+# the entry rules, settings.json "long_rule" / "short_rule" or the defaults in rules.py, compiled once
+_strategy = None
+
+
+def get_strategy():
+    global _strategy
+    if _strategy is None:
+        _strategy = rules.load_strategy()
+    return _strategy
+
+
+# What trade() decided and why, written out by the logging thread: the text is only built when the record
+# is written, so the decision itself formats no strings
+class TradeReport:
+    def __init__(self, my_dict, strategy):
+        self.my_dict = my_dict
+        self.strategy = strategy
+
+    @staticmethod
+    def _check(lines, name, rule, values):
+        lines.append(f"\n************* {name} Position Check *******************")
+        lines.extend(rule.describe(values))
+        if rule(values):
+            lines.append(bcolors.OKGREEN + f"************* {name} Position Matched *******************" + bcolors.ENDC)
+        else:
+            lines.append(bcolors.FAIL + f"************* {name} Position Not Matched *******************" + bcolors.ENDC)
 
-    blockPrint()
+    def __str__(self):
+        lines = ["INDICATOR VALUES:", dictToString(self.my_dict)]
+        self._check(lines, "Long", self.strategy.long, self.my_dict)
+        self._check(lines, "Short", self.strategy.short, self.my_dict)
+        return "\n".join(lines)
+
+
+def trade(my_dict, std, strategy=None):
+    strategy = strategy or get_strategy()
+    entry = strategy.signal(my_dict)
+    singlePrint(TradeReport(my_dict, strategy), std)
+    return entry
+
+
+def scalp(candles, candles1m, current_price, std):
+    with metrics.timer("bot_indicator_seconds", method="batch"):
+        my_dict = scalp_indicators(candles, current_price)
+    with metrics.timer("bot_decision_seconds"):
+        entry = trade(my_dict, std)
+    metrics.count("bot_signals_total", entry=entry)
     return entry
 
 
-def scalp(dataframe, dataframe1m, current_price, std):
+# the indicator values trade() decides on, from the last 1000 candles.
+# candles is a column layout array (market_data) or a dataframe, the rows of an array are passed to talib as views
+def scalp_indicators(candles, current_price):
+    import talib.abstract as ta
+    inputs = candle_inputs(candles)
     my_dict = {}
-    my_dict['ma_fiftyhigh'] = ta.MA(dataframe, timeperiod=50, price='high')[999]
-    my_dict['ma_fiftylow'] = ta.MA(dataframe, timeperiod=50, price='low')[999]
-    my_dict['ma_nineclose'] = ta.MA(dataframe, timeperiod=20, price='close')[999]
-
-    my_dict['ema_uptrendhigher'] = ta.EMA(dataframe, timeperiod=200, price='close')[999]
-    my_dict['ema_uptrendlower'] = ta.EMA(dataframe, timeperiod=50, price='high')[999]
-    my_dict['ema_suptrendhigher'] = ta.EMA(dataframe, timeperiod=9, price='low')[999]
-    my_dict['ema_suptrendlower'] = ta.EMA(dataframe, timeperiod=3, price='high')[999]
-    my_dict['ema_downtrendhigher'] = ta.EMA(dataframe, timeperiod=200, price='high')[999]
-    my_dict['ema_downtrendlower'] = ta.EMA(dataframe, timeperiod=50, price='low')[999]
-    my_dict['ema_sdowntrendhigher'] = ta.EMA(dataframe, timeperiod=9, price='high')[999]
-    my_dict['ema_sdowntrendlower'] = ta.EMA(dataframe, timeperiod=3, price='low')[999]
-    my_dict['ema_high'] = ta.EMA(dataframe, timeperiod=5, price='high')[999]
-    my_dict['ema_close'] = ta.EMA(dataframe, timeperiod=5, price='close')[999]
-    my_dict['ema_low'] = ta.EMA(dataframe, timeperiod=5, price='low')[999]
-    fastk, fastd = ta.STOCHF(dataframe['high'], dataframe['low'], dataframe['close'],
+    my_dict['ma_fiftyhigh'] = ta.MA(inputs, timeperiod=50, price='high')[999]
+    my_dict['ma_fiftylow'] = ta.MA(inputs, timeperiod=50, price='low')[999]
+    my_dict['ma_nineclose'] = ta.MA(inputs, timeperiod=20, price='close')[999]
+
+    my_dict['ema_uptrendhigher'] = ta.EMA(inputs, timeperiod=200, price='close')[999]
+    my_dict['ema_uptrendlower'] = ta.EMA(inputs, timeperiod=50, price='high')[999]
+    my_dict['ema_suptrendhigher'] = ta.EMA(inputs, timeperiod=9, price='low')[999]
+    my_dict['ema_suptrendlower'] = ta.EMA(inputs, timeperiod=3, price='high')[999]
+    my_dict['ema_downtrendhigher'] = ta.EMA(inputs, timeperiod=200, price='high')[999]
+    my_dict['ema_downtrendlower'] = ta.EMA(inputs, timeperiod=50, price='low')[999]
+    my_dict['ema_sdowntrendhigher'] = ta.EMA(inputs, timeperiod=9, price='high')[999]
+    my_dict['ema_sdowntrendlower'] = ta.EMA(inputs, timeperiod=3, price='low')[999]
+    my_dict['ema_high'] = ta.EMA(inputs, timeperiod=5, price='high')[999]
+    my_dict['ema_close'] = ta.EMA(inputs, timeperiod=5, price='close')[999]
+    my_dict['ema_low'] = ta.EMA(inputs, timeperiod=5, price='low')[999]
+    fastk, fastd = ta.STOCHF(inputs['high'], inputs['low'], inputs['close'],
                              fastk_period=5, fastd_period=3, fastd_matype=0)
     my_dict['fastd'] = fastd[999]
     my_dict['fastk'] = fastk[999]
-    my_dict['adx'] = ta.ADX(dataframe)[999]
-    my_dict['cci'] = ta.CCI(dataframe, timeperiod=20)[999]
-    my_dict['rsi'] = ta.RSI(dataframe, timeperiod=14)[999]
-    my_dict['mfi'] = ta.MFI(dataframe)[999]
+    my_dict['adx'] = ta.ADX(inputs)[999]
+    my_dict['cci'] = ta.CCI(inputs, timeperiod=20)[999]
+    my_dict['rsi'] = ta.RSI(inputs, timeperiod=14)[999]
+    my_dict['mfi'] = ta.MFI(inputs)[999]
 
-    correction = get_remainder_from_5thMinute() + 1
+    # correction = get_remainder_from_5thMinute() + 1
     # macd = ta.MACD(dataframe1m, fast_period=25, slow_period=30, signal_period=9, price='close')
     # my_dict['macd'] = macd['macd'][999]
     # my_dict['macdsignal'] = macd['macdsignal'][999 - correction]
@@ -653,46 +582,82 @@ def scalp(dataframe, dataframe1m, current_price, std):
     # my_dict['macdhist_2ndlast'] = macd['macdhist'][997 - correction * 3]
 
     # sma macd
-    macd = ta.MACDEXT(dataframe, fast_matype=5, slow_period=7, signal_period=9, price='close')
-    my_dict['MACD'] = macd['macd'][999]
-    my_dict['macdsignal'] = macd['macdsignal'][999]
-    my_dict['macdhist_current'] = macd['macdhist'][999]
-    my_dict['macdhist_last'] = macd['macdhist'][998]
-    # my_dict['macdhist_2ndlast'] = macd['macdhist'][997 - correction * 3]
-
-    my_dict['open'] = dataframe['open'].iloc[-1]
+    macd, macdsignal, macdhist = ta.MACDEXT(inputs, fast_matype=5, slow_period=7, signal_period=9, price='close')
+    my_dict['MACD'] = macd[999]
+    my_dict['macdsignal'] = macdsignal[999]
+    my_dict['macdhist_current'] = macdhist[999]
+    my_dict['macdhist_last'] = macdhist[998]
+    # my_dict['macdhist_2ndlast'] = macdhist[997 - correction * 3]
+
+    my_dict['open'] = inputs['open'][-1]
     my_dict['current_price'] = current_price
+    return my_dict
+
 
-    entry = trade(my_dict, std)
+# same decision as scalp, but from a streaming indicators.ScalpIndicators engine instead of
+# recomputing every indicator over the whole candle history
+def scalp_incremental(indicators, buffer, current_price, std):
+    with metrics.timer("bot_indicator_seconds", method="incremental"):
+        my_dict = indicators.peek(buffer.last(), current_price)
+    with metrics.timer("bot_decision_seconds"):
+        entry = trade(my_dict, std)
+    metrics.count("bot_signals_total", entry=entry)
     return entry
 
 
 def get_dataframe(candles):
-    o, h, l, c, v = convert_candles(candles)
-    return to_dataframe(o, h, l, c, v)
+    with metrics.timer("bot_candle_parse_seconds", source="rest"):
+        o, h, l, c, v = convert_candles(candles)
+        return to_dataframe(o, h, l, c, v)
+
+
+# fetch the candles of every period, the 1m candles and the mark price concurrently.
+# each input is requested once, so the time taken is that of the slowest request.
+# candles come back as column layout arrays (market_data.fetch_candles)
+def fetch_signal_inputs(client, _market="ETHUSDT", _periods=["1m"]):
+    intervals = list(dict.fromkeys(list(_periods) + ["1m"]))
+    candles = {interval: _fetch_pool.submit(fetch_candles, client, _market, interval, 1000)
+               for interval in intervals}
+    mark_price = _fetch_pool.submit(client.get_mark_price, _market)
+    return {interval: future.result() for interval, future in candles.items()}, mark_price.result().markPrice
 
 
 # get the data from the market, create heikin ashi candles and then generate signals
 # return the signals to the bot
-def get_signal(client, _market="ETHUSDT", _period="15m", use_last=False, std=None):
-    candles = client.get_candlestick_data(_market, interval=_period, limit=1000)
-    candles1m = client.get_candlestick_data(_market, interval="1m", limit=1000)
-    current_price = client.get_mark_price(_market).markPrice
-    dataframe = get_dataframe(candles)
-    dataframe1m = get_dataframe(candles1m)
-    entry = scalp(dataframe, dataframe1m, current_price, std)
+# when market_data is given the candles and mark price are read from its stream buffers instead of REST,
+# and if it tracks indicators for the period only the newest candle is evaluated.
+# inputs takes the result of fetch_signal_inputs to reuse data already downloaded
+def get_signal(client, _market="ETHUSDT", _period="15m", use_last=False, std=None, market_data=None, inputs=None):
+    if market_data is not None and _period in market_data.indicators:
+        return scalp_incremental(market_data.indicators[_period], market_data.buffer(_period),
+                                 market_data.mark_price, std)
+    if market_data is not None:
+        candles = market_data.buffer(_period).snapshot()
+        candles1m = market_data.buffer("1m").snapshot()
+        current_price = market_data.mark_price
+    else:
+        if inputs is None:
+            inputs = fetch_signal_inputs(client, _market, [_period])
+        candles_by_period, current_price = inputs
+        candles = candles_by_period[_period]
+        candles1m = candles_by_period["1m"]
+    entry = scalp(candles, candles1m, current_price, std)
     return entry
 
 
 # get signal that is confirmed across multiple time scales
-def get_multi_scale_signal(client, _market="ETHUSDT", _periods=["1m"], std=None):
+def get_multi_scale_signal(client, _market="ETHUSDT", _periods=["1m"], std=None, market_data=None):
     signal = 0
     use_last = True
 
+    inputs = None
+    if market_data is None:
+        inputs = fetch_signal_inputs(client, _market, _periods)
+
     for i, v in enumerate(_periods):
-        _signal = get_signal(client, _market, _period=v, use_last=use_last, std=std)
+        _signal = get_signal(client, _market, _period=v, use_last=use_last, std=std,
+                             market_data=market_data, inputs=inputs)
         signal = signal + _signal
-        time.sleep(3)
 
     signal = signal / len(_periods)
 
@@ -700,29 +665,40 @@ def get_multi_scale_signal(client, _market="ETHUSDT", _periods=["1m"], std=None)
 
 
 # calculate a rounded position size for the bot, based on current USDT holding, leverage and market
-def calculate_position(client, _market="ETHUSDT", _leverage=1):
+def calculate_position(client, _market="ETHUSDT", _leverage=1, registry=None):
     usdt = get_futures_balance(client, _asset="USDT")
     qty = calculate_position_size(client, usdt_balance=usdt, _market=_market, _leverage=_leverage)
-    precision = get_market_precision(client, _market=_market)
+    precision = get_market_precision(client, _market=_market, registry=registry)
     qty = round_to_precision(qty, precision)
     qty = get_decimal_value(qty, precision)
     return qty
 
 
+# the trade log is an append-only journal, written by a background thread so logging never blocks a trade
+_journal = None
+
+
+def get_journal():
+    global _journal
+    if _journal is None:
+        _journal = TradeJournal("trade_log.csv", background=True)
+        atexit.register(_journal.close)
+    return _journal
+
+
 # function for logging trades to csv for later analysis
 def log_trade(_qty=0, _market="ETHUSDT", _leverage=1, _side="long", _cause="signal", _trigger_price=0, _market_price=0,
-              _type="exit"):
-    df = pd.read_csv("trade_log.csv")
-    df2 = pd.DataFrame()
-    df2['time'] = [time.time()]
-    df2['market'] = [_market]
-    df2['qty'] = [_qty]
-    df2['leverage'] = [_leverage]
-    df2['cause'] = [_cause]
-    df2['side'] = [_side]
-    df2['trigger_price'] = [_trigger_price]
-    df2['market_price'] = [_market_price]
-    df2['type'] = [_type]
-
-    df = df.append(df2, ignore_index=True)
-    df.to_csv("trade_log.csv", index=False)
+              _type="exit", _pnl="", _fee=""):
+    get_journal().append({
+        'time': time.time(),
+        'market': _market,
+        'qty': _qty,
+        'leverage': _leverage,
+        'cause': _cause,
+        'side': _side,
+        'trigger_price': _trigger_price,
+        'market_price': _market_price,
+        'type': _type,
+        'pnl': _pnl,
+        'fee': _fee,
+    })
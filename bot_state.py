@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+
+# What the bot is doing, kept on disk so a restarted bot carries on where the last one stopped. Per market:
+# the side, quantity and entry price of the open position, the ids of its protective orders and the open time
+# of the candles entries were last evaluated on. The file is written on every change, to a temporary file
+# that then replaces the old one, so a crash mid-write leaves the previous snapshot in place.
+# On start the snapshot is reconciled with the account the user data stream loaded (positions and open orders
+# of every market from one resync), the exchange always wins: a position it reports is adopted, a position
+# it no longer has is dropped.
+
+STATE_PATH = "bot_state.json"
+
+# order types that protect an open position
+PROTECTIVE_TYPES = ("STOP_MARKET", "TAKE_PROFIT_MARKET", "TRAILING_STOP_MARKET", "STOP", "TAKE_PROFIT")
+
+# what reconcile() found
+FLAT, RESUMED, UNPROTECTED, CLOSED = "flat", "resumed", "unprotected", "closed"
+
+
+def empty_market():
+    return {"side": 0, "qty": 0.0, "entry_price": 0.0, "orders": [], "candles": {}}
+
+
+class BotState:
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.markets = self.load()
+
+    # the saved snapshot, empty if there is none or it can't be read
+    def load(self):
+        try:
+            with open(self.path) as f:
+                markets = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {market: {**empty_market(), **values} for market, values in markets.items()}
+
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.markets, f, separators=(",", ":"))
+        os.replace(temporary, self.path)
+
+    def market(self, market):
+        return self.markets.get(market) or empty_market()
+
+    def in_position(self, market):
+        return self.market(market)["side"] != 0
+
+    # change some values of a market, the file is only written when one of them differs
+    def update(self, market, **values):
+        with self.lock:
+            current = self.market(market)
+            if all(current.get(key) == value for key, value in values.items()):
+                return
+            self.markets[market] = {**current, **values}
+            self.save()
+
+    # a position was entered (qty as the pipeline returned it, side 1 long -1 short)
+    def entered(self, market, side, qty, entry_price, orders):
+        self.update(market, side=side, qty=float(qty), entry_price=float(entry_price), orders=list(orders))
+
+    def exited(self, market):
+        self.update(market, side=0, qty=0.0, entry_price=0.0, orders=[])
+
+    # remember the candles (interval -> open time) an entry was evaluated on
+    def evaluated(self, market, candles):
+        self.update(market, candles={interval: int(open_time) for interval, open_time in candles.items()})
+
+    # True if the entries were already evaluated on exactly these candles
+    def already_evaluated(self, market, candles):
+        saved = self.market(market)["candles"]
+        return bool(candles) and all(saved.get(interval) == int(open_time) for interval, open_time in candles.items())
+
+    # bring the snapshot of a market in line with an account.AccountState that has been resynced. returns
+    #  FLAT        no position, nothing left over
+    #  RESUMED     an open position with a stop loss, the bot only has to keep watching it
+    #  UNPROTECTED an open position without a stop loss order, the caller has to protect it
+    #  CLOSED      the position closed while the bot was down, its leftover orders have to be cancelled
+    # an account that was never loaded has no positions at all, reconciling with it would drop the saved one
+    def reconcile(self, market, account):
+        if not account.loaded:
+            raise RuntimeError(f"can't reconcile {market}, the account has not been loaded")
+        position = account.position(market)
+        orders = account.open_orders(market)
+        if position.amount == 0.0:
+            leftover = self.in_position(market) or bool(orders)
+            self.exited(market)
+            return CLOSED if leftover else FLAT
+
+        protective = [order for order in orders if order["o"] in PROTECTIVE_TYPES]
+        self.entered(market, 1 if position.amount > 0 else -1, abs(position.amount), position.entry_price,
+                     [order["i"] for order in protective])
+        if not any(order["o"] in ("STOP_MARKET", "STOP") for order in protective):
+            return UNPROTECTED
+        return RESUMED
@@ -0,0 +1,187 @@
+import argparse
+import datetime
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+import config as cfg
+from market_data import OPEN_TIME, COLUMNS, INTERVALS, fetch_candles
+
+# Local candle history, one append-only file per (symbol, interval) at root/SYMBOL/interval.candles.
+# A file is a 64 byte header followed by closed candles, one float64 row in the market_data column order each,
+# sorted by open time. Files are memory mapped, so reading a range of candles is a binary search on the open
+# times and a view of the mapping: nothing is read from disk that isn't used and nothing is copied.
+# Candles are only ever appended, catching up from REST where the file ends, so years of 1m candles cost one
+# download and a restart only fetches what was missed.
+
+MAGIC = b"CANDLES1"
+HEADER = struct.Struct("<8sqq")
+HEADER_SIZE = 64
+ROW_SIZE = len(COLUMNS) * 8
+
+# candles per klines request, more than 1000 costs double the request weight
+BATCH = 1000
+
+
+class CandleFile:
+    def __init__(self, path, interval_ms):
+        self.path = path
+        self.interval_ms = interval_ms
+        self.lock = threading.Lock()
+        self._rows = None
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, interval_ms, len(COLUMNS)).ljust(HEADER_SIZE, b"\0"))
+        with open(path, "r+b") as f:
+            magic, stored_interval, columns = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or columns != len(COLUMNS):
+                raise ValueError(f"{path} is not a candle file")
+            if stored_interval != interval_ms:
+                raise ValueError(f"{path} holds {stored_interval}ms candles, not {interval_ms}ms")
+            # drop the partial row of an append that was interrupted
+            size = os.path.getsize(path)
+            f.truncate(size - (size - HEADER_SIZE) % ROW_SIZE)
+        self.count = (os.path.getsize(path) - HEADER_SIZE) // ROW_SIZE
+
+    # open a file whatever its interval, e.g. for offline tools that only have the path
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            _, interval_ms, _ = HEADER.unpack(f.read(HEADER.size))
+        return cls(path, interval_ms)
+
+    def __len__(self):
+        return self.count
+
+    # every candle as a read only (count, len(COLUMNS)) mapping of the file, remapped after appends
+    def rows(self):
+        rows = self._rows
+        if rows is None or len(rows) != self.count:
+            if self.count == 0:
+                return np.empty((0, len(COLUMNS)))
+            rows = self._rows = np.memmap(self.path, dtype=np.float64, mode="r", offset=HEADER_SIZE,
+                                          shape=(self.count, len(COLUMNS)))
+        return rows
+
+    def last_open_time(self):
+        rows = self.rows()
+        return int(rows[-1, OPEN_TIME]) if len(rows) else 0
+
+    # candles with start_time <= open time < end_time, at most the newest `limit` of them, as a
+    # (len(COLUMNS), n) view of the file. its rows are strided, np.ascontiguousarray them for talib
+    def candles(self, start_time=None, end_time=None, limit=None):
+        rows = self.rows()
+        open_times = rows[:, OPEN_TIME]
+        lo = 0 if start_time is None else int(np.searchsorted(open_times, start_time))
+        hi = len(rows) if end_time is None else int(np.searchsorted(open_times, end_time))
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return rows[lo:hi].T
+
+    # append closed candles (a column layout array). candles not newer than the last stored one are skipped,
+    # and with contiguous=True nothing is written if the first new candle doesn't directly follow it.
+    # returns the number of candles written
+    def append(self, data, contiguous=False):
+        with self.lock:
+            last = self.last_open_time()
+            data = data[:, data[OPEN_TIME] > last] if self.count else data
+            if data.shape[1] == 0:
+                return 0
+            if contiguous and self.count and data[OPEN_TIME, 0] != last + self.interval_ms:
+                return 0
+            with open(self.path, "ab") as f:
+                f.write(np.ascontiguousarray(data.T, dtype=np.float64).tobytes())
+            self.count += data.shape[1]
+            return data.shape[1]
+
+
+class CandleStore:
+    def __init__(self, root="candles"):
+        self.root = root
+        self.files = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def path(self, symbol, interval):
+        return os.path.join(self.root, symbol.upper(), f"{interval}.candles")
+
+    def file(self, symbol, interval):
+        key = (symbol.upper(), interval)
+        candle_file = self.files.get(key)
+        if candle_file is None:
+            with self.lock:
+                candle_file = self.files.get(key)
+                if candle_file is None:
+                    candle_file = self.files[key] = CandleFile(self.path(symbol, interval), INTERVALS[interval])
+        return candle_file
+
+    def candles(self, symbol, interval, start_time=None, end_time=None, limit=None):
+        return self.file(symbol, interval).candles(start_time, end_time, limit)
+
+    # append candles a stream saw close, only when they extend the file without a gap (see sync)
+    def append(self, symbol, interval, data):
+        return self.file(symbol, interval).append(data, contiguous=True)
+
+    # download every candle since the file ends, or since start_time into an empty file (by default just the
+    # newest `history` candles). The last candle of a response may still be in progress, it is never stored but
+    # kept in self.pending for recent() and downloaded again by the next sync. returns the number of candles added
+    def sync(self, client, symbol, interval, start_time=None, history=BATCH, batch=BATCH):
+        candle_file = self.file(symbol, interval)
+        start = candle_file.last_open_time() + candle_file.interval_ms if len(candle_file) else start_time
+        if start is None and history > batch:
+            # more than one request holds, page forward from the open time of the oldest one wanted
+            newest = fetch_candles(client, symbol, interval, 1)
+            if newest.shape[1]:
+                start = int(newest[OPEN_TIME, -1]) - (history - 1) * candle_file.interval_ms
+        added = 0
+        while True:
+            data = fetch_candles(client, symbol, interval, batch if start is not None else history, start_time=start)
+            closed = max(data.shape[1] - 1, 0)
+            added += candle_file.append(data[:, :closed])
+            self.pending[(symbol.upper(), interval)] = data[:, closed:]
+            if start is None or data.shape[1] < batch or closed == 0:
+                return added
+            start = int(data[OPEN_TIME, closed - 1]) + candle_file.interval_ms
+
+    # sync, then the newest `limit` candles ending with the one in progress, like the klines endpoint returns
+    # them. a startup warm-up that only downloads what closed since the last run
+    def recent(self, client, symbol, interval, limit=BATCH):
+        self.sync(client, symbol, interval, history=limit)
+        pending = self.pending.get((symbol.upper(), interval), np.empty((len(COLUMNS), 0)))
+        stored = self.candles(symbol, interval, limit=limit - pending.shape[1])
+        return np.concatenate([stored, pending], axis=1)
+
+
+def _timestamp(value):
+    date = datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    return int(date.timestamp() * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download klines into the local candle store")
+    parser.add_argument("symbols", nargs="+", help="markets to download, e.g. ETHUSDT BTCUSDT")
+    parser.add_argument("--intervals", default="1m", help="comma separated intervals")
+    parser.add_argument("--root", default=None, help="store directory, settings.json candle_store by default")
+    parser.add_argument("--start", help="first day (YYYY-MM-DD) to download into an empty file")
+    args = parser.parse_args()
+
+    settings = cfg.getBotSettings()
+    from exchange import ExchangeClient
+    client = ExchangeClient(url=getattr(settings, "api_url", "https://fapi.binance.com"))
+    store = CandleStore(args.root or getattr(settings, "candle_store", "candles"))
+    start_time = _timestamp(args.start) if args.start else None
+    for symbol in args.symbols:
+        for interval in args.intervals.split(","):
+            started = time.perf_counter()
+            added = store.sync(client, symbol, interval, start_time=start_time)
+            candle_file = store.file(symbol, interval)
+            print(f"{symbol} {interval}: {added} candles added, {len(candle_file)} stored "
+                  f"({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
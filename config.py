@@ -12,3 +12,12 @@ def getPublicKey():
 
 def getPrivateKey():
     return getAPIKeys().api_secret
+
+
+# per market settings. settings.json can hold a "markets" list, each entry overrides the top level values
+# for one market. without it the bot trades the single top level market
+def getMarketSettings():
+    settings = getBotSettings()
+    defaults = {key: value for key, value in vars(settings).items() if key != "markets"}
+    markets = getattr(settings, "markets", None) or [SimpleNamespace(market=settings.market)]
+    return [SimpleNamespace(**{**defaults, **vars(market)}) for market in markets]
@@ -0,0 +1,186 @@
+import logging
+
+import bot_functions as bf
+from account import AccountState, UserDataStream
+from accounting import Accounting
+from bot_state import CLOSED
+from indicators import ScalpIndicators
+from market_data import MarketData, MarketStream
+from orders import EntryPipeline, EntryError
+from scheduler import Scheduler
+from symbols import SymbolRegistry
+
+logger = logging.getLogger()
+
+
+# Everything the bot tracks for one market: its settings, its candle feed and whether we are in a trade.
+# This replaces the module level globals bot.py uses for its single market.
+class MarketState:
+    def __init__(self, settings):
+        self.market = settings.market
+        self.leverage = int(settings.leverage)
+        self.margin_type = settings.margin_type
+        self.periods = settings.trading_periods.split(",")
+        self.take_profit = float(settings.take_profit)
+        self.stop_loss = float(settings.stop_loss)
+        self.trailing_percentage = float(settings.trailing_percentage)
+        self.resample = getattr(settings, "resample_candles", False)
+        self.market_data = None
+        self.pipeline = None
+        self.in_position = False
+        self.side = 0
+        self.qty = 0
+
+    def __repr__(self):
+        return f"MarketState({self.market}, in_position={self.in_position}, side={self.side})"
+
+
+# Trades any number of markets from one process: one client, one symbol registry, one websocket
+# connection for all candle streams and one user data stream for every position.
+# A market is evaluated when a candle of one of its periods closes and open trades are checked when a fill
+# arrives, with a check every resync_interval seconds in case the stream resynced without reporting a fill.
+# With a market_hub.HubClient the candles are read from the hub's shared memory instead of streamed here.
+# With a bot_state.BotState every market's position and last evaluated candles are saved like bot.py does, and
+# a restart reconciles them with the account.
+class MultiMarketEngine:
+    def __init__(self, client, exchange, markets, std, url="wss://fstream.binance.com", resync_interval=60,
+                 store=None, hub=None, bot_state=None):
+        self.client = client
+        self.exchange = exchange
+        self.store = store
+        self.hub = hub
+        self.bot_state = bot_state
+        self.states = [MarketState(settings) for settings in markets]
+        self.std = std
+        self.url = url
+        self.resync_interval = resync_interval
+        self.registry = SymbolRegistry(client)
+        self.account = AccountState()
+        self.accounting = Accounting(log_trades=True).attach(self.account)
+        self.scheduler = Scheduler()
+        self.stream = None
+        self.user_stream = None
+
+    def start(self):
+        self.registry.load()
+        self.user_stream = UserDataStream(self.exchange, self.account, url=self.url).start()
+        self.accounting.load(self.account)
+        for state in self.states:
+            # leverage and margin type are only set when the account doesn't have them already
+            position = self.account.position(state.market)
+            margin_type = "cross" if state.margin_type.upper() == "CROSSED" else "isolated"
+            if position.leverage != state.leverage or position.margin_type != margin_type:
+                bf.initialise_futures(self.client, _market=state.market, _leverage=state.leverage,
+                                      _margin_type=state.margin_type)
+            if self.hub is not None:
+                state.market_data = self.hub.market_data(state.market)
+            else:
+                state.market_data = MarketData(self.client, market=state.market,
+                                               intervals=state.periods + ["1m"], url=self.url,
+                                               exchange=self.exchange, store=self.store,
+                                               resample=state.resample)
+            self.accounting.watch(state.market_data)
+            state.market_data.track_indicators(ScalpIndicators, state.periods)
+            state.pipeline = EntryPipeline(self.exchange, self.registry, self.std, market=state.market,
+                                           leverage=state.leverage, take_profit=state.take_profit,
+                                           stop_loss=state.stop_loss, callback_rate=state.trailing_percentage,
+                                           account=self.account)
+            self.resume(state)
+            self.scheduler.on_candle_close(state.market_data, state.periods, self.on_candle_close, state)
+        self.scheduler.on_fill(self.account, self.check_positions)
+        self.scheduler.every(self.resync_interval, self.check_positions)
+        self.scheduler.every(self.resync_interval, self.registry.refresh_if_stale)
+        if self.hub is not None:
+            self.stream = self.hub.start()
+        else:
+            self.stream = MarketStream([state.market_data for state in self.states], url=self.url).start()
+        return self
+
+    # a position the account already has (e.g. left by the last run) is watched, not entered on top of, and
+    # gets its protective orders if it has no stop loss. The saved snapshot follows the account, the orders of a
+    # position that closed while the bot was stopped are cancelled
+    def resume(self, state):
+        if self.bot_state is not None:
+            status = self.bot_state.reconcile(state.market, self.account)
+            if status == CLOSED and self.account.open_orders(state.market):
+                bf.singlePrint(f"{state.market}: the position closed while the bot was stopped, "
+                               f"cancelling its orders", self.std)
+                self.client.cancel_all_orders(state.market)
+        position = self.account.position(state.market)
+        if position.amount == 0.0:
+            return
+        state.in_position, state.side, state.qty = True, 1 if position.amount > 0 else -1, abs(position.amount)
+        bf.singlePrint(f"{state.market}: resuming position {position.amount} ${position.entry_price}", self.std)
+        orders = self.account.open_orders(state.market)
+        if not any(order["o"] in ("STOP_MARKET", "STOP") for order in orders):
+            bf.singlePrint(f"{state.market}: the position has no stop loss, placing the protective orders", self.std)
+            self.client.cancel_all_orders(state.market)
+            order_ids = state.pipeline.protect_position(position.amount, position.entry_price)
+            self.entered(state, position.entry_price, order_ids)
+
+    # the open position of a market is saved, if the engine keeps a BotState
+    def entered(self, state, entry_price, order_ids):
+        if self.bot_state is not None:
+            self.bot_state.entered(state.market, state.side, state.qty, entry_price, order_ids)
+
+    # open time of the candle in progress of every trading period of a market
+    def current_candles(self, state):
+        return {period: state.market_data.buffer(period).last_open_time() for period in state.periods}
+
+    # positions come from the user data stream, checking them costs no requests
+    def check_positions(self):
+        for state in self.states:
+            if state.in_position and not self.account.in_position(state.market):
+                self.client.cancel_all_orders(state.market)
+                result = self.accounting.market(state.market)
+                bf.singlePrint(f"{state.market}: trade closed, {result.net_pnl:.4f} USDT net so far, "
+                               f"checking to enter a new trade.", self.std)
+                state.in_position = False
+                state.side = 0
+                state.pipeline.balance = None
+                if self.bot_state is not None:
+                    self.bot_state.exited(state.market)
+
+    def evaluate(self, state):
+        if state.pipeline.balance is None:
+            state.pipeline.prepare()
+        if self.bot_state is not None:
+            self.bot_state.evaluated(state.market, self.current_candles(state))
+        entry = bf.get_multi_scale_signal(self.client, _market=state.market, _periods=state.periods,
+                                          std=self.std, market_data=state.market_data)
+        if entry not in (1, -1):
+            bf.singlePrint(f"{state.market}: conditions not matched, no trade will be taken", self.std)
+            return
+
+        order_side = "BUY" if entry == 1 else "SELL"
+        state.qty, state.side, state.in_position = state.pipeline.enter(order_side, state.market_data.mark_price)
+        if state.in_position:
+            self.entered(state, state.pipeline.entry_price, state.pipeline.order_ids)
+
+    # a failure in one market must not stop the others from trading
+    def on_candle_close(self, state):
+        if state.in_position:
+            return
+        try:
+            self.evaluate(state)
+        except EntryError as e:
+            # the order filled, the position is watched like any other (check_positions drops it if it is gone)
+            logger.error(str(e), exc_info=True)
+            bf.singlePrint(f"{state.market}: encountered Exception {e}", self.std)
+            state.qty, state.side, state.in_position = e.qty, e.side, True
+            self.entered(state, e.entry_price, e.order_ids)
+        except Exception as e:
+            logger.error(str(e), exc_info=True)
+            bf.singlePrint(f"{state.market}: encountered Exception {e}", self.std)
+
+    # evaluate every market once straight away (unless the last run already decided on these candles), then on
+    # candle closes and fills until stop()
+    def run(self):
+        for state in self.states:
+            if self.bot_state is None or not self.bot_state.already_evaluated(state.market,
+                                                                              self.current_candles(state)):
+                self.scheduler.post("candle", self.on_candle_close, state)
+        self.scheduler.run()
+
+    def stop(self):
+        self.scheduler.stop()
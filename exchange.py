@@ -0,0 +1,171 @@
+import hashlib
+import hmac
+import json
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+import metrics
+import rate_limit
+
+
+class ExchangeError(Exception):
+    def __init__(self, code, msg, status=None):
+        super().__init__(f"{code}: {msg}")
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+# binance expects booleans as lowercase strings and every batch order value as a string
+def _param(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+# Minimal signed REST client for the futures endpoints binance_f does not cover (batch orders,
+# order response types). Responses are returned as parsed json.
+# Given a rate_limit.RateLimiter, requests are scheduled within the request weight and order limits.
+class ExchangeClient:
+    def __init__(self, api_key="", secret_key="", url="https://fapi.binance.com", recv_window=5000, timeout=10,
+                 limiter=None):
+        self.api_key = api_key
+        self.secret_key = secret_key.encode()
+        self._mac = hmac.new(self.secret_key, digestmod=hashlib.sha256)
+        self.url = url.rstrip("/")
+        self.recv_window = recv_window
+        self.timeout = timeout
+        self.headers = {}
+        self.limiter = limiter
+
+    # the key is hashed into the hmac once, each signature only copies that state
+    def sign(self, query):
+        mac = self._mac.copy()
+        mac.update(query.encode())
+        return mac.hexdigest()
+
+    def encode(self, params, signed):
+        params = {key: _param(value) for key, value in (params or {}).items() if value is not None}
+        if signed:
+            params["recvWindow"] = self.recv_window
+            params["timestamp"] = int(time.time() * 1000)
+        query = urlencode(params)
+        if signed:
+            query += "&signature=" + self.sign(query)
+        return query
+
+    # the response body as bytes, for callers that parse it themselves (see market_data.parse_klines).
+    # requests wait for their share of the rate limits, identical market data requests in flight are sent once
+    def request_raw(self, method, path, params=None, signed=False):
+        if self.limiter is None:
+            return self.send(method, path, params, signed)
+        key = None
+        if method == "GET" and not signed:
+            key = (path, tuple(sorted((params or {}).items())))
+        return self.limiter.call(rate_limit.endpoint_cost(method, path, params), self.send, method, path, params,
+                                 signed, key=key)
+
+    def send(self, method, path, params=None, signed=False):
+        query = self.encode(params, signed)
+        url = self.url + path
+        data = None
+        if method in ("POST", "PUT"):
+            data = query.encode()
+        elif query:
+            url += "?" + query
+        request = urllib.request.Request(url, data=data, method=method,
+                                         headers={"X-MBX-APIKEY": self.api_key,
+                                                  "Content-Type": "application/x-www-form-urlencoded"})
+        sent = time.time()
+        try:
+            with metrics.timer("bot_rest_request_seconds", client="exchange", endpoint=f"{method} {path}"):
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    self.headers = dict(response.headers)
+                    if self.limiter is not None:
+                        self.limiter.update(self.headers, sent)
+                    return response.read()
+        except urllib.error.HTTPError as e:
+            self.headers = dict(e.headers or {})
+            if self.limiter is not None:
+                self.limiter.update(self.headers, sent)
+                if e.code in (418, 429):
+                    self.limiter.back_off(e.code, self.headers.get("Retry-After"))
+            body = e.read()
+            try:
+                error = json.loads(body)
+            except ValueError:
+                error = {"code": e.code, "msg": body.decode(errors="replace")}
+            metrics.count("bot_rest_errors_total", client="exchange", endpoint=f"{method} {path}",
+                          code=error.get("code"))
+            raise ExchangeError(error.get("code"), error.get("msg"), e.code)
+
+    def request(self, method, path, params=None, signed=False):
+        return json.loads(self.request_raw(method, path, params, signed))
+
+    # market data
+
+    def klines(self, symbol, interval="1m", limit=1000, start_time=None, end_time=None):
+        return self.request("GET", "/fapi/v1/klines", {"symbol": symbol, "interval": interval, "limit": limit,
+                                                       "startTime": start_time, "endTime": end_time})
+
+    # the unparsed klines payload, market_data.parse_klines turns it into a candle array
+    def klines_raw(self, symbol, interval="1m", limit=1000, start_time=None, end_time=None):
+        return self.request_raw("GET", "/fapi/v1/klines", {"symbol": symbol, "interval": interval, "limit": limit,
+                                                           "startTime": start_time, "endTime": end_time})
+
+    def mark_price(self, symbol):
+        return self.request("GET", "/fapi/v1/premiumIndex", {"symbol": symbol})
+
+    def ticker_price(self, symbol):
+        return self.request("GET", "/fapi/v1/ticker/price", {"symbol": symbol})
+
+    def exchange_info(self):
+        return self.request("GET", "/fapi/v1/exchangeInfo")
+
+    # account
+
+    def balance(self):
+        return self.request("GET", "/fapi/v2/balance", signed=True)
+
+    def position_risk(self, symbol=None):
+        return self.request("GET", "/fapi/v2/positionRisk", {"symbol": symbol}, signed=True)
+
+    def change_leverage(self, symbol, leverage):
+        return self.request("POST", "/fapi/v1/leverage", {"symbol": symbol, "leverage": leverage}, signed=True)
+
+    def change_margin_type(self, symbol, margin_type):
+        return self.request("POST", "/fapi/v1/marginType", {"symbol": symbol, "marginType": margin_type},
+                            signed=True)
+
+    def open_orders(self, symbol=None):
+        return self.request("GET", "/fapi/v1/openOrders", {"symbol": symbol}, signed=True)
+
+    # user data stream keys only need the api key header, they are not signed
+
+    def new_listen_key(self):
+        return self.request("POST", "/fapi/v1/listenKey")["listenKey"]
+
+    def keepalive_listen_key(self):
+        return self.request("PUT", "/fapi/v1/listenKey")
+
+    def close_listen_key(self):
+        return self.request("DELETE", "/fapi/v1/listenKey")
+
+    # orders
+
+    def new_order(self, **params):
+        return self.request("POST", "/fapi/v1/order", params, signed=True)
+
+    def get_order(self, symbol, order_id):
+        return self.request("GET", "/fapi/v1/order", {"symbol": symbol, "orderId": order_id}, signed=True)
+
+    # up to 5 orders in one request. the response holds, in order, either the order or an error for each
+    def batch_orders(self, orders):
+        orders = [{key: _param(value) for key, value in order.items() if value is not None} for order in orders]
+        return self.request("POST", "/fapi/v1/batchOrders",
+                            {"batchOrders": json.dumps(orders, separators=(",", ":"))}, signed=True)
+
+    def cancel_all_orders(self, symbol):
+        return self.request("DELETE", "/fapi/v1/allOpenOrders", {"symbol": symbol}, signed=True)
@@ -0,0 +1,529 @@
+import math
+import threading
+from collections import deque
+
+from market_data import OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME
+
+NAN = float("nan")
+
+# TA-Lib treats anything this close to zero as zero, when dividing and when comparing changes
+EPSILON = 0.00000001
+
+
+def is_zero(value):
+    return -EPSILON < value < EPSILON
+
+
+# Streaming indicators. Each one keeps just enough running state to produce the same value TA-Lib
+# would return for the newest bar of the full series it has been fed.
+#  update(...) commits a closed bar and returns the new value
+#  peek(...)   returns the value a bar would produce without committing it (used for the in-progress candle)
+# Values are nan until the indicator has seen its TA-Lib lookback worth of bars.
+
+
+# Simple moving average (TA-Lib MA with matype 0)
+class SMA:
+    def __init__(self, period):
+        self.period = period
+        self.window = deque()
+        self.total = 0.0
+        self.value = NAN
+
+    def peek(self, x):
+        count = len(self.window) + 1
+        total = self.total + x
+        if count > self.period:
+            total -= self.window[0]
+            count -= 1
+        return total / self.period if count == self.period else NAN
+
+    def update(self, x):
+        self.window.append(x)
+        self.total += x
+        if len(self.window) > self.period:
+            self.total -= self.window.popleft()
+        self.value = self.total / self.period if len(self.window) == self.period else NAN
+        return self.value
+
+
+# Exponential moving average, seeded with the SMA of the first `period` values like TA-Lib
+class EMA:
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def peek(self, x):
+        if self.count + 1 < self.period:
+            return NAN
+        if self.count + 1 == self.period:
+            return (self.total + x) / self.period
+        return (x - self.value) * self.k + self.value
+
+    def update(self, x):
+        self.value = self.peek(x)
+        self.count += 1
+        if self.count <= self.period:
+            self.total += x
+        return self.value
+
+
+# Fast stochastic (TA-Lib STOCHF with an SMA fastd). Returns (fastk, fastd)
+class StochF:
+    def __init__(self, fastk_period=5, fastd_period=3):
+        self.fastk_period = fastk_period
+        self.highs = deque(maxlen=fastk_period)
+        self.lows = deque(maxlen=fastk_period)
+        self.fastd = SMA(fastd_period)
+        self.value = (NAN, NAN)
+
+    def _fastk(self, high, low, close):
+        highs = list(self.highs)[1 - self.fastk_period:] + [high]
+        lows = list(self.lows)[1 - self.fastk_period:] + [low]
+        if len(highs) < self.fastk_period:
+            return NAN
+        lowest = min(lows)
+        diff = (max(highs) - lowest) / 100.0
+        return (close - lowest) / diff if diff != 0.0 else 0.0
+
+    def _output(self, fastk, fastd):
+        # TA-Lib only starts both lines once fastd is available
+        return (fastk, fastd) if not math.isnan(fastd) else (NAN, NAN)
+
+    def peek(self, high, low, close):
+        fastk = self._fastk(high, low, close)
+        fastd = self.fastd.peek(fastk) if not math.isnan(fastk) else NAN
+        return self._output(fastk, fastd)
+
+    def update(self, high, low, close):
+        fastk = self._fastk(high, low, close)
+        self.highs.append(high)
+        self.lows.append(low)
+        fastd = self.fastd.update(fastk) if not math.isnan(fastk) else NAN
+        self.value = self._output(fastk, fastd)
+        return self.value
+
+
+def true_range(high, low, prev_close):
+    return max(high - low, abs(high - prev_close), abs(low - prev_close))
+
+
+# Average directional index with Wilder smoothing, following the TA-Lib ADX algorithm step for step
+class ADX:
+    def __init__(self, period=14):
+        self.period = period
+        self.count = 0
+        self.prev = None
+        self.plus_dm = 0.0
+        self.minus_dm = 0.0
+        self.tr = 0.0
+        self.sum_dx = 0.0
+        self.value = NAN
+
+    def _dx(self, plus_dm, minus_dm, tr):
+        if is_zero(tr):
+            return None
+        minus_di = 100.0 * (minus_dm / tr)
+        plus_di = 100.0 * (plus_dm / tr)
+        total = minus_di + plus_di
+        if is_zero(total):
+            return None
+        return 100.0 * (abs(minus_di - plus_di) / total)
+
+    def _step(self, high, low, close):
+        period = self.period
+        plus_dm, minus_dm, tr = self.plus_dm, self.minus_dm, self.tr
+        sum_dx, value = self.sum_dx, self.value
+        if self.prev is None:
+            return (high, low, close), plus_dm, minus_dm, tr, sum_dx, value
+
+        prev_high, prev_low, prev_close = self.prev
+        diff_p = high - prev_high
+        diff_m = prev_low - low
+        if self.count >= period:
+            minus_dm -= minus_dm / period
+            plus_dm -= plus_dm / period
+        if diff_m > 0 and diff_p < diff_m:
+            minus_dm += diff_m
+        elif diff_p > 0 and diff_p > diff_m:
+            plus_dm += diff_p
+        bar_tr = true_range(high, low, prev_close)
+        tr = tr - tr / period + bar_tr if self.count >= period else tr + bar_tr
+
+        if self.count >= period:
+            dx = self._dx(plus_dm, minus_dm, tr)
+            if self.count < 2 * period:
+                sum_dx += dx if dx is not None else 0.0
+                if self.count == 2 * period - 1:
+                    value = sum_dx / period
+            elif dx is not None:
+                value = (value * (period - 1) + dx) / period
+        return (high, low, close), plus_dm, minus_dm, tr, sum_dx, value
+
+    def peek(self, high, low, close):
+        return self._step(high, low, close)[-1]
+
+    def update(self, high, low, close):
+        self.prev, self.plus_dm, self.minus_dm, self.tr, self.sum_dx, self.value = self._step(high, low, close)
+        self.count += 1
+        return self.value
+
+
+# Commodity channel index over the typical price
+class CCI:
+    def __init__(self, period=20):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.value = NAN
+
+    def _cci(self, window):
+        if len(window) < self.period:
+            return NAN
+        average = sum(window) / self.period
+        deviation = sum(abs(x - average) for x in window)
+        last = window[-1] - average
+        if last != 0.0 and deviation != 0.0:
+            return last / (0.015 * (deviation / self.period))
+        return 0.0
+
+    def peek(self, high, low, close):
+        return self._cci(list(self.window)[1 - self.period:] + [(high + low + close) / 3])
+
+    def update(self, high, low, close):
+        self.window.append((high + low + close) / 3)
+        self.value = self._cci(self.window)
+        return self.value
+
+
+# Relative strength index with Wilder smoothing, first value is the simple average of `period` changes
+class RSI:
+    def __init__(self, period=14):
+        self.period = period
+        self.count = 0
+        self.prev = 0.0
+        self.gain = 0.0
+        self.loss = 0.0
+        self.value = NAN
+
+    def _step(self, x):
+        gain, loss, value = self.gain, self.loss, self.value
+        if self.count == 0:
+            return gain, loss, value
+        change = x - self.prev
+        if self.count <= self.period:
+            if change < 0:
+                loss -= change
+            else:
+                gain += change
+            if self.count < self.period:
+                return gain, loss, value
+            gain /= self.period
+            loss /= self.period
+        else:
+            gain *= self.period - 1
+            loss *= self.period - 1
+            if change < 0:
+                loss -= change
+            else:
+                gain += change
+            gain /= self.period
+            loss /= self.period
+        total = gain + loss
+        value = 100.0 * (gain / total) if not is_zero(total) else 0.0
+        return gain, loss, value
+
+    def peek(self, x):
+        return self._step(x)[-1]
+
+    def update(self, x):
+        self.gain, self.loss, self.value = self._step(x)
+        self.prev = x
+        self.count += 1
+        return self.value
+
+
+# Money flow index over the last `period` typical price changes
+class MFI:
+    def __init__(self, period=14):
+        self.period = period
+        self.prev = None
+        self.flows = deque()
+        self.positive = 0.0
+        self.negative = 0.0
+        self.value = NAN
+
+    def _flow(self, high, low, close, volume):
+        typical = (high + low + close) / 3
+        diff = typical - self.prev
+        money = typical * volume
+        # a change within rounding error of zero is no change, as in TA-Lib
+        if is_zero(diff):
+            return typical, (0.0, 0.0)
+        if diff > 0:
+            return typical, (money, 0.0)
+        return typical, (0.0, money)
+
+    def _mfi(self, count, positive, negative):
+        if count < self.period:
+            return NAN
+        total = positive + negative
+        return 100.0 * (positive / total) if total >= 1.0 else 0.0
+
+    def peek(self, high, low, close, volume):
+        if self.prev is None:
+            return NAN
+        _, (pos, neg) = self._flow(high, low, close, volume)
+        positive, negative = self.positive + pos, self.negative + neg
+        count = len(self.flows) + 1
+        if count > self.period:
+            positive -= self.flows[0][0]
+            negative -= self.flows[0][1]
+            count -= 1
+        return self._mfi(count, positive, negative)
+
+    def update(self, high, low, close, volume):
+        if self.prev is None:
+            self.prev = (high + low + close) / 3
+            return self.value
+        self.prev, flow = self._flow(high, low, close, volume)
+        self.flows.append(flow)
+        self.positive += flow[0]
+        self.negative += flow[1]
+        if len(self.flows) > self.period:
+            pos, neg = self.flows.popleft()
+            self.positive -= pos
+            self.negative -= neg
+        self.value = self._mfi(len(self.flows), self.positive, self.negative)
+        return self.value
+
+
+# MACD built from simple moving averages (TA-Lib MACDEXT with the default matypes). Returns (macd, signal, hist)
+class MACDExt:
+    def __init__(self, fast_period=12, slow_period=26, signal_period=9):
+        if slow_period < fast_period:
+            fast_period, slow_period = slow_period, fast_period
+        self.fast = SMA(fast_period)
+        self.slow = SMA(slow_period)
+        self.signal = SMA(signal_period)
+        self.value = (NAN, NAN, NAN)
+
+    def _output(self, macd, signal):
+        if math.isnan(signal):
+            return NAN, NAN, NAN
+        return macd, signal, macd - signal
+
+    def peek(self, x):
+        macd = self.fast.peek(x) - self.slow.peek(x)
+        signal = self.signal.peek(macd) if not math.isnan(macd) else NAN
+        return self._output(macd, signal)
+
+    def update(self, x):
+        macd = self.fast.update(x) - self.slow.update(x)
+        signal = self.signal.update(macd) if not math.isnan(macd) else NAN
+        self.value = self._output(macd, signal)
+        return self.value
+
+
+# All the indicators scalp() reads, kept current one closed candle at a time.
+# MACDEXT uses 12/26/9 SMAs: scalp passes fast_matype/slow_period/signal_period which are not
+# MACDEXT parameter names, so TA-Lib ignores them and runs with its defaults.
+class ScalpIndicators:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.ma = {
+            'ma_fiftyhigh': (SMA(50), HIGH),
+            'ma_fiftylow': (SMA(50), LOW),
+            'ma_nineclose': (SMA(20), CLOSE),
+            'ema_uptrendhigher': (EMA(200), CLOSE),
+            'ema_uptrendlower': (EMA(50), HIGH),
+            'ema_suptrendhigher': (EMA(9), LOW),
+            'ema_suptrendlower': (EMA(3), HIGH),
+            'ema_downtrendhigher': (EMA(200), HIGH),
+            'ema_downtrendlower': (EMA(50), LOW),
+            'ema_sdowntrendhigher': (EMA(9), HIGH),
+            'ema_sdowntrendlower': (EMA(3), LOW),
+            'ema_high': (EMA(5), HIGH),
+            'ema_close': (EMA(5), CLOSE),
+            'ema_low': (EMA(5), LOW),
+        }
+        self.stochf = StochF(5, 3)
+        self.adx = ADX(14)
+        self.cci = CCI(20)
+        self.rsi = RSI(14)
+        self.mfi = MFI(14)
+        self.macd = MACDExt()
+        self.open_time = None
+        self.committed = None
+
+    def _values(self, bar, method, macdhist_last):
+        o, h, l, c, v = bar[OPEN], bar[HIGH], bar[LOW], bar[CLOSE], bar[VOLUME]
+        my_dict = {}
+        for name, (indicator, column) in self.ma.items():
+            my_dict[name] = getattr(indicator, method)(bar[column])
+        fastk, fastd = getattr(self.stochf, method)(h, l, c)
+        my_dict['fastd'] = fastd
+        my_dict['fastk'] = fastk
+        my_dict['adx'] = getattr(self.adx, method)(h, l, c)
+        my_dict['cci'] = getattr(self.cci, method)(h, l, c)
+        my_dict['rsi'] = getattr(self.rsi, method)(c)
+        my_dict['mfi'] = getattr(self.mfi, method)(h, l, c, v)
+        macd, signal, hist = getattr(self.macd, method)(c)
+        my_dict['MACD'] = macd
+        my_dict['macdsignal'] = signal
+        my_dict['macdhist_current'] = hist
+        my_dict['macdhist_last'] = macdhist_last
+        my_dict['open'] = o
+        return my_dict
+
+    # commit a closed candle (a row in the market_data column layout)
+    def update(self, bar):
+        with self.lock:
+            macdhist_last = self.macd.value[2]
+            self.committed = self._values(bar, "update", macdhist_last)
+            self.open_time = bar[OPEN_TIME]
+
+    # indicator values for the in-progress candle, as scalp() would compute them with it as the last row
+    def peek(self, bar, current_price):
+        with self.lock:
+            if bar[OPEN_TIME] == self.open_time:
+                my_dict = dict(self.committed)
+            else:
+                my_dict = self._values(bar, "peek", self.macd.value[2])
+        my_dict['current_price'] = current_price
+        return my_dict
+
+    # rebuild from a candle buffer, every row but the last (still open) candle is committed
+    def seed(self, buffer):
+        data = buffer.snapshot()
+        with self.lock:
+            self.reset()
+        for i in range(data.shape[1] - 1):
+            self.update(data[:, i])
+
+    # keep this engine in step with a market_data.CandleBuffer
+    def attach(self, buffer):
+        buffer.on_seed(self.seed)
+        buffer.on_close(lambda b: self.update(b.last()))
+        if buffer.count:
+            self.seed(buffer)
+        return self
+
+
+# Heikin ashi candles one candle at a time, the values of bot_functions.construct_heikin_ashi.
+# Returns (open, high, low, close)
+class HeikinAshi:
+    def __init__(self):
+        self.value = None
+
+    def peek(self, o, h, l, c):
+        close = (o + h + l + c) / 4
+        open_ = close if self.value is None else (self.value[0] + self.value[3]) / 2
+        return open_, max(h, close, open_), min(l, close, open_), close
+
+    def update(self, o, h, l, c):
+        self.value = self.peek(o, h, l, c)
+        return self.value
+
+
+# The TalonSniper signal (supertrend bands over heikin ashi candles) one candle at a time, the entries of
+# bot_functions.trading_signal without rebuilding the history. It keeps the last heikin ashi candle, the heikin
+# ashi close before it, the last bands and the last trend, so a candle costs the same however long the history.
+# trading_signal compares each band with the heikin ashi close two candles back, the state keeps that close
+# so the entries match it exactly. The first candle only starts the heikin ashi series and gives 0, the batch
+# functions leave it out of their output.
+#  update(o, h, l, c) commits a closed candle and returns its entry, 1 long, -1 short, 0 nothing
+#  peek(o, h, l, c)   returns the entry the in-progress candle would give
+# with use_last the entry is the last non-zero one, like trading_signal(..., use_last=True)
+class TalonSniper:
+    def __init__(self, factor=1, use_last=False):
+        self.factor = factor
+        self.use_last = use_last
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.heikin_ashi = HeikinAshi()
+        self.prev_close = None
+        self.trend_up = None
+        self.trend_down = None
+        self.trend = 0
+        self.entry = 0
+        self.last_entry = 0
+        self.open_time = None
+
+    def _step(self, o, h, l, c):
+        last = self.heikin_ashi.value
+        bar = self.heikin_ashi.peek(o, h, l, c)
+        if last is None:
+            return bar, None, None, None, self.trend, 0, self.last_entry
+
+        _, h_h, h_l, h_c = bar
+        hl2 = (h_h + h_l) / 2
+        atr = self.factor * true_range(h_h, h_l, last[3])
+        if self.trend_up is None:
+            # trading_signal starts both bands at 0
+            trend_up = trend_down = 0.0
+        else:
+            up, dn = hl2 - atr, hl2 + atr
+            trend_up = max(up, self.trend_up) if self.prev_close > self.trend_up else up
+            trend_down = min(dn, self.trend_down) if self.prev_close < self.trend_down else dn
+
+        if h_c > trend_down:
+            trend = 1
+        elif h_c < trend_up:
+            trend = -1
+        else:
+            trend = self.trend
+
+        entry = 0
+        if trend == 1 and self.trend == -1:
+            entry = 1
+        elif trend == -1 and self.trend == 1:
+            entry = -1
+        return bar, last[3], trend_up, trend_down, trend, entry, entry or self.last_entry
+
+    def _output(self, entry, last_entry):
+        return last_entry if self.use_last else entry
+
+    def peek(self, o, h, l, c):
+        *_, entry, last_entry = self._step(o, h, l, c)
+        return self._output(entry, last_entry)
+
+    def update(self, o, h, l, c):
+        (self.heikin_ashi.value, self.prev_close, self.trend_up, self.trend_down, self.trend, self.entry,
+         self.last_entry) = self._step(o, h, l, c)
+        return self._output(self.entry, self.last_entry)
+
+    # the entry of the last closed candle
+    @property
+    def value(self):
+        return self._output(self.entry, self.last_entry)
+
+    # commit a closed candle (a row in the market_data column layout)
+    def update_bar(self, bar):
+        with self.lock:
+            self.update(bar[OPEN], bar[HIGH], bar[LOW], bar[CLOSE])
+            self.open_time = bar[OPEN_TIME]
+
+    # rebuild from a candle buffer, every row but the last (still open) candle is committed
+    def seed(self, buffer):
+        data = buffer.snapshot()
+        with self.lock:
+            self.reset()
+            for i in range(data.shape[1] - 1):
+                self.update(data[OPEN, i], data[HIGH, i], data[LOW, i], data[CLOSE, i])
+            if data.shape[1] > 1:
+                self.open_time = data[OPEN_TIME, -2]
+
+    # keep the signal in step with a market_data.CandleBuffer
+    def attach(self, buffer):
+        buffer.on_seed(self.seed)
+        buffer.on_close(lambda b: self.update_bar(b.last()))
+        if buffer.count:
+            self.seed(buffer)
+        return self
@@ -0,0 +1,171 @@
+import csv
+import io
+import os
+import queue
+import threading
+
+import numpy as np
+
+# trade_log.csv columns. The first nine are the original log_trade columns, older logs without
+# pnl and fee are upgraded once when the journal opens them
+LOG_COLUMNS = ["market", "leverage", "qty", "cause", "side", "time", "trigger_price", "type", "market_price",
+               "pnl", "fee"]
+NUMERIC_COLUMNS = ["leverage", "qty", "side", "time", "trigger_price", "market_price", "pnl", "fee"]
+
+
+# Append-only trade log. Each row is one write to the end of the file, so logging costs the same however
+# long the log is and a crash can at worst leave a partial last line, which load_journal skips.
+# With background=True rows are queued and written by a thread that flushes every flush_interval seconds.
+class TradeJournal:
+    def __init__(self, path="trade_log.csv", background=False, flush_interval=1.0):
+        self.path = path
+        self.background = background
+        self.flush_interval = flush_interval
+        self.columns = self._prepare()
+        self._file = open(path, "a", newline="")
+        # "\n" like the header, csv would end the rows with "\r\n"
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore", lineterminator="\n")
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name="trade-journal", daemon=True)
+            self._thread.start()
+
+    # make sure the file exists, ends with a complete line and has every column
+    def _prepare(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, "w", newline="") as f:
+                f.write(",".join(LOG_COLUMNS) + "\n")
+            return list(LOG_COLUMNS)
+
+        with open(self.path, "rb+") as f:
+            header = f.readline().decode().strip().split(",")
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n" and not self._truncate_partial_line(f):
+                header = list(LOG_COLUMNS)
+
+        missing = [column for column in LOG_COLUMNS if column not in header]
+        if missing:
+            self._upgrade(header + missing)
+            header = header + missing
+        return header
+
+    # drop a partial last row left by a crash mid-write. returns False if the header itself was partial
+    # and the file had to be started again
+    def _truncate_partial_line(self, f):
+        size = f.tell()
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                f.truncate(position - step + newline + 1)
+                return True
+            position -= step
+        # not even the header is complete
+        f.seek(0)
+        f.truncate()
+        f.write((",".join(LOG_COLUMNS) + "\n").encode())
+        return False
+
+    # one-off rewrite of a log written before columns were added
+    def _upgrade(self, columns):
+        upgraded = self.path + ".upgrade"
+        with open(self.path, newline="") as src, open(upgraded, "w", newline="") as dst:
+            writer = csv.DictWriter(dst, fieldnames=columns, lineterminator="\n")
+            writer.writeheader()
+            for row in csv.DictReader(src):
+                writer.writerow(row)
+        os.replace(upgraded, self.path)
+
+    def _write(self, row):
+        with self._lock:
+            self._writer.writerow(row)
+
+    def _run(self):
+        while True:
+            try:
+                row = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.flush()
+                continue
+            if row is None:
+                break
+            self._write(row)
+            # drain whatever else is queued before flushing
+            while True:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    self.flush()
+                    return
+                self._write(row)
+            self.flush()
+
+    def append(self, row):
+        if self._queue is not None:
+            self._queue.put(row)
+        else:
+            self._write(row)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+        self.flush()
+        self._file.close()
+
+
+# load a trade log into a dict of column arrays. numeric columns are float arrays (nan when empty),
+# the rest object arrays of strings. a partial last line left by a crash is ignored
+def load_journal(path="trade_log.csv"):
+    import pandas as pd
+    with open(path, "rb") as f:
+        content = f.read()
+    content = content[:content.rfind(b"\n") + 1]
+    df = pd.read_csv(io.BytesIO(content), dtype=str, keep_default_na=False)
+    arrays = {}
+    for column in df.columns:
+        if column in NUMERIC_COLUMNS:
+            arrays[column] = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+        else:
+            arrays[column] = df[column].to_numpy(dtype=object)
+    return arrays
+
+
+# rows of a loaded journal that match every given column value, e.g. select(log, market="ETHUSDT")
+def select(journal, **where):
+    size = len(next(iter(journal.values()))) if journal else 0
+    mask = np.ones(size, dtype=bool)
+    for column, value in where.items():
+        mask &= journal[column] == value
+    return {column: values[mask] for column, values in journal.items()}
+
+
+# per market trade count, realised pnl, fees and first/last trade time of a loaded journal
+def summarise_markets(journal):
+    summary = {}
+    markets = journal.get("market", np.array([], dtype=object))
+    for market in np.unique(markets):
+        rows = select(journal, market=market)
+        pnl = rows.get("pnl", np.array([]))
+        fee = rows.get("fee", np.array([]))
+        summary[market] = {
+            'trades': len(rows["market"]),
+            'pnl': float(np.nansum(pnl)),
+            'fees': float(np.nansum(fee)),
+            'first_time': float(np.nanmin(rows["time"])) if len(rows["time"]) else np.nan,
+            'last_time': float(np.nanmax(rows["time"])) if len(rows["time"]) else np.nan,
+        }
+    return summary
@@ -0,0 +1,376 @@
+import io
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+import websocket
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# column layout of every candle buffer. open time is kept as a float, ms timestamps are exact in a float64
+OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME, TRADES = range(7)
+COLUMNS = ("open_time", "open", "high", "low", "close", "volume", "trades")
+
+# kline intervals in milliseconds. 1w and 1M are left out, their candles don't align to the epoch
+INTERVALS = {"1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000, "30m": 1800000, "1h": 3600000,
+             "2h": 7200000, "4h": 14400000, "6h": 21600000, "8h": 28800000, "12h": 43200000, "1d": 86400000}
+
+# a REST kline row is [open time, open, high, low, close, volume, close time, quote volume, trades,
+# taker buy volume, taker buy quote volume, ignore], these are the positions of the columns above
+KLINE_FIELDS = 12
+KLINE_COLUMNS = (0, 1, 2, 3, 4, 5, 8)
+
+
+# Parse a raw /fapi/v1/klines response body into the column layout, shape (len(COLUMNS), n).
+# The payload only holds numbers and quoted numbers, so with one row per line and the brackets and quotes
+# dropped it is a csv that numpy's C reader parses, converting only the used fields. There is no json parse,
+# no model object per candle and no intermediate lists or dataframe.
+# Pass out (shape (len(COLUMNS), n)) to parse into a preallocated array
+def parse_klines(payload, out=None):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    payload = payload.translate(None, b'" \t\r\n').replace(b"],[", b"\n").translate(None, b"[]")
+    if payload.strip():
+        rows = np.loadtxt(io.BytesIO(payload), delimiter=",", usecols=KLINE_COLUMNS, ndmin=2)
+    else:
+        rows = np.empty((0, len(COLUMNS)))
+    if out is None:
+        out = np.empty((len(COLUMNS), len(rows)))
+    out[:] = rows.T
+    return out
+
+
+# the column layout from candle objects as the binance_f client returns them
+def candles_to_array(candles):
+    rows = [(candle.openTime, candle.open, candle.high, candle.low, candle.close, candle.volume,
+             getattr(candle, "numTrades", 0)) for candle in candles]
+    return np.array(rows, dtype=float).reshape(-1, len(COLUMNS)).T.copy()
+
+
+# candles of a market as a column layout array, the newest `limit` (up to end_time) or `limit` from start_time on.
+# from the raw payload when the client can return it (exchange.ExchangeClient), else from the binance_f candle objects
+def fetch_candles(client, symbol, interval="1m", limit=1000, start_time=None, end_time=None):
+    if hasattr(client, "klines_raw"):
+        with metrics.timer("bot_candle_parse_seconds", source="raw"):
+            return parse_klines(client.klines_raw(symbol, interval=interval, limit=limit, start_time=start_time,
+                                                  end_time=end_time))
+    candles = client.get_candlestick_data(symbol, interval=interval, startTime=start_time, endTime=end_time,
+                                          limit=limit)
+    with metrics.timer("bot_candle_parse_seconds", source="rest"):
+        return candles_to_array(candles)
+
+
+# combine 1m candles into candles of interval_ms, aligned to the epoch like binance does
+def aggregate(data, interval_ms):
+    if interval_ms == 60000 or data.shape[1] == 0:
+        return data
+    keys = data[OPEN_TIME] // interval_ms
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], data.shape[1]] - 1
+    out = np.empty((len(COLUMNS), len(starts)))
+    out[OPEN_TIME] = keys[starts] * interval_ms
+    out[OPEN] = data[OPEN][starts]
+    out[HIGH] = np.maximum.reduceat(data[HIGH], starts)
+    out[LOW] = np.minimum.reduceat(data[LOW], starts)
+    out[CLOSE] = data[CLOSE][ends]
+    out[VOLUME] = np.add.reduceat(data[VOLUME], starts)
+    out[TRADES] = np.add.reduceat(data[TRADES], starts)
+    return out
+
+
+# talib.abstract inputs ({"open": ..., "volume": ...}) from a column layout array, as views of its rows,
+# or from a dataframe in the bot_functions.to_dataframe layout
+def candle_inputs(data):
+    if not isinstance(data, np.ndarray):
+        return {name: data[name].to_numpy(dtype=float) for name in COLUMNS[OPEN:TRADES]}
+    return {name: data[column] for column, name in enumerate(COLUMNS) if OPEN <= column < TRADES}
+
+
+# Fixed size ring buffer of candles for one market/interval.
+# Every row is written twice (at pos and pos + size) so the newest `count` candles are always one
+# contiguous slice of the backing array, which lets indicators read them without copying or rolling.
+class CandleBuffer:
+    def __init__(self, size=1000):
+        self.size = size
+        self.count = 0
+        self.lock = threading.Lock()
+        self._data = np.zeros((len(COLUMNS), 2 * size))
+        self._next = 0
+        self._on_close = []
+        self._on_seed = []
+        self._closed_time = 0
+
+    # register a function called with (buffer) every time a candle closes
+    def on_close(self, func):
+        self._on_close.append(func)
+
+    # register a function called with (buffer) every time the buffer is re-seeded from REST
+    def on_seed(self, func):
+        self._on_seed.append(func)
+
+    def _write(self, pos, row):
+        self._data[:, pos] = row
+        self._data[:, pos + self.size] = row
+
+    def _append(self, row):
+        self._write(self._next, row)
+        self._next = (self._next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def last_open_time(self):
+        if self.count == 0:
+            return 0
+        return int(self._data[OPEN_TIME, (self._next - 1) % self.size])
+
+    # replace the buffer content with candles returned by the REST api, either a column layout array
+    # (fetch_candles, parse_klines) or the binance_f candle objects
+    def seed(self, candles):
+        data = candles if isinstance(candles, np.ndarray) else candles_to_array(candles)
+        data = data[:, -self.size:]
+        with self.lock:
+            count = data.shape[1]
+            self._data[:, :count] = data
+            self._data[:, self.size:self.size + count] = data
+            self.count = count
+            self._next = count % self.size
+            self._closed_time = 0
+        for func in self._on_seed:
+            func(self)
+
+    # apply one kline ("k" object) from the websocket stream. returns True if the candle closed
+    def update(self, kline):
+        row = (float(kline["t"]), float(kline["o"]), float(kline["h"]), float(kline["l"]),
+               float(kline["c"]), float(kline["v"]), float(kline.get("n", 0)))
+        last = self.last_open_time()
+        if self.count and row[OPEN_TIME] > last != self._closed_time:
+            # the previous candle closed without us seeing its final message, e.g. the in-progress candle of a seed
+            self._notify_close()
+
+        with self.lock:
+            if self.count and row[OPEN_TIME] == last:
+                self._write((self._next - 1) % self.size, row)
+            elif row[OPEN_TIME] > last:
+                self._append(row)
+            else:
+                # stale message from before the last seed, ignore it
+                return False
+
+        closed = bool(kline.get("x", False))
+        if closed:
+            self._notify_close()
+        return closed
+
+    def _notify_close(self):
+        self._closed_time = self.last_open_time()
+        for func in self._on_close:
+            func(self)
+
+    # zero-copy view of the newest candles, shape (len(COLUMNS), count).
+    # only safe to use while holding self.lock as the stream thread keeps writing into it
+    def view(self):
+        start = (self._next - self.count) % self.size
+        return self._data[:, start:start + self.count]
+
+    # copy of the newest candle as one row of the column layout
+    def last(self):
+        with self.lock:
+            return self._data[:, (self._next - 1) % self.size].copy()
+
+    def snapshot(self):
+        with self.lock:
+            return self.view().copy()
+
+    # same frame layout as bot_functions.to_dataframe, so scalp can consume it as is
+    def to_dataframe(self):
+        import pandas as pd
+        data = self.snapshot()
+        return pd.DataFrame({
+            'open': data[OPEN],
+            'high': data[HIGH],
+            'low': data[LOW],
+            'close': data[CLOSE],
+            'volume': data[VOLUME],
+        })
+
+
+# Keeps candle buffers for a market current from the binance kline websocket streams.
+# Buffers are seeded from REST once, and again after every reconnect so no candles are lost while offline,
+# through exchange (an exchange.ExchangeClient) when one is given so the raw payload is parsed directly.
+# With a candle_store.CandleStore the seed is read from disk after downloading only the candles it is missing,
+# and every candle the stream sees close is appended to it.
+# With resample=True only the 1m candles are streamed, the other intervals are seeded from REST as usual and
+# then built from the 1m stream (resampler.Resampler).
+class MarketData:
+    def __init__(self, client, market="ETHUSDT", intervals=("1m",), size=1000, url="wss://fstream.binance.com",
+                 exchange=None, store=None, resample=False):
+        self.client = client
+        self.exchange = exchange
+        self.store = store
+        self.market = market
+        self.intervals = list(dict.fromkeys(list(intervals) + (["1m"] if resample else [])))
+        self.size = size
+        self.url = url
+        self.buffers = {interval: self.new_buffer(interval) for interval in self.intervals}
+        self.resampler = None
+        if resample:
+            # resampler builds on this module
+            from resampler import Resampler
+            self.resampler = Resampler(self.buffers)
+        self.indicators = {}
+        self.mark_price = 0.0
+        self.stream = None
+        self._on_mark_price = []
+
+    # the buffer of one interval, subclasses can keep candles elsewhere (market_hub keeps them in shared memory)
+    def new_buffer(self, interval):
+        return CandleBuffer(self.size)
+
+    def streams(self):
+        symbol = self.market.lower()
+        streams = [f"{symbol}@kline_{interval}" for interval in self.intervals
+                   if self.resampler is None or interval == "1m"]
+        streams.append(f"{symbol}@markPrice@1s")
+        return streams
+
+    def seed(self):
+        client = self.exchange or self.client
+        for interval, buffer in self.buffers.items():
+            if self.store is not None:
+                buffer.seed(self.store.recent(client, self.market, interval, self.size))
+            else:
+                buffer.seed(fetch_candles(client, self.market, interval, self.size))
+        if self.resampler is not None:
+            self.resampler.seed(self.buffers["1m"].snapshot())
+        self._set_mark_price(float(self.client.get_mark_price(self.market).markPrice))
+
+    def buffer(self, interval):
+        return self.buffers[interval]
+
+    # register a function called with (market, mark price) for every mark price update and seed
+    def on_mark_price(self, func):
+        self._on_mark_price.append(func)
+
+    def _set_mark_price(self, price):
+        self.mark_price = price
+        for func in self._on_mark_price:
+            func(self.market, price)
+
+    # keep a streaming indicator engine (e.g. indicators.ScalpIndicators) per interval
+    def track_indicators(self, factory, intervals=None):
+        for interval in intervals or self.intervals:
+            self.indicators[interval] = factory().attach(self.buffers[interval])
+        return self
+
+    def dataframe(self, interval):
+        return self.buffers[interval].to_dataframe()
+
+    # apply one stream event (the "data" part of a combined stream message)
+    def handle_event(self, data):
+        event = data.get("e")
+        if event == "kline":
+            kline = data["k"]
+            # the higher intervals first, so they include the minute by the time its close is reported
+            if self.resampler is not None and kline["i"] == "1m":
+                self.resampler.update(kline)
+            buffer = self.buffers.get(kline["i"])
+            if buffer is not None and buffer.update(kline) and self.store is not None:
+                self.store.append(self.market, kline["i"], buffer.last()[:, None])
+        elif event == "markPriceUpdate":
+            self._set_mark_price(float(data["p"]))
+
+    def handle_message(self, message):
+        message = json.loads(message)
+        self.handle_event(message.get("data", message))
+
+    # stream this market on its own connection. use MarketStream directly to share one between markets
+    def start(self, timeout=30):
+        self.stream = MarketStream([self], url=self.url).start(timeout)
+        return self
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+
+
+# One combined stream connection feeding the MarketData of any number of markets.
+# Binance allows up to 200 streams per connection, each market uses one per interval plus its mark price.
+class MarketStream:
+    def __init__(self, feeds, url="wss://fstream.binance.com"):
+        self.feeds = {feed.market: feed for feed in feeds}
+        self.url = url
+        self.connected = threading.Event()
+        # set once the first connection either seeded every feed or failed to
+        self.opened = threading.Event()
+        self.error = None
+        self._ws = None
+        self._thread = None
+        self._running = False
+
+    def stream_url(self):
+        streams = [stream for feed in self.feeds.values() for stream in feed.streams()]
+        return f"{self.url}/stream?streams={'/'.join(streams)}"
+
+    # parse and apply one message, candle close callbacks (indicator updates) included in the time
+    def handle_message(self, message):
+        with metrics.timer("bot_stream_message_seconds", stream="market"):
+            message = json.loads(message)
+            data = message.get("data", message)
+            feed = self.feeds.get(data.get("s"))
+            if feed is not None:
+                feed.handle_event(data)
+
+    # seed before the first message is applied. a failed seed drops the connection, the next one seeds again
+    def _on_open(self, ws):
+        try:
+            for feed in self.feeds.values():
+                feed.seed()
+        except Exception as e:
+            logger.error(f"seeding the market data failed: {e}", exc_info=True)
+            self.error = e
+            self.opened.set()
+            ws.close()
+            return
+        self.error = None
+        self.connected.set()
+        self.opened.set()
+
+    def _on_message(self, ws, message):
+        self.handle_message(message)
+
+    def _on_close(self, ws, status, reason):
+        self.connected.clear()
+
+    def _run(self):
+        while self._running:
+            self._ws = websocket.WebSocketApp(self.stream_url(),
+                                              on_open=self._on_open,
+                                              on_message=self._on_message,
+                                              on_close=self._on_close)
+            self._ws.run_forever(ping_interval=60, ping_timeout=10)
+            self.connected.clear()
+            if self._running:
+                time.sleep(1)
+
+    # seed every feed and start streaming in a background thread.
+    # waits for the first connection so callers can read the buffers straight away, and raises (the seed's
+    # exception, or TimeoutError when the socket doesn't open in time) rather than hand back empty buffers
+    def start(self, timeout=30):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="market-stream", daemon=True)
+        self._thread.start()
+        if not self.opened.wait(timeout):
+            self.stop()
+            raise TimeoutError(f"the market stream didn't connect within {timeout}s")
+        if self.error is not None:
+            self.stop()
+            raise self.error
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._ws is not None:
+            self._ws.close()
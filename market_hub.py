@@ -0,0 +1,425 @@
+import argparse
+import atexit
+import logging
+import os
+import secrets
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+import bot_functions as bf
+import config as cfg
+from market_data import CandleBuffer, COLUMNS, MarketData, MarketStream
+
+logger = logging.getLogger(__name__)
+
+# One process owns the exchange connections and writes every market's candles and mark price into shared
+# memory, any number of worker processes read them from there. Talib and pandas hold the GIL, so one process
+# only ever uses one core for signals. With the hub, every worker process (a group of markets or a strategy
+# variant) gets its own core while the candles are downloaded and streamed once for all of them.
+# A buffer is a shared memory segment with the CandleBuffer layout after a 64 byte header, so workers read
+# the candles where the hub wrote them, nothing is serialized or copied between processes. Workers connect
+# to the hub's socket for the segment layout and a small message every time a candle closes, a buffer
+# is re-seeded or the mark price changes, which runs the same on_close / on_seed / on_mark_price callbacks a
+# CandleBuffer or MarketData does.
+# Messages from the hub are unpickled by the workers, so the socket only takes connections that know the key:
+# settings.json "market_hub_authkey", or else a random one the hub writes to KEY_FILE (readable by its user
+# only) for the workers started after it. There is no default key.
+
+PREFIX = "bothub"
+ADDRESS = ("127.0.0.1", 6100)
+KEY_FILE = "market_hub.key"
+
+# a worker's read spins this many times while the hub writes, then yields, then sleeps between tries
+READ_SPINS = 100
+READ_YIELDS = 1000
+READ_TIMEOUT = 1.0
+
+# int64 header fields, the mark price is stored as a float64 at MARK_PRICE
+HEADER_SIZE = 64
+SEQUENCE, COUNT, NEXT, SIZE, MARK_PRICE = range(5)
+
+
+# segments this process created, attaching to one of them must leave its resource tracker entry alone
+_created = set()
+
+
+def segment_name(prefix, market, interval):
+    return f"{prefix}_{market}_{interval}"
+
+
+# The writer's lock of a shared buffer. The sequence number is odd while a write is in progress, readers in
+# other processes retry when it was odd or changed while they read (a seqlock), so they never block the hub
+class SequenceLock:
+    def __init__(self, header):
+        self.header = header
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.header[SEQUENCE] += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.header[SEQUENCE] += 1
+        self.lock.release()
+        return False
+
+
+# A CandleBuffer in a shared memory segment. The hub creates it (create=True) and writes it through the
+# CandleBuffer methods, workers attach to it by name read only
+class SharedCandleBuffer(CandleBuffer):
+    def __init__(self, name, size=1000, create=False):
+        nbytes = HEADER_SIZE + len(COLUMNS) * 2 * size * 8
+        if create:
+            try:
+                self.memory = SharedMemory(name, create=True, size=nbytes)
+            except FileExistsError:
+                # left behind by a hub that didn't shut down cleanly
+                SharedMemory(name).unlink()
+                self.memory = SharedMemory(name, create=True, size=nbytes)
+            _created.add(name)
+        else:
+            self.memory = SharedMemory(name)
+            # the resource tracker would unlink the segment when this worker exits, it belongs to the hub
+            if os.name == "posix" and name not in _created:
+                resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.name = name
+        self.writer = create
+        self.header = np.ndarray((HEADER_SIZE // 8,), dtype=np.int64, buffer=self.memory.buf)
+        if create:
+            self.header[:] = 0
+            self.header[SIZE] = size
+        self.size = int(self.header[SIZE])
+        self._data = np.ndarray((len(COLUMNS), 2 * self.size), dtype=np.float64, buffer=self.memory.buf,
+                                offset=HEADER_SIZE)
+        self._mark_price = np.ndarray((1,), dtype=np.float64, buffer=self.memory.buf, offset=MARK_PRICE * 8)
+        if not create:
+            self._data.flags.writeable = False
+        self.lock = SequenceLock(self.header) if create else threading.Lock()
+        self._on_close = []
+        self._on_seed = []
+        self._closed_time = 0
+        self._closing = threading.local()
+
+    @property
+    def count(self):
+        return int(self.header[COUNT])
+
+    @count.setter
+    def count(self, value):
+        self.header[COUNT] = value
+
+    @property
+    def _next(self):
+        return int(self.header[NEXT])
+
+    @_next.setter
+    def _next(self, value):
+        self.header[NEXT] = value
+
+    @property
+    def mark_price(self):
+        return float(self._mark_price[0])
+
+    @mark_price.setter
+    def mark_price(self, value):
+        self._mark_price[0] = value
+
+    # func() run on a consistent state of the buffer, retried while the hub writes to it. A write takes
+    # microseconds, so a read spins first, then gives up the core, and raises if the buffer stays mid-write,
+    # e.g. the hub died during one
+    def _read(self, func):
+        if self.writer:
+            with self.lock.lock:
+                return func()
+        deadline = None
+        attempts = 0
+        while True:
+            sequence = int(self.header[SEQUENCE])
+            if sequence % 2 == 0:
+                result = func()
+                if int(self.header[SEQUENCE]) == sequence:
+                    return result
+            attempts += 1
+            if attempts < READ_SPINS:
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + READ_TIMEOUT
+            elif time.monotonic() > deadline:
+                raise TimeoutError(f"{self.name} is still being written after {READ_TIMEOUT}s")
+            time.sleep(0 if attempts < READ_YIELDS else 0.001)
+
+    def last_open_time(self):
+        return self._read(super().last_open_time)
+
+    # in a close callback of a worker this is the candle that closed, the hub may have started the next one
+    def last(self):
+        row = getattr(self._closing, "row", None)
+        if row is not None:
+            return row.copy()
+        return self._read(lambda: self._data[:, (self._next - 1) % self.size].copy())
+
+    def snapshot(self):
+        return self._read(lambda: self.view().copy())
+
+    # run the callbacks of a close (with the row that closed) or a seed the hub reported
+    def notify(self, event, row=None):
+        if event == "close":
+            self._closing.row = np.array(row)
+            try:
+                self._notify_close()
+            finally:
+                self._closing.row = None
+        elif event == "seed":
+            for func in self._on_seed:
+                func(self)
+
+    def close(self):
+        self._data = self._mark_price = self.header = None
+        self.memory.close()
+        if self.writer:
+            self.memory.unlink()
+
+
+# The hub's MarketData: the buffers are shared memory segments and the mark price is written to all of them
+class HubMarketData(MarketData):
+    def __init__(self, client, market="ETHUSDT", intervals=("1m",), size=1000, url="wss://fstream.binance.com",
+                 exchange=None, store=None, resample=False, prefix=PREFIX):
+        self.prefix = prefix
+        super().__init__(client, market, intervals, size, url, exchange, store, resample)
+
+    def new_buffer(self, interval):
+        return SharedCandleBuffer(segment_name(self.prefix, self.market, interval), self.size, create=True)
+
+    @property
+    def mark_price(self):
+        return next(iter(self.buffers.values())).mark_price
+
+    @mark_price.setter
+    def mark_price(self, value):
+        for buffer in self.buffers.values():
+            buffer.mark_price = value
+
+
+# A worker's read only view of one market in the hub, usable wherever the bot takes a MarketData
+# (get_multi_scale_signal, Scheduler.on_candle_close, track_indicators)
+class SharedMarketData:
+    def __init__(self, market, intervals, prefix=PREFIX):
+        self.market = market
+        self.intervals = list(intervals)
+        self.buffers = {interval: SharedCandleBuffer(segment_name(prefix, market, interval))
+                        for interval in self.intervals}
+        self.indicators = {}
+        self._on_mark_price = []
+
+    @property
+    def mark_price(self):
+        return next(iter(self.buffers.values())).mark_price
+
+    # register a function called with (market, mark price) every time the hub reports a new mark price
+    def on_mark_price(self, func):
+        self._on_mark_price.append(func)
+
+    def notify_mark_price(self, price):
+        for func in self._on_mark_price:
+            func(self.market, price)
+
+    def buffer(self, interval):
+        return self.buffers[interval]
+
+    def track_indicators(self, factory, intervals=None):
+        for interval in intervals or self.intervals:
+            self.indicators[interval] = factory().attach(self.buffers[interval])
+        return self
+
+    def dataframe(self, interval):
+        return self.buffers[interval].to_dataframe()
+
+    def close(self):
+        for buffer in self.buffers.values():
+            buffer.close()
+
+
+# Without an authkey the hub makes a random one, hand hub.authkey to the workers (see hub_key)
+class MarketHub:
+    def __init__(self, client, markets, size=1000, url="wss://fstream.binance.com", exchange=None, store=None,
+                 address=ADDRESS, authkey=None, prefix=PREFIX, resample=False):
+        self.prefix = prefix
+        # markets is {market: intervals}
+        self.feeds = {market: HubMarketData(client, market, intervals, size, url, exchange, store, resample, prefix)
+                      for market, intervals in markets.items()}
+        self.url = url
+        self.address = address
+        self.authkey = authkey or secrets.token_bytes(32)
+        self.connections = []
+        self.lock = threading.Lock()
+        self.listener = None
+        self.stream = None
+        for feed in self.feeds.values():
+            for interval, buffer in feed.buffers.items():
+                buffer.on_close(lambda b, market=feed.market, interval=interval:
+                                self.broadcast(("close", market, interval, b.last().tolist())))
+                buffer.on_seed(lambda b, market=feed.market, interval=interval:
+                               self.broadcast(("seed", market, interval, None)))
+            feed.on_mark_price(lambda market, price: self.broadcast(("mark", market, None, price)))
+
+    def layout(self):
+        return {"prefix": self.prefix, "markets": {market: feed.intervals for market, feed in self.feeds.items()}}
+
+    def broadcast(self, message):
+        with self.lock:
+            for connection in list(self.connections):
+                try:
+                    connection.send(message)
+                except (OSError, ValueError):
+                    self.connections.remove(connection)
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                # closed by stop()
+                return
+            except Exception as e:
+                logger.warning(f"market hub refused a worker: {e}")
+                continue
+            with self.lock:
+                connection.send(self.layout())
+                self.connections.append(connection)
+
+    # seed and stream every market, then let workers connect
+    def start(self, timeout=30):
+        self.stream = MarketStream(list(self.feeds.values()), url=self.url).start(timeout)
+        self.listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, name="market-hub", daemon=True).start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+        if self.listener is not None:
+            self.listener.close()
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        for feed in self.feeds.values():
+            for buffer in feed.buffers.values():
+                if buffer.header is not None:
+                    buffer.close()
+
+
+# A worker's connection to the hub: attaches to the markets it asks for and runs their buffers' callbacks
+# when the hub reports a closed candle or a re-seed, and their mark price callbacks, from a background thread
+class HubClient:
+    def __init__(self, address=ADDRESS, authkey=None):
+        if not authkey:
+            raise ValueError("the market hub key is needed to connect to it")
+        self.connection = Client(address, authkey=authkey)
+        self.layout = self.connection.recv()
+        self.feeds = {}
+        self.connected = threading.Event()
+
+    def market_data(self, market):
+        feed = self.feeds.get(market)
+        if feed is None:
+            feed = self.feeds[market] = SharedMarketData(market, self.layout["markets"][market],
+                                                         self.layout["prefix"])
+        return feed
+
+    def _run(self):
+        while True:
+            try:
+                event, market, interval, row = self.connection.recv()
+            except (EOFError, OSError):
+                logger.error("lost the connection to the market hub")
+                self.connected.clear()
+                return
+            feed = self.feeds.get(market)
+            if feed is None:
+                continue
+            if event == "mark":
+                feed.notify_mark_price(row)
+            elif interval in feed.buffers:
+                feed.buffers[interval].notify(event, row)
+
+    def start(self):
+        self.connected.set()
+        threading.Thread(target=self._run, name="market-hub-client", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.connection.close()
+        for feed in self.feeds.values():
+            feed.close()
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(":")
+    return host or ADDRESS[0], int(port)
+
+
+# the key of a hub: settings.json "market_hub_authkey", or the one the hub wrote to the key file
+# ("market_hub_keyfile", KEY_FILE by default). raises if there is neither, a worker must not guess
+def read_key(settings):
+    authkey = getattr(settings, "market_hub_authkey", None)
+    if authkey:
+        return authkey.encode()
+    path = getattr(settings, "market_hub_keyfile", KEY_FILE)
+    try:
+        with open(path) as f:
+            return bytes.fromhex(f.read().strip())
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"no market hub key: set market_hub_authkey in settings.json or start market_hub.py "
+                           f"first so it writes {path}") from e
+
+
+# the key a hub starts with: settings.json "market_hub_authkey", or a new random one written to the key file
+def hub_key(settings):
+    authkey = getattr(settings, "market_hub_authkey", None)
+    if authkey:
+        return authkey.encode()
+    authkey = secrets.token_bytes(32)
+    path = getattr(settings, "market_hub_keyfile", KEY_FILE)
+    if os.path.exists(path):
+        os.unlink(path)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+        f.write(authkey.hex())
+    return authkey
+
+
+# the hub address and key from settings.json ("market_hub", e.g. "127.0.0.1:6100") for a worker
+def hub_settings(settings=None):
+    settings = settings or cfg.getBotSettings()
+    address = getattr(settings, "market_hub", None)
+    return (parse_address(address) if address else ADDRESS), read_key(settings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream market data into shared memory for the bot workers")
+    parser.add_argument("--address", help="host:port workers connect to, settings.json market_hub by default")
+    args = parser.parse_args()
+
+    settings = cfg.getBotSettings()
+    address = args.address or getattr(settings, "market_hub", None)
+    address = parse_address(address) if address else ADDRESS
+    authkey = hub_key(settings)
+    # every interval any market trades on, plus the 1m candles scalp reads
+    markets = {market.market: market.trading_periods.split(",") + ["1m"] for market in cfg.getMarketSettings()}
+    hub = MarketHub(bf.init_client(), markets, url=getattr(settings, "ws_url", "wss://fstream.binance.com"),
+                    exchange=bf.init_exchange(), store=bf.init_candle_store(), address=address, authkey=authkey,
+                    resample=getattr(settings, "resample_candles", False))
+    hub.start()
+    print(f"market hub serving {', '.join(markets)} on {address[0]}:{address[1]}")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Counters, gauges and latency histograms for the hot path, exported in the Prometheus text format over http
+# and/or to a file that is rewritten periodically (the node_exporter textfile collector reads those).
+# Recording a value is a dict lookup and an update under a lock, cheap enough for every request and candle.
+
+# latency buckets in seconds, from half a millisecond to 10 seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+# label values escape backslash, double quote and newline, the help text only backslash and newline
+def _escape(value, quote=True):
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, key):
+        return [f"{name}{_format_labels(key)} {_format_value(self.value)}"]
+
+
+class Gauge(Counter):
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self):
+        return Timer(self)
+
+    def samples(self, name, key):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(float(bound)))])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+# context manager / decorator observing the time spent inside it
+class Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+    def __call__(self, func):
+        histogram = self.histogram
+
+        def timed(*args, **kwargs):
+            with Timer(histogram):
+                return func(*args, **kwargs)
+        return timed
+
+
+# All metrics of the process, by name and label values
+class Registry:
+    TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self):
+        self.families = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def _get(self, kind, name, labels, help="", **kwargs):
+        family = self.families.get(name)
+        key = _labels_key(labels)
+        if family is not None:
+            metric = family.get(key)
+            if metric is not None:
+                return metric
+        with self.lock:
+            family = self.families.setdefault(name, {})
+            if help or name not in self.help:
+                self.help[name] = help
+            metric = family.get(key)
+            if metric is None:
+                metric = family[key] = kind(**kwargs)
+            return metric
+
+    def counter(self, name, help="", **labels):
+        return self._get(Counter, name, labels, help)
+
+    def gauge(self, name, help="", **labels):
+        return self._get(Gauge, name, labels, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, labels, help, buckets=buckets)
+
+    # everything in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        with self.lock:
+            families = [(name, list(family.items())) for name, family in sorted(self.families.items())]
+        for name, metrics in families:
+            if not metrics:
+                continue
+            if self.help.get(name):
+                lines.append(f"# HELP {name} {_escape(self.help[name], quote=False)}")
+            lines.append(f"# TYPE {name} {self.TYPES[type(metrics[0][1])]}")
+            for key, metric in metrics:
+                lines.extend(metric.samples(name, key))
+        return "\n".join(lines) + "\n"
+
+    # write atomically, readers never see a half written file
+    def dump(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+registry = Registry()
+
+
+def timer(name, **labels):
+    return registry.histogram(name, **labels).time()
+
+
+def observe(name, value, **labels):
+    registry.histogram(name, **labels).observe(value)
+
+
+def count(name, amount=1, **labels):
+    registry.counter(name, **labels).inc(amount)
+
+
+def gauge(name, value, **labels):
+    registry.gauge(name, **labels).set(value)
+
+
+# Wraps a client so every method call is timed and counted under its method name,
+# e.g. instrument(RequestClient(...), "binance_f") times get_candlestick_data, post_order, ...
+class Instrumented:
+    def __init__(self, target, client):
+        self._target = target
+        self._client = client
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        histogram = registry.histogram("bot_rest_request_seconds", "REST request latency",
+                                       client=self._client, endpoint=name)
+        client = self._client
+
+        def call(*args, **kwargs):
+            try:
+                with Timer(histogram):
+                    return attribute(*args, **kwargs)
+            except Exception:
+                count("bot_rest_errors_total", client=client, endpoint=name)
+                raise
+        setattr(self, name, call)
+        return call
+
+
+def instrument(target, client):
+    return Instrumented(target, client)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        payload = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# serve the metrics on http://host:port/metrics from a background thread
+def serve(port=9100, host="0.0.0.0"):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# rewrite the metrics file every interval seconds from a background thread
+def start_dump(path, interval=15.0):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.dump(path)
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"could not write metrics to {path}: {e}")
+
+    threading.Thread(target=run, name="metrics-dump", daemon=True).start()
+    atexit.register(registry.dump, path)
+
+
+# start whichever exporters are configured (settings.json "metrics_port" and "metrics_file")
+def export(port=None, path=None, interval=15.0):
+    if port:
+        serve(int(port))
+    if path:
+        start_dump(path, interval)
+
+
+# Logging through a queue. Callers only put a record on the queue, one listener thread formats and writes
+# them, so logging never waits on the terminal or the disk and nothing has to swap sys.stdout around.
+# Messages for the console (singlePrint) go to stdout as they are, other log records to stderr at
+# console_level and above, and everything to the log file when one is given.
+
+CONSOLE = "bot.console"
+
+
+# QueueHandler formats a record before queueing it, in the thread that logs. The queue never leaves the
+# process, so the record can be queued as it is and formatted by the listener thread instead
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+
+
+def setup_logging(stream=None, level=logging.INFO, console_level=logging.WARNING, path=None):
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    log_queue = queue.SimpleQueue()
+    output = logging.StreamHandler(stream or sys.__stdout__)
+    output.setFormatter(logging.Formatter("%(message)s"))
+    output.addFilter(lambda record: record.name == CONSOLE)
+    errors = logging.StreamHandler(sys.__stderr__)
+    errors.setLevel(console_level)
+    errors.addFilter(lambda record: record.name != CONSOLE)
+    handlers = [output, errors]
+    if path:
+        log_file = logging.FileHandler(path)
+        log_file.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        handlers.append(log_file)
+
+    root = logging.getLogger()
+    root.handlers = [handler for handler in root.handlers if not isinstance(handler, logging.handlers.QueueHandler)]
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    console_logger = logging.getLogger(CONSOLE)
+    console_logger.handlers = [DeferredQueueHandler(log_queue)]
+    console_logger.setLevel(logging.INFO)
+    console_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return console_logger
+
+
+def _stop_logging():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_logging)
+
+
+# the console logger, set up on first use to write to stream
+def console(stream=None):
+    if _listener is None:
+        return setup_logging(stream)
+    return logging.getLogger(CONSOLE)
@@ -0,0 +1,1137 @@
+import argparse
+import base64
+import glob
+import hashlib
+import hmac
+import json
+import queue
+import random
+import re
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from market_data import OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME, TRADES, COLUMNS, INTERVALS, aggregate
+
+# Local stand-in for the Binance USDT-M futures api, so the whole bot can run offline and the order path can be
+# timed. It serves the REST endpoints the bot uses, kline/mark price streams and the user data stream from one
+# port (http:// for REST, ws:// for the streams).
+#
+# The market replays 1m candles (recorded klines or a seeded random walk). Every candle is walked in 4 ticks,
+# open -> low -> high -> close for a green candle and open -> high -> low -> close for a red one, and orders are
+# matched against each move in between: MARKET fills at the current price, STOP_MARKET at its stop price and
+# TRAILING_STOP_MARKET at its callback level, or at the new candle open when the price gaps through them.
+# With --tick-interval 0 the market only moves on POST /mock/step, which makes a run fully deterministic.
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# time of each of the 4 ticks of a candle, relative to its open
+TICK_OFFSETS = (0, 15000, 30000, 59999)
+
+FUNDING_INTERVAL = 8 * 3600000
+
+# random walk candles start here unless told otherwise (2021-01-01 UTC)
+SYNTHETIC_START = 1609459200000
+
+NONE, USER_STREAM, SIGNED = range(3)
+
+
+class MockError(Exception):
+    def __init__(self, code, msg, status=400):
+        super().__init__(f"{code}: {msg}")
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+def _bool(value):
+    return str(value).lower() == "true"
+
+
+def _fmt(value, precision=8):
+    return f"{value:.{precision}f}"
+
+
+def _required(params, *names):
+    for name in names:
+        if params.get(name) in (None, ""):
+            raise MockError(-1102, f"Mandatory parameter '{name}' was not sent, was empty/null, or malformed.")
+
+
+def _klines_weight(params):
+    limit = int(params.get("limit", 500))
+    return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+
+# (method, path) -> (MockExchange method, security, request weight, orders counted)
+ROUTES = {
+    ("GET", "/fapi/v1/ping"): ("ping", NONE, 1, 0),
+    ("GET", "/fapi/v1/time"): ("server_time", NONE, 1, 0),
+    ("GET", "/fapi/v1/exchangeInfo"): ("exchange_info", NONE, 1, 0),
+    ("GET", "/fapi/v1/klines"): ("klines", NONE, _klines_weight, 0),
+    ("GET", "/fapi/v1/premiumIndex"): ("premium_index", NONE, lambda p: 1 if "symbol" in p else 10, 0),
+    ("GET", "/fapi/v1/ticker/price"): ("ticker_price", NONE, lambda p: 1 if "symbol" in p else 2, 0),
+    ("GET", "/fapi/v1/balance"): ("balance", SIGNED, 5, 0),
+    ("GET", "/fapi/v2/balance"): ("balance", SIGNED, 5, 0),
+    ("GET", "/fapi/v1/positionRisk"): ("position_risk", SIGNED, 5, 0),
+    ("GET", "/fapi/v2/positionRisk"): ("position_risk", SIGNED, 5, 0),
+    ("POST", "/fapi/v1/leverage"): ("change_leverage", SIGNED, 1, 0),
+    ("POST", "/fapi/v1/marginType"): ("change_margin_type", SIGNED, 1, 0),
+    ("POST", "/fapi/v1/order"): ("new_order", SIGNED, 1, 1),
+    ("GET", "/fapi/v1/order"): ("get_order", SIGNED, 1, 0),
+    ("DELETE", "/fapi/v1/order"): ("cancel_order", SIGNED, 1, 0),
+    ("GET", "/fapi/v1/openOrders"): ("open_orders", SIGNED, lambda p: 1 if "symbol" in p else 40, 0),
+    ("DELETE", "/fapi/v1/allOpenOrders"): ("cancel_all_orders", SIGNED, 1, 0),
+    ("POST", "/fapi/v1/batchOrders"): ("batch_orders", SIGNED, 5,
+                                       lambda p: len(json.loads(p.get("batchOrders") or "[]"))),
+    ("POST", "/fapi/v1/listenKey"): ("new_listen_key", USER_STREAM, 1, 0),
+    ("PUT", "/fapi/v1/listenKey"): ("keepalive_listen_key", USER_STREAM, 1, 0),
+    ("DELETE", "/fapi/v1/listenKey"): ("close_listen_key", USER_STREAM, 1, 0),
+}
+
+
+# seeded geometric random walk of 1m candles in the market_data column layout
+def synthetic_klines(bars=20000, price=2000.0, volatility=0.0015, start_time=SYNTHETIC_START, seed=0):
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0.0, volatility, bars)))
+    open_ = np.r_[price, close[:-1]]
+    wicks = np.abs(rng.normal(0.0, volatility / 2, (2, bars)))
+    data = np.empty((len(COLUMNS), bars))
+    data[OPEN_TIME] = start_time + 60000 * np.arange(bars)
+    data[OPEN] = open_
+    data[HIGH] = np.maximum(open_, close) * (1 + wicks[0])
+    data[LOW] = np.minimum(open_, close) * (1 - wicks[1])
+    data[CLOSE] = close
+    data[VOLUME] = rng.gamma(2.0, 50.0, bars)
+    data[TRADES] = rng.poisson(200, bars)
+    return data
+
+
+# Request weight and order count of the current 1 minute / 10 second windows, reported in the same headers
+# binance uses. Going over a limit answers 429 until the window rolls over.
+class RateLimiter:
+    def __init__(self, weight_limit=2400, orders_10s=300, orders_1m=1200):
+        self.weight_limit = weight_limit
+        self.orders_10s = orders_10s
+        self.orders_1m = orders_1m
+        self.lock = threading.Lock()
+        self.minute = self.ten_seconds = 0
+        self.weight = self.orders_minute = self.orders_ten_seconds = 0
+
+    def _roll(self, now):
+        if int(now // 60) != self.minute:
+            self.minute = int(now // 60)
+            self.weight = self.orders_minute = 0
+        if int(now // 10) != self.ten_seconds:
+            self.ten_seconds = int(now // 10)
+            self.orders_ten_seconds = 0
+
+    def consume(self, weight, orders=0):
+        with self.lock:
+            now = time.time()
+            self._roll(now)
+            self.weight += weight
+            self.orders_minute += orders
+            self.orders_ten_seconds += orders
+            if self.weight > self.weight_limit:
+                raise MockError(-1003, f"Too many requests; current limit is {self.weight_limit} request weight "
+                                       f"per 1 MINUTE. Please use the websocket for live updates.", 429)
+            if self.orders_ten_seconds > self.orders_10s:
+                raise MockError(-1015, f"Too many new orders; current limit is {self.orders_10s} orders "
+                                       f"per 10 SECOND.", 429)
+            if self.orders_minute > self.orders_1m:
+                raise MockError(-1015, f"Too many new orders; current limit is {self.orders_1m} orders "
+                                       f"per 1 MINUTE.", 429)
+
+    def headers(self):
+        with self.lock:
+            self._roll(time.time())
+            return {"X-MBX-USED-WEIGHT-1M": str(self.weight),
+                    "X-MBX-ORDER-COUNT-10S": str(self.orders_ten_seconds),
+                    "X-MBX-ORDER-COUNT-1M": str(self.orders_minute)}
+
+    def retry_after(self):
+        return str(60 - int(time.time()) % 60)
+
+
+# One replayed market: its trading rules, candles, the candle in progress and our position in it
+class MockMarket:
+    def __init__(self, symbol, data, warmup=1500, price_precision=2, quantity_precision=3, tick_size=None,
+                 step_size=None, min_qty=None, min_notional=5.0):
+        self.symbol = symbol
+        self.price_precision = price_precision
+        self.quantity_precision = quantity_precision
+        self.tick_size = tick_size or 10.0 ** -price_precision
+        self.step_size = step_size or 10.0 ** -quantity_precision
+        self.min_qty = min_qty or self.step_size
+        self.min_notional = min_notional
+        self.data = np.array(data, dtype=np.float64)
+        for column in (OPEN, HIGH, LOW, CLOSE):
+            self.data[column] = self.round_price(self.data[column])
+        self.index = max(min(warmup, self.data.shape[1] - 1), 0)
+        self.step = 0
+        self.partial = None
+        self.price = 0.0
+        self.time = 0
+        self.leverage = 20
+        self.margin_type = "CROSSED"
+        self.amount = 0.0
+        self.entry_price = 0.0
+        self.open_bar()
+
+    @property
+    def finished(self):
+        return self.index >= self.data.shape[1]
+
+    def round_price(self, price):
+        return np.round(np.round(price / self.tick_size) * self.tick_size, self.price_precision)
+
+    # the 4 prices a candle is walked through
+    def points(self):
+        o, h, l, c = self.data[OPEN:CLOSE + 1, self.index]
+        return (o, l, h, c) if c >= o else (o, h, l, c)
+
+    def open_bar(self):
+        row = self.data[:, self.index]
+        self.partial = np.array([row[OPEN_TIME], row[OPEN], row[OPEN], row[OPEN], row[OPEN], 0.0, 0.0])
+        self.price = float(row[OPEN])
+        self.time = int(row[OPEN_TIME])
+        self.step = 1
+
+    # move to the next point of the candle, returns True if that closed it
+    def move(self):
+        row = self.data[:, self.index]
+        self.price = float(self.points()[self.step])
+        self.partial[HIGH] = max(self.partial[HIGH], self.price)
+        self.partial[LOW] = min(self.partial[LOW], self.price)
+        self.partial[CLOSE] = self.price
+        self.partial[VOLUME] = row[VOLUME] * (self.step + 1) / len(TICK_OFFSETS)
+        self.partial[TRADES] = int(row[TRADES] * (self.step + 1) / len(TICK_OFFSETS))
+        self.time = int(row[OPEN_TIME]) + TICK_OFFSETS[self.step]
+        closed = self.step == len(TICK_OFFSETS) - 1
+        self.step += 1
+        return closed
+
+    # the candle of interval_ms the current 1m candle belongs to, built from the 1m candles so far
+    def bucket(self, interval_ms):
+        open_time = self.partial[OPEN_TIME]
+        start = open_time - open_time % interval_ms
+        first = int(np.searchsorted(self.data[OPEN_TIME, :self.index], start))
+        done = self.data[:, first:self.index]
+        row = self.partial.copy()
+        if done.shape[1]:
+            row[OPEN] = done[OPEN, 0]
+            row[HIGH] = max(done[HIGH].max(), row[HIGH])
+            row[LOW] = min(done[LOW].min(), row[LOW])
+            row[VOLUME] += done[VOLUME].sum()
+            row[TRADES] += done[TRADES].sum()
+        row[OPEN_TIME] = start
+        return row
+
+    # candles of interval_ms up to and including the one in progress, like the klines endpoint returns them
+    def history(self, interval_ms, limit=500, start_time=None, end_time=None):
+        ratio = interval_ms // 60000
+        open_times = self.data[OPEN_TIME, :self.index]
+        hi = self.index
+        if start_time is not None:
+            lo = int(np.searchsorted(open_times, start_time - start_time % interval_ms))
+            hi = min(hi, lo + (limit + 1) * ratio)
+        else:
+            if end_time is not None:
+                hi = int(np.searchsorted(open_times, end_time, side="right"))
+            lo = max(0, hi - (limit + 1) * ratio)
+        if lo < hi:
+            lo = int(np.searchsorted(open_times, open_times[lo] - open_times[lo] % interval_ms))
+        data = self.data[:, lo:hi]
+        if hi == self.index and (end_time is None or self.partial[OPEN_TIME] <= end_time):
+            data = np.concatenate([data, self.partial[:, None]], axis=1)
+        candles = aggregate(data, interval_ms)
+        if start_time is not None:
+            candles = candles[:, candles[OPEN_TIME] >= start_time - start_time % interval_ms]
+        if end_time is not None:
+            candles = candles[:, candles[OPEN_TIME] <= end_time]
+        return candles[:, :limit] if start_time is not None else candles[:, -limit:]
+
+    def unrealized_pnl(self):
+        return (self.price - self.entry_price) * self.amount
+
+    # apply a fill to the position, returns the realized profit
+    def fill(self, side, qty, price):
+        amount = self.amount
+        new = round(amount + side * qty, self.quantity_precision)
+        realized = 0.0
+        if amount == 0.0 or (amount > 0) == (side > 0):
+            self.entry_price = (self.entry_price * abs(amount) + price * qty) / abs(new)
+        else:
+            closed = min(qty, abs(amount))
+            realized = (price - self.entry_price) * closed * (1 if amount > 0 else -1)
+            if new == 0.0:
+                self.entry_price = 0.0
+            elif (new > 0) != (amount > 0):
+                self.entry_price = price
+        self.amount = new
+        return realized
+
+
+class MockOrder:
+    def __init__(self, order_id, market, params, time):
+        self.order_id = order_id
+        self.symbol = market.symbol
+        self.client_order_id = params.get("newClientOrderId") or f"mock-{order_id}"
+        self.side = params["side"]
+        self.type = params["type"]
+        self.quantity = float(params.get("quantity") or 0)
+        self.stop_price = float(params.get("stopPrice") or 0)
+        self.activation_price = float(params.get("activationPrice") or 0)
+        self.callback_rate = float(params.get("callbackRate") or 0)
+        self.reduce_only = _bool(params.get("reduceOnly"))
+        self.close_position = _bool(params.get("closePosition"))
+        self.position_side = params.get("positionSide", "BOTH")
+        self.time_in_force = params.get("timeInForce", "GTC")
+        self.working_type = params.get("workingType", "CONTRACT_PRICE")
+        self.status = "NEW"
+        self.executed_qty = 0.0
+        self.avg_price = 0.0
+        self.commission = 0.0
+        self.realized_pnl = 0.0
+        self.time = self.update_time = time
+        self.activated = False
+        self.extreme = 0.0
+
+    @property
+    def sign(self):
+        return 1 if self.side == "BUY" else -1
+
+    # the price this order triggers at when the market moves from a to b, None if it doesn't
+    def check(self, a, b):
+        if self.type == "STOP_MARKET":
+            if (self.sign == 1 and b >= self.stop_price) or (self.sign == -1 and b <= self.stop_price):
+                return self.stop_price
+            return None
+        if self.type != "TRAILING_STOP_MARKET":
+            return None
+        if not self.activated:
+            if (self.sign == -1 and b >= self.activation_price) or (self.sign == 1 and b <= self.activation_price):
+                self.activated = True
+                self.extreme = b
+            return None
+        if self.sign == -1:
+            self.extreme = max(self.extreme, b)
+            level = self.extreme * (1 - self.callback_rate / 100)
+            return level if b <= level else None
+        self.extreme = min(self.extreme, b)
+        level = self.extreme * (1 + self.callback_rate / 100)
+        return level if b >= level else None
+
+    def to_json(self, market):
+        pp, qp = market.price_precision, market.quantity_precision
+        order = {"orderId": self.order_id, "symbol": self.symbol, "status": self.status,
+                 "clientOrderId": self.client_order_id, "price": "0", "avgPrice": _fmt(self.avg_price, pp + 3),
+                 "origQty": _fmt(self.quantity, qp), "executedQty": _fmt(self.executed_qty, qp),
+                 "cumQty": _fmt(self.executed_qty, qp), "cumQuote": _fmt(self.executed_qty * self.avg_price, 5),
+                 "timeInForce": self.time_in_force, "type": self.type, "reduceOnly": self.reduce_only,
+                 "closePosition": self.close_position, "side": self.side, "positionSide": self.position_side,
+                 "stopPrice": _fmt(self.stop_price, pp), "workingType": self.working_type, "priceProtect": False,
+                 "origType": self.type, "time": self.time, "updateTime": self.update_time}
+        if self.type == "TRAILING_STOP_MARKET":
+            order["activatePrice"] = _fmt(self.activation_price, pp)
+            order["priceRate"] = _fmt(self.callback_rate, 1)
+        return order
+
+    # ORDER_TRADE_UPDATE payload
+    def event(self, market, execution, now, last_qty=0.0, last_price=0.0):
+        pp, qp = market.price_precision, market.quantity_precision
+        return {"e": "ORDER_TRADE_UPDATE", "E": now, "T": now,
+                "o": {"s": self.symbol, "c": self.client_order_id, "S": self.side, "o": self.type,
+                      "f": self.time_in_force, "q": _fmt(self.quantity, qp), "p": "0",
+                      "ap": _fmt(self.avg_price, pp + 3), "sp": _fmt(self.stop_price, pp), "x": execution,
+                      "X": self.status, "i": self.order_id, "l": _fmt(last_qty, qp),
+                      "z": _fmt(self.executed_qty, qp), "L": _fmt(last_price, pp), "N": "USDT",
+                      "n": _fmt(self.commission), "T": now, "t": self.order_id if last_qty else 0,
+                      "b": "0", "a": "0", "m": False, "R": self.reduce_only, "wt": self.working_type,
+                      "ot": self.type, "ps": self.position_side, "cp": self.close_position,
+                      "AP": _fmt(self.activation_price, pp), "cr": _fmt(self.callback_rate, 1),
+                      "rp": _fmt(self.realized_pnl)}}
+
+
+# A websocket connection's streams and the messages waiting to be sent on it
+class Subscription:
+    def __init__(self, streams, combined):
+        self.streams = set(streams)
+        self.combined = combined
+        self.queue = queue.Queue()
+        self.closed = False
+
+
+# Account, markets and matching. Every REST call and every tick runs under one lock, so orders are matched
+# in the same order whatever the timing of the requests.
+class MockExchange:
+    def __init__(self, balance=1000.0, fee=0.0004, funding_rate=0.0001, latency=0.0, jitter=0.0,
+                 stream_latency=0.0, api_key=None, secret_key=None, limiter=None, seed=0):
+        self.markets = {}
+        self.wallet = balance
+        self.fee = fee
+        self.funding_rate = funding_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.stream_latency = stream_latency
+        self.api_key = api_key
+        self.secret_key = secret_key.encode() if secret_key else None
+        self.limiter = limiter or RateLimiter()
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.orders = {}
+        self.open = {}
+        self.next_order_id = 1000000
+        self.listen_key = None
+        self.subscriptions = []
+        self.stream_names = Counter()
+        self.now = 0
+
+    def add_market(self, market):
+        with self.lock:
+            self.markets[market.symbol] = market
+            self.now = max(self.now, market.time)
+        return self
+
+    def market(self, params):
+        _required(params, "symbol")
+        market = self.markets.get(params["symbol"])
+        if market is None:
+            raise MockError(-1121, "Invalid symbol.")
+        return market
+
+    # simulated network delay of one request
+    def delay(self):
+        with self.lock:
+            delay = self.latency + self.jitter * self.random.random()
+        if delay > 0:
+            time.sleep(delay)
+
+    def authenticate(self, security, api_key, params, total_params):
+        if security == NONE:
+            return
+        if self.api_key is not None and api_key != self.api_key:
+            raise MockError(-2015, "Invalid API-key, IP, or permissions for action.", 401)
+        if security != SIGNED:
+            return
+        _required(params, "timestamp", "signature")
+        if self.secret_key is not None:
+            payload = re.sub(r"&?signature=[0-9a-fA-F]*", "", total_params)
+            expected = hmac.new(self.secret_key, payload.encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, params["signature"]):
+                raise MockError(-1022, "Signature for this request is not valid.")
+
+    # streams
+
+    def subscribe(self, streams, combined):
+        subscription = Subscription(streams, combined)
+        with self.lock:
+            self.subscriptions.append(subscription)
+            self.stream_names.update(subscription.streams)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscription.closed = True
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+                self.stream_names.subtract(subscription.streams)
+
+    def close_subscriptions(self):
+        for subscription in list(self.subscriptions):
+            self.unsubscribe(subscription)
+
+    def publish(self, name, payload):
+        if not self.stream_names[name]:
+            return
+        deliver_at = time.monotonic() + self.stream_latency
+        raw = combined = None
+        for subscription in self.subscriptions:
+            if name not in subscription.streams:
+                continue
+            if subscription.combined:
+                combined = combined or json.dumps({"stream": name, "data": payload})
+                subscription.queue.put((deliver_at, combined))
+            else:
+                raw = raw or json.dumps(payload)
+                subscription.queue.put((deliver_at, raw))
+
+    def publish_user(self, payload):
+        if self.listen_key is not None:
+            self.publish(self.listen_key, payload)
+
+    def publish_market(self, market, closed):
+        symbol = market.symbol.lower()
+        for name in (f"{symbol}@markPrice", f"{symbol}@markPrice@1s"):
+            self.publish(name, {"e": "markPriceUpdate", "E": self.now, "s": market.symbol,
+                                "p": _fmt(market.price, market.price_precision),
+                                "i": _fmt(market.price, market.price_precision),
+                                "P": _fmt(market.price, market.price_precision), "r": _fmt(self.funding_rate),
+                                "T": self.next_funding_time()})
+        for interval, interval_ms in INTERVALS.items():
+            name = f"{symbol}@kline_{interval}"
+            if not self.stream_names[name]:
+                continue
+            row = market.bucket(interval_ms)
+            open_time = int(row[OPEN_TIME])
+            self.publish(name, {"e": "kline", "E": self.now, "s": market.symbol,
+                                "k": self.kline_event(market, row, interval, open_time + interval_ms - 1,
+                                                      bool(closed and (market.partial[OPEN_TIME] + 60000) % interval_ms == 0))})
+
+    @staticmethod
+    def kline_event(market, row, interval, close_time, closed):
+        pp = market.price_precision
+        return {"t": int(row[OPEN_TIME]), "T": close_time, "s": market.symbol, "i": interval, "f": 0, "L": 0,
+                "o": _fmt(row[OPEN], pp), "c": _fmt(row[CLOSE], pp), "h": _fmt(row[HIGH], pp),
+                "l": _fmt(row[LOW], pp), "v": _fmt(row[VOLUME], 3), "n": int(row[TRADES]), "x": closed,
+                "q": _fmt(row[VOLUME] * row[CLOSE], 4), "V": "0", "Q": "0", "B": "0"}
+
+    def position_event(self, market):
+        return {"s": market.symbol, "pa": _fmt(market.amount, market.quantity_precision),
+                "ep": _fmt(market.entry_price), "cr": "0", "up": _fmt(market.unrealized_pnl()),
+                "mt": "cross" if market.margin_type == "CROSSED" else "isolated", "iw": "0", "ps": "BOTH"}
+
+    # change is the balance change that isn't realized profit or commission, e.g. a funding payment
+    def account_event(self, reason, markets, change=0.0):
+        return {"e": "ACCOUNT_UPDATE", "E": self.now, "T": self.now,
+                "a": {"m": reason, "B": [{"a": "USDT", "wb": _fmt(self.wallet), "cw": _fmt(self.wallet),
+                                          "bc": _fmt(change)}],
+                      "P": [self.position_event(market) for market in markets]}}
+
+    # market simulation
+
+    def next_funding_time(self):
+        return (self.now // FUNDING_INTERVAL + 1) * FUNDING_INTERVAL
+
+    def unrealized_pnl(self):
+        return sum(market.unrealized_pnl() for market in self.markets.values())
+
+    def available_balance(self):
+        margin = sum(abs(market.amount) * market.price / market.leverage for market in self.markets.values())
+        return self.wallet + self.unrealized_pnl() - margin
+
+    # advance every market by one tick, returns False once all of them ran out of candles
+    def tick(self):
+        with self.lock:
+            funding_period = self.now // FUNDING_INTERVAL
+            running = False
+            for market in self.markets.values():
+                if market.finished:
+                    continue
+                running = True
+                price = market.price
+                closed = market.move()
+                self.now = max(self.now, market.time)
+                self.match(market, price, market.price, gap=False)
+                self.publish_market(market, closed)
+                if closed:
+                    market.index += 1
+                    if not market.finished:
+                        price = market.price
+                        market.open_bar()
+                        self.match(market, price, market.price, gap=True)
+                        self.publish_market(market, False)
+            if running and self.now // FUNDING_INTERVAL != funding_period:
+                self.apply_funding()
+            return running
+
+    def apply_funding(self):
+        markets = [market for market in self.markets.values() if market.amount != 0.0]
+        paid = sum(market.amount * market.price * self.funding_rate for market in markets)
+        self.wallet -= paid
+        if markets:
+            self.publish_user(self.account_event("FUNDING_FEE", markets, -paid))
+
+    # trigger the stop orders the move from a to b went through, nearest trigger price first
+    def match(self, market, a, b, gap):
+        triggered = []
+        for order in list(self.open.values()):
+            if order.symbol != market.symbol:
+                continue
+            level = order.check(a, b)
+            if level is not None:
+                price = b if gap else float(market.round_price(level))
+                triggered.append((abs(level - a), order, price))
+        triggered.sort(key=lambda trigger: trigger[0])
+        for _, order, price in triggered:
+            if order.status == "NEW":
+                self.execute(market, order, price)
+
+    def expire(self, market, order):
+        order.status = "EXPIRED"
+        order.update_time = self.now
+        self.open.pop(order.order_id, None)
+        self.publish_user(order.event(market, "EXPIRED", self.now))
+
+    def execute(self, market, order, price):
+        qty = order.quantity
+        if order.reduce_only or order.close_position:
+            if market.amount == 0.0 or (market.amount > 0) == (order.sign > 0):
+                self.expire(market, order)
+                return
+            qty = abs(market.amount) if order.close_position else min(qty, abs(market.amount))
+        realized = market.fill(order.sign, qty, price)
+        commission = qty * price * self.fee
+        self.wallet += realized - commission
+        order.quantity = order.quantity or qty
+        order.executed_qty = qty
+        order.avg_price = price
+        order.commission = commission
+        order.realized_pnl = realized
+        order.status = "FILLED"
+        order.update_time = self.now
+        self.open.pop(order.order_id, None)
+        self.publish_user(order.event(market, "TRADE", self.now, qty, price))
+        self.publish_user(self.account_event("ORDER", [market]))
+        # reduce only orders can't do anything once the position is gone
+        if market.amount == 0.0:
+            for other in list(self.open.values()):
+                if other.symbol == market.symbol and (other.reduce_only or other.close_position):
+                    self.expire(market, other)
+
+    def check_quantity(self, market, value):
+        try:
+            qty = Decimal(value)
+        except InvalidOperation:
+            raise MockError(-1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+        if qty != round(qty, market.quantity_precision):
+            raise MockError(-1111, "Precision is over the maximum defined for this asset.")
+        if qty <= 0:
+            raise MockError(-4003, "Quantity less than or equal to zero.")
+        if float(qty) < market.min_qty:
+            raise MockError(-4005, f"Quantity less than min quantity {market.min_qty}.")
+
+    def check_price(self, market, value):
+        if Decimal(value) != round(Decimal(value), market.price_precision):
+            raise MockError(-1111, "Precision is over the maximum defined for this asset.")
+
+    def place(self, params):
+        market = self.market(params)
+        _required(params, "side", "type")
+        if params["side"] not in ("BUY", "SELL"):
+            raise MockError(-1117, "Invalid side.")
+        if params["type"] not in ("MARKET", "STOP_MARKET", "TRAILING_STOP_MARKET"):
+            raise MockError(-1116, "Invalid orderType.")
+        if not _bool(params.get("closePosition")):
+            _required(params, "quantity")
+            self.check_quantity(market, params["quantity"])
+        if params["type"] == "STOP_MARKET":
+            _required(params, "stopPrice")
+            self.check_price(market, params["stopPrice"])
+        if params["type"] == "TRAILING_STOP_MARKET":
+            _required(params, "callbackRate")
+            if not 0.1 <= float(params["callbackRate"]) <= 10.0:
+                raise MockError(-1130, "Data sent for parameter 'callbackRate' is not valid.")
+            if params.get("activationPrice"):
+                self.check_price(market, params["activationPrice"])
+
+        order = MockOrder(self.next_order_id, market, params, self.now)
+        reduces = market.amount != 0.0 and (market.amount > 0) != (order.sign > 0)
+        if order.reduce_only and not reduces:
+            raise MockError(-2022, "ReduceOnly Order is rejected.")
+        if not (order.reduce_only or order.close_position):
+            notional = order.quantity * market.price
+            if notional < market.min_notional:
+                raise MockError(-4164, f"Order's notional must be no smaller than {market.min_notional} "
+                                       f"(unless you choose reduce only).")
+            if order.type == "MARKET" and not reduces and notional / market.leverage > self.available_balance():
+                raise MockError(-2019, "Margin is insufficient.")
+        if order.type == "STOP_MARKET" and order.check(market.price, market.price) is not None:
+            raise MockError(-2021, "Order would immediately trigger.")
+        if order.type == "TRAILING_STOP_MARKET":
+            if order.activation_price:
+                # active straight away if the price is already past the activation price
+                order.check(market.price, market.price)
+            else:
+                order.activated = True
+                order.extreme = market.price
+
+        self.next_order_id += 1
+        self.orders[order.order_id] = order
+        self.open[order.order_id] = order
+        self.publish_user(order.event(market, "NEW", self.now))
+        return market, order
+
+    # REST endpoints, each takes the request parameters and returns the response body
+
+    def ping(self, params):
+        return {}
+
+    def server_time(self, params):
+        return {"serverTime": self.now}
+
+    def exchange_info(self, params):
+        limiter = self.limiter
+        return {"timezone": "UTC", "serverTime": self.now, "futuresType": "U_MARGINED",
+                "rateLimits": [{"rateLimitType": "REQUEST_WEIGHT", "interval": "MINUTE", "intervalNum": 1,
+                                "limit": limiter.weight_limit},
+                               {"rateLimitType": "ORDERS", "interval": "MINUTE", "intervalNum": 1,
+                                "limit": limiter.orders_1m},
+                               {"rateLimitType": "ORDERS", "interval": "SECOND", "intervalNum": 10,
+                                "limit": limiter.orders_10s}],
+                "exchangeFilters": [], "assets": [{"asset": "USDT", "marginAvailable": True,
+                                                    "autoAssetExchange": "-10000"}],
+                "symbols": [self.symbol_info(market) for market in self.markets.values()]}
+
+    @staticmethod
+    def symbol_info(market):
+        pp, qp = market.price_precision, market.quantity_precision
+        return {"symbol": market.symbol, "pair": market.symbol, "contractType": "PERPETUAL",
+                "deliveryDate": 4133404800000, "onboardDate": 1569398400000, "status": "TRADING",
+                "maintMarginPercent": "2.5000", "requiredMarginPercent": "5.0000",
+                "baseAsset": market.symbol[:-4], "quoteAsset": "USDT", "marginAsset": "USDT",
+                "pricePrecision": pp, "quantityPrecision": qp, "baseAssetPrecision": 8, "quotePrecision": 8,
+                "underlyingType": "COIN", "underlyingSubType": [], "settlePlan": 0, "triggerProtect": "0.0500",
+                "liquidationFee": "0.012500", "marketTakeBound": "0.05",
+                "filters": [{"filterType": "PRICE_FILTER", "minPrice": _fmt(market.tick_size, pp),
+                             "maxPrice": "1000000", "tickSize": _fmt(market.tick_size, pp)},
+                            {"filterType": "LOT_SIZE", "stepSize": _fmt(market.step_size, qp),
+                             "minQty": _fmt(market.min_qty, qp), "maxQty": "10000"},
+                            {"filterType": "MARKET_LOT_SIZE", "stepSize": _fmt(market.step_size, qp),
+                             "minQty": _fmt(market.min_qty, qp), "maxQty": "10000"},
+                            {"filterType": "MAX_NUM_ORDERS", "limit": 200},
+                            {"filterType": "MAX_NUM_ALGO_ORDERS", "limit": 10},
+                            {"filterType": "MIN_NOTIONAL", "notional": str(market.min_notional)},
+                            {"filterType": "PERCENT_PRICE", "multiplierUp": "1.0500",
+                             "multiplierDown": "0.9500", "multiplierDecimal": 4}],
+                "orderTypes": ["MARKET", "STOP_MARKET", "TRAILING_STOP_MARKET"],
+                "timeInForce": ["GTC", "IOC", "FOK", "GTX"]}
+
+    def klines(self, params):
+        market = self.market(params)
+        _required(params, "interval")
+        interval_ms = INTERVALS.get(params["interval"])
+        if interval_ms is None:
+            raise MockError(-1120, "Invalid interval.")
+        limit = min(int(params.get("limit", 500)), 1500)
+        start_time = int(params["startTime"]) if params.get("startTime") else None
+        end_time = int(params["endTime"]) if params.get("endTime") else None
+        candles = market.history(interval_ms, limit, start_time, end_time)
+        pp = market.price_precision
+        return [[int(row[OPEN_TIME]), _fmt(row[OPEN], pp), _fmt(row[HIGH], pp), _fmt(row[LOW], pp),
+                 _fmt(row[CLOSE], pp), _fmt(row[VOLUME], 3), int(row[OPEN_TIME]) + interval_ms - 1,
+                 _fmt(row[VOLUME] * row[CLOSE], 4), int(row[TRADES]), "0", "0", "0"] for row in candles.T]
+
+    def premium_index(self, params):
+        markets = [self.market(params)] if "symbol" in params else self.markets.values()
+        result = [{"symbol": market.symbol, "markPrice": _fmt(market.price, market.price_precision),
+                   "indexPrice": _fmt(market.price, market.price_precision),
+                   "estimatedSettlePrice": _fmt(market.price, market.price_precision),
+                   "lastFundingRate": _fmt(self.funding_rate), "interestRate": "0.00010000",
+                   "nextFundingTime": self.next_funding_time(), "time": self.now} for market in markets]
+        return result[0] if "symbol" in params else result
+
+    def ticker_price(self, params):
+        markets = [self.market(params)] if "symbol" in params else self.markets.values()
+        result = [{"symbol": market.symbol, "price": _fmt(market.price, market.price_precision), "time": self.now}
+                  for market in markets]
+        return result[0] if "symbol" in params else result
+
+    def balance(self, params):
+        unrealized = self.unrealized_pnl()
+        available = self.available_balance()
+        return [{"accountAlias": "mock", "asset": "USDT", "balance": _fmt(self.wallet),
+                 "crossWalletBalance": _fmt(self.wallet), "crossUnPnl": _fmt(unrealized),
+                 "availableBalance": _fmt(available), "maxWithdrawAmount": _fmt(available),
+                 "withdrawAvailable": _fmt(available), "marginAvailable": True, "updateTime": self.now}]
+
+    def position_risk(self, params):
+        markets = [self.market(params)] if "symbol" in params else self.markets.values()
+        return [{"symbol": market.symbol, "positionAmt": _fmt(market.amount, market.quantity_precision),
+                 "entryPrice": _fmt(market.entry_price), "markPrice": _fmt(market.price, market.price_precision),
+                 "unRealizedProfit": _fmt(market.unrealized_pnl()), "liquidationPrice": "0",
+                 "leverage": str(market.leverage), "maxNotionalValue": "1000000",
+                 "marginType": "cross" if market.margin_type == "CROSSED" else "isolated",
+                 "isolatedMargin": "0.00000000", "isAutoAddMargin": "false", "positionSide": "BOTH",
+                 "notional": _fmt(market.amount * market.price), "isolatedWallet": "0", "updateTime": self.now}
+                for market in markets]
+
+    def change_leverage(self, params):
+        market = self.market(params)
+        _required(params, "leverage")
+        leverage = int(params["leverage"])
+        if not 1 <= leverage <= 125:
+            raise MockError(-4028, f"Leverage {leverage} is not valid")
+        market.leverage = leverage
+        self.publish_user({"e": "ACCOUNT_CONFIG_UPDATE", "E": self.now, "T": self.now,
+                           "ac": {"s": market.symbol, "l": leverage}})
+        return {"leverage": leverage, "maxNotionalValue": "1000000", "symbol": market.symbol}
+
+    def change_margin_type(self, params):
+        market = self.market(params)
+        _required(params, "marginType")
+        margin_type = params["marginType"].upper()
+        if margin_type not in ("CROSSED", "ISOLATED"):
+            raise MockError(-1116, "Invalid marginType.")
+        if margin_type == market.margin_type:
+            raise MockError(-4046, "No need to change margin type.")
+        if market.amount != 0.0:
+            raise MockError(-4048, "Margin type cannot be changed if there exists position.")
+        market.margin_type = margin_type
+        return {"code": 200, "msg": "success"}
+
+    # ACK answers before the fill like binance's default, RESULT once the order is done
+    def new_order(self, params):
+        market, order = self.place(params)
+        if params.get("newOrderRespType", "ACK") != "RESULT" or order.type != "MARKET":
+            response = order.to_json(market)
+            if order.type == "MARKET":
+                self.execute(market, order, market.price)
+            return response
+        self.execute(market, order, market.price)
+        return order.to_json(market)
+
+    def find_order(self, params):
+        market = self.market(params)
+        order = None
+        if params.get("orderId"):
+            order = self.orders.get(int(params["orderId"]))
+        elif params.get("origClientOrderId"):
+            order = next((o for o in self.orders.values() if o.client_order_id == params["origClientOrderId"]), None)
+        else:
+            _required(params, "orderId")
+        if order is None or order.symbol != market.symbol:
+            raise MockError(-2013, "Order does not exist.")
+        return market, order
+
+    def get_order(self, params):
+        market, order = self.find_order(params)
+        return order.to_json(market)
+
+    def cancel_order(self, params):
+        market, order = self.find_order(params)
+        if order.status != "NEW":
+            raise MockError(-2011, "Unknown order sent.")
+        self.cancel(market, order)
+        return order.to_json(market)
+
+    def cancel(self, market, order):
+        order.status = "CANCELED"
+        order.update_time = self.now
+        self.open.pop(order.order_id, None)
+        self.publish_user(order.event(market, "CANCELED", self.now))
+
+    def open_orders(self, params):
+        symbol = self.market(params).symbol if "symbol" in params else None
+        return [order.to_json(self.markets[order.symbol]) for order in self.open.values()
+                if symbol is None or order.symbol == symbol]
+
+    def cancel_all_orders(self, params):
+        market = self.market(params)
+        for order in [order for order in self.open.values() if order.symbol == market.symbol]:
+            self.cancel(market, order)
+        return {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+    def batch_orders(self, params):
+        _required(params, "batchOrders")
+        orders = json.loads(params["batchOrders"])
+        if len(orders) > 5:
+            raise MockError(-1130, "Data sent for parameter 'batchOrders' is not valid.")
+        results = []
+        for order in orders:
+            try:
+                results.append(self.new_order({key: str(value) for key, value in order.items()}))
+            except MockError as e:
+                results.append({"code": e.code, "msg": e.msg})
+        return results
+
+    def new_listen_key(self, params):
+        if self.listen_key is None:
+            self.listen_key = hashlib.sha256(f"{self.api_key}{self.random.random()}".encode()).hexdigest()
+        return {"listenKey": self.listen_key}
+
+    def keepalive_listen_key(self, params):
+        if self.listen_key is None:
+            raise MockError(-1125, "This listenKey does not exist.")
+        return {}
+
+    def close_listen_key(self, params):
+        self.listen_key = None
+        return {}
+
+    # /mock/... control endpoints, not part of the binance api
+
+    def state(self):
+        return {"time": self.now, "balance": self.wallet, "availableBalance": self.available_balance(),
+                "markets": {symbol: {"price": market.price, "candle": market.index, "finished": market.finished,
+                                     "position": market.amount, "entryPrice": market.entry_price,
+                                     "openOrders": sum(order.symbol == symbol for order in self.open.values())}
+                            for symbol, market in self.markets.items()}}
+
+    def control(self, method, path, params):
+        if path == "/mock/state":
+            return self.state()
+        if path == "/mock/step" and method == "POST":
+            for _ in range(int(params.get("ticks", 1))):
+                self.tick()
+            return self.state()
+        raise MockError(-1000, f"Unknown control path {path}", 404)
+
+    def handle(self, method, path, params, api_key=None, total_params=""):
+        with self.lock:
+            if path.startswith("/mock/"):
+                return self.control(method, path, params)
+            route = ROUTES.get((method, path))
+            if route is None:
+                raise MockError(-1000, f"Path {method} {path} not found", 404)
+            name, security, weight, orders = route
+            self.authenticate(security, api_key, params, total_params)
+            self.limiter.consume(weight(params) if callable(weight) else weight,
+                                 orders(params) if callable(orders) else orders)
+            return getattr(self, name)(params)
+
+
+def ws_accept(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def ws_frame(payload, opcode=0x1):
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack("!H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack("!Q", len(payload))
+    return header + payload
+
+
+# read one client frame, returns (opcode, payload) or (None, None) when the connection is gone
+def ws_read_frame(rfile):
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, None
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else None
+    payload = rfile.read(length)
+    if mask:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return head[0] & 0x0F, payload
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, with nagle a kept alive connection waits on the delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self.handle_websocket()
+        else:
+            self.handle_rest("GET")
+
+    def do_POST(self):
+        self.handle_rest("POST")
+
+    def do_PUT(self):
+        self.handle_rest("PUT")
+
+    def do_DELETE(self):
+        self.handle_rest("DELETE")
+
+    def handle_rest(self, method):
+        exchange = self.server.exchange
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        params = dict(parse_qsl(url.query))
+        params.update(parse_qsl(body))
+        exchange.delay()
+        headers = {}
+        try:
+            result = exchange.handle(method, url.path, params, self.headers.get("X-MBX-APIKEY"), url.query + body)
+            status = 200
+        except MockError as e:
+            status, result = e.status, {"code": e.code, "msg": e.msg}
+            if e.status == 429:
+                headers["Retry-After"] = exchange.limiter.retry_after()
+        except Exception as e:
+            status, result = 500, {"code": -1000, "msg": f"An unknown error occurred while processing the request. {e}"}
+        headers.update(exchange.limiter.headers())
+        payload = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # /stream?streams=a/b is a combined stream, /ws/a/b sends the bare events. a listen key is the user data stream
+    def handle_websocket(self):
+        url = urlsplit(self.path)
+        if url.path == "/stream":
+            streams, combined = dict(parse_qsl(url.query)).get("streams", "").split("/"), True
+        elif url.path.startswith("/ws/"):
+            streams, combined = url.path[4:].split("/"), False
+        else:
+            self.send_error(404)
+            return
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", ws_accept(self.headers["Sec-WebSocket-Key"]))
+        self.end_headers()
+        self.close_connection = True
+
+        exchange = self.server.exchange
+        subscription = exchange.subscribe(streams, combined)
+        send_lock = threading.Lock()
+
+        def send(payload, opcode=0x1):
+            with send_lock:
+                self.wfile.write(ws_frame(payload, opcode))
+
+        def read():
+            try:
+                while not subscription.closed:
+                    opcode, payload = ws_read_frame(self.rfile)
+                    if opcode is None or opcode == 0x8:
+                        if opcode == 0x8:
+                            send(payload[:2], 0x8)
+                        break
+                    if opcode == 0x9:
+                        send(payload, 0xA)
+            except (OSError, ValueError):
+                pass
+            exchange.unsubscribe(subscription)
+
+        threading.Thread(target=read, name="mock-ws-reader", daemon=True).start()
+        try:
+            while not subscription.closed:
+                try:
+                    deliver_at, message = subscription.queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                delay = deliver_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                send(message.encode())
+        except OSError:
+            pass
+        exchange.unsubscribe(subscription)
+        # wake the reader thread and end the connection for the client too, e.g. after close_subscriptions()
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+# The http server plus the thread that moves the market every tick_interval seconds
+class MockServer:
+    def __init__(self, exchange, host="127.0.0.1", port=8765, tick_interval=1.0, verbose=False):
+        self.exchange = exchange
+        self.tick_interval = tick_interval
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.exchange = exchange
+        self.httpd.verbose = verbose
+        self._running = False
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def ws_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"ws://{host}:{port}"
+
+    def _tick(self):
+        deadline = time.monotonic()
+        while self._running:
+            deadline += self.tick_interval
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            if self._running and not self.exchange.tick():
+                print("mock exchange: out of candles, the market stopped")
+                break
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self.httpd.serve_forever, name="mock-http", daemon=True).start()
+        if self.tick_interval > 0:
+            threading.Thread(target=self._tick, name="mock-ticker", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self.httpd.shutdown()
+        self.exchange.close_subscriptions()
+        self.httpd.server_close()
+
+
+# SYMBOL or SYMBOL=file[,file...] where the files are 1m kline csv/npy files, globs are expanded
+def load_market(spec, args):
+    symbol, _, files = spec.partition("=")
+    if files:
+        from backtest import load_klines
+        data = load_klines(sorted(path for pattern in files.split(",") for path in glob.glob(pattern)))
+    else:
+        data = synthetic_klines(args.bars, price=args.price, seed=args.seed + zlib.crc32(symbol.encode()))
+    return MockMarket(symbol, data, warmup=args.warmup, price_precision=args.price_precision,
+                      quantity_precision=args.quantity_precision, min_notional=args.min_notional)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the Binance futures api")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--market", action="append", help="SYMBOL or SYMBOL=klines.csv, can be repeated")
+    parser.add_argument("--bars", type=int, default=20000, help="candles generated per market without a file")
+    parser.add_argument("--price", type=float, default=2000.0, help="start price of generated candles")
+    parser.add_argument("--warmup", type=int, default=1500, help="candles of history before the replay starts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--price-precision", type=int, default=2)
+    parser.add_argument("--quantity-precision", type=int, default=3)
+    parser.add_argument("--min-notional", type=float, default=5.0)
+    parser.add_argument("--balance", type=float, default=1000.0)
+    parser.add_argument("--fee", type=float, default=0.0004)
+    parser.add_argument("--funding-rate", type=float, default=0.0001)
+    parser.add_argument("--tick-interval", type=float, default=1.0,
+                        help="seconds between ticks, 4 ticks per candle. 0 only moves on POST /mock/step")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every REST request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--stream-latency", type=float, default=0.0, help="seconds added to every stream event")
+    parser.add_argument("--weight-limit", type=int, default=2400)
+    parser.add_argument("--api-key", help="require this api key")
+    parser.add_argument("--secret-key", help="verify request signatures with this secret")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    exchange = MockExchange(balance=args.balance, fee=args.fee, funding_rate=args.funding_rate,
+                            latency=args.latency, jitter=args.jitter, stream_latency=args.stream_latency,
+                            api_key=args.api_key, secret_key=args.secret_key,
+                            limiter=RateLimiter(weight_limit=args.weight_limit), seed=args.seed)
+    for spec in args.market or ["ETHUSDT"]:
+        exchange.add_market(load_market(spec, args))
+
+    server = MockServer(exchange, args.host, args.port, args.tick_interval, args.verbose).start()
+    print(f"mock exchange on {server.url} (REST) and {server.ws_url} (streams) "
+          f"for {', '.join(exchange.markets)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import logging
+import bot_functions as bf
+import config as cfg
+import metrics
+from bot_state import BotState, STATE_PATH
+from engine import MultiMarketEngine
+from market_hub import HubClient, hub_settings
+
+logger = logging.getLogger()
+
+# Run several of these against one market_hub.py process to spread the markets over more cores:
+#   python market_hub.py
+#   python multi_bot.py --hub ETHUSDT BTCUSDT
+#   python multi_bot.py --hub SOLUSDT
+parser = argparse.ArgumentParser(description="Trade the markets of settings.json")
+parser.add_argument("markets", nargs="*", help="only trade these markets, all of settings.json by default")
+parser.add_argument("--hub", action="store_true", help="read candles from a running market_hub.py")
+parser.add_argument("--state-file", help="where the positions are saved, state_file of settings.json by default. "
+                                         "Processes trading different markets need a file each")
+args = parser.parse_args()
+
+# Connect to the binance api and produce a client shared by every market
+client = bf.init_client()
+exchange = bf.init_exchange()
+store = bf.init_candle_store()
+
+# Load the list of markets from settings.json
+settings = cfg.getBotSettings()
+markets = [market for market in cfg.getMarketSettings() if not args.markets or market.market in args.markets]
+hub = HubClient(*hub_settings(settings)) if args.hub else None
+# The positions and the candles entries were last evaluated on, saved on every change like bot.py does
+bot_state = BotState(args.state_file or getattr(settings, "state_file", STATE_PATH))
+
+# turn off print unless we really need to print something
+std = bf.getStdOut()
+metrics.setup_logging(std)
+bf.blockPrint()
+metrics.export(getattr(settings, "metrics_port", None), getattr(settings, "metrics_file", None))
+bf.singlePrint(f"Bot Started for {', '.join(market.market for market in markets)}", std)
+
+engine = MultiMarketEngine(client, exchange, markets, std, url=getattr(settings, "ws_url", "wss://fstream.binance.com"),
+                           store=store, hub=hub, bot_state=bot_state)
+engine.start()
+engine.run()
@@ -0,0 +1,186 @@
+import argparse
+import glob
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import backtest as bt
+import config as cfg
+import rules
+
+# Parameter sweep over the backtester. The candle array is put in shared memory once and every worker
+# maps it without copying. Combinations are grouped by their indicator periods, so a worker computes the
+# signals of a group once and reuses them for every take profit / stop loss / trailing combination,
+# and the indicator arrays themselves are cached per worker across groups.
+
+INDICATOR_PARAMETERS = ("ma_period", "ma_close_period", "macd_fast", "macd_slow", "macd_signal")
+EXIT_PARAMETERS = ("take_profit", "stop_loss", "callback_rate")
+
+
+# dict that drops its least recently used entries, keeps the per worker array caches bounded
+class LRUCache(OrderedDict):
+    def __init__(self, maxsize=32):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+# worker globals, set up once per process by _init_worker
+_shm = None
+_data = None
+_options = None
+_strategy = None
+_indicator_cache = LRUCache(32)
+_signal_cache = LRUCache(8)
+
+
+# "1.2" -> [1.2], "1,2,5" -> [1, 2, 5], "0.8:2.0:0.4" -> [0.8, 1.2, 1.6, 2.0] (stop inclusive)
+def parse_values(spec, kind=float):
+    if ":" in spec:
+        start, stop, step = (float(x) for x in spec.split(":"))
+        count = int(round((stop - start) / step)) + 1
+        return [kind(round(start + i * step, 10)) for i in range(count)]
+    return [kind(x) for x in spec.split(",")]
+
+
+def _init_worker(name, shape, options):
+    global _shm, _data, _options, _strategy
+    _shm = shared_memory.SharedMemory(name=name)
+    _data = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    _options = options
+    _strategy = rules.load_strategy()
+
+
+def _signals(indicator_params):
+    if indicator_params not in _signal_cache:
+        ind = bt.scalp_indicators(_data, cache=_indicator_cache, **dict(zip(INDICATOR_PARAMETERS, indicator_params)))
+        _signal_cache[indicator_params] = bt.scalp_signals(ind, _strategy)
+    return _signal_cache[indicator_params]
+
+
+# run one group: a set of indicator periods against a list of exit settings
+def _run_group(indicator_params, exit_params):
+    signals = _signals(indicator_params)
+    rows = []
+    for params in exit_params:
+        exits = dict(zip(EXIT_PARAMETERS, params))
+        trades, equity = bt.simulate(_data, signals, **exits, **_options)
+        row = dict(zip(INDICATOR_PARAMETERS, indicator_params))
+        row.update(exits)
+        row.update(bt.summarise(trades, equity, _options['balance']))
+        rows.append(row)
+    return rows
+
+
+# every combination of the grid, or `samples` of them picked at random
+def combinations(grid, samples=None, seed=None):
+    names = list(grid)
+    sizes = [len(grid[name]) for name in names]
+    total = int(np.prod(sizes))
+    if samples is None or samples >= total:
+        indices = range(total)
+    else:
+        indices = random.Random(seed).sample(range(total), samples)
+    for index in indices:
+        combo = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            index, position = divmod(index, size)
+            combo[name] = grid[name][position]
+        yield combo
+
+
+# split combinations into (indicator periods, [exit settings]) groups of at most chunk_size simulations
+def group_tasks(combos, chunk_size=64):
+    groups = {}
+    for combo in combos:
+        key = tuple(combo[name] for name in INDICATOR_PARAMETERS)
+        groups.setdefault(key, []).append(tuple(combo[name] for name in EXIT_PARAMETERS))
+    for key, exits in groups.items():
+        for i in range(0, len(exits), chunk_size):
+            yield key, exits[i:i + chunk_size]
+
+
+def sweep(data, grid, samples=None, seed=None, workers=None, chunk_size=64, sort_by="return", **options):
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=data.nbytes)
+    try:
+        np.ndarray(data.shape, dtype=np.float64, buffer=shm.buf)[:] = data
+        tasks = list(group_tasks(combinations(grid, samples, seed), chunk_size))
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(shm.name, data.shape, options)) as pool:
+            futures = [pool.submit(_run_group, key, exits) for key, exits in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                rows.extend(future.result())
+                if done % 50 == 0 or done == len(futures):
+                    print(f"{len(rows)} combinations evaluated ({done}/{len(futures)} groups)")
+    finally:
+        shm.close()
+        shm.unlink()
+    return pd.DataFrame(rows).sort_values(sort_by, ascending=False).reset_index(drop=True)
+
+
+def main():
+    settings = cfg.getBotSettings()
+    parser = argparse.ArgumentParser(description="Sweep the scalp strategy parameters over historical klines. "
+                                                 "Values are a number, a comma list or start:stop:step")
+    parser.add_argument("files", nargs="+", help="kline csv/npy/.candles files, globs are expanded")
+    parser.add_argument("--take-profit", default=settings.take_profit)
+    parser.add_argument("--stop-loss", default=settings.stop_loss)
+    parser.add_argument("--callback-rate", default=settings.trailing_percentage)
+    parser.add_argument("--ma-period", default="50")
+    parser.add_argument("--ma-close-period", default="20")
+    parser.add_argument("--macd-fast", default="12")
+    parser.add_argument("--macd-slow", default="26")
+    parser.add_argument("--macd-signal", default="9")
+    parser.add_argument("--samples", type=int, help="evaluate this many random combinations instead of the grid")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--leverage", type=int, default=int(settings.leverage))
+    parser.add_argument("--fee", type=float, default=bt.TAKER_FEE)
+    parser.add_argument("--balance", type=float, default=1000.0)
+    parser.add_argument("--price-precision", type=int, default=2)
+    parser.add_argument("--sort-by", default="return")
+    parser.add_argument("--output", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    grid = {
+        'take_profit': parse_values(args.take_profit),
+        'stop_loss': parse_values(args.stop_loss),
+        'callback_rate': parse_values(args.callback_rate),
+        'ma_period': parse_values(args.ma_period, int),
+        'ma_close_period': parse_values(args.ma_close_period, int),
+        'macd_fast': parse_values(args.macd_fast, int),
+        'macd_slow': parse_values(args.macd_slow, int),
+        'macd_signal': parse_values(args.macd_signal, int),
+    }
+    paths = sorted(path for pattern in args.files for path in glob.glob(pattern))
+    data = bt.load_klines(paths)
+
+    started = time.perf_counter()
+    results = sweep(data, grid, samples=args.samples, seed=args.seed, workers=args.workers, sort_by=args.sort_by,
+                    leverage=args.leverage, fee_rate=args.fee, balance=args.balance,
+                    price_precision=args.price_precision)
+    print(f"{len(results)} combinations in {time.perf_counter() - started:.1f}s, written to {args.output}")
+    results.to_csv(args.output, index=False)
+    print(results.head(10).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import time
+
+import bot_functions as bf
+import metrics
+from exchange import ExchangeError
+
+
+def _side_value(order_side):
+    return 1 if order_side == "BUY" else -1
+
+
+# raised by EntryPipeline.enter() when something fails after the market order filled. The position is open,
+# qty, side (1 long, -1 short), entry_price and the ids of the protective orders that were placed describe it
+# so the caller can keep watching it. The failure itself is the __cause__
+class EntryError(Exception):
+    def __init__(self, message, qty, side, entry_price, order_ids=()):
+        super().__init__(message)
+        self.qty = qty
+        self.side = side
+        self.entry_price = entry_price
+        self.order_ids = list(order_ids)
+
+
+# Entry path with nothing left to do after the signal but place orders.
+# Leverage and margin type are set once at startup and the balance and symbol rules are loaded by
+# prepare() while the bot is idle, so entering is: size locally, one market order that returns its
+# fill, then the stop loss and trailing take profit together in one batch request.
+class EntryPipeline:
+    def __init__(self, exchange, registry, std, market="ETHUSDT", leverage=3, take_profit=1.6, stop_loss=1.3,
+                 callback_rate=0.4, fill_timeout=5.0, account=None):
+        self.exchange = exchange
+        self.account = account
+        self.registry = registry
+        self.std = std
+        self.market = market
+        self.leverage = leverage
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.callback_rate = callback_rate
+        self.fill_timeout = fill_timeout
+        self.balance = None
+        self.info = None
+        self.last_latency = None
+        self.entry_price = None
+        self.order_ids = []
+
+    # everything that can be known before a signal fires
+    def prepare(self):
+        self.info = self.registry.get(self.market)
+        if self.account is not None:
+            self.balance = self.account.balance("USDT")
+            return self
+        for balance in self.exchange.balance():
+            if balance["asset"] == "USDT":
+                self.balance = float(balance["balance"])
+                break
+        return self
+
+    # same sizing as calculate_position, from the prepared balance and the price at signal time
+    def position_size(self, price):
+        qty = round((self.balance / price) * self.leverage * 0.40, 8)
+        qty = bf.round_to_precision(qty, self.info.quantity_precision)
+        return bf.get_decimal_value(qty, self.info.quantity_precision)
+
+    # the average fill price, straight from the RESULT response, else from the user data stream when there
+    # is an account state, else by asking for the order until it fills
+    def wait_for_fill(self, order):
+        if order.get("status") != "FILLED" and self.account is not None:
+            price = self.account.wait_for_fill(order["orderId"], self.fill_timeout)
+            if price:
+                return price
+        deadline = time.monotonic() + self.fill_timeout
+        while True:
+            if order.get("status") == "FILLED" and float(order.get("avgPrice", 0)) > 0:
+                return float(order["avgPrice"])
+            if time.monotonic() > deadline:
+                raise ExchangeError(None, f"order {order.get('orderId')} not filled after {self.fill_timeout}s")
+            time.sleep(0.05)
+            order = self.exchange.get_order(self.market, order["orderId"])
+
+    def protective_orders(self, order_side, qty, entry_price):
+        stop_side = "SELL" if order_side == "BUY" else "BUY"
+        stop_price, take_profit_price = bf.get_protective_prices(entry_price, order_side, self.take_profit,
+                                                                 self.stop_loss, self.info.price_precision)
+        stop = {"symbol": self.market, "side": stop_side, "type": "STOP_MARKET", "stopPrice": stop_price,
+                "closePosition": True, "workingType": "MARK_PRICE"}
+        take_profit = {"symbol": self.market, "side": stop_side, "type": "TRAILING_STOP_MARKET", "quantity": qty,
+                       "activationPrice": take_profit_price, "callbackRate": self.callback_rate,
+                       "workingType": "CONTRACT_PRICE", "timeInForce": "GTC", "reduceOnly": True}
+        return stop, take_profit
+
+    # the entry price of the position the exchange reports, None when there is no position
+    def position_entry_price(self):
+        for position in self.exchange.position_risk(self.market):
+            if position["symbol"] == self.market and float(position["positionAmt"]) != 0.0:
+                return float(position["entryPrice"])
+        return None
+
+    # submit both protective orders in one request. an order the batch rejected is retried on its own,
+    # and if the stop loss still can't be placed the position is closed rather than left unprotected.
+    # a take profit that can't be placed leaves the position with its stop loss only.
+    # returns the ids of the orders placed
+    def protect(self, orders):
+        results = self.exchange.batch_orders(orders)
+        order_ids = []
+        for order, result in zip(orders, results):
+            if "code" not in result:
+                order_ids.append(result["orderId"])
+                continue
+            bf.singlePrint(f"{order['type']} rejected ({result.get('code')}: {result.get('msg')}), retrying", self.std)
+            try:
+                order_ids.append(self.exchange.new_order(**order)["orderId"])
+            except ExchangeError as e:
+                if order["type"] != "STOP_MARKET":
+                    bf.singlePrint(f"{order['type']} could not be placed ({e}), the position only has its stop loss",
+                                   self.std)
+                    continue
+                bf.singlePrint(f"Stop loss could not be placed ({e}), closing the position", self.std)
+                self.exchange.new_order(symbol=self.market, side=order["side"], type="MARKET",
+                                        quantity=orders[1]["quantity"], reduceOnly=True)
+                raise
+        return order_ids
+
+    # place the protective orders of a position the bot finds open without them, e.g. after a crash between
+    # the fill and protect(). amount is signed like positionAmt
+    def protect_position(self, amount, entry_price):
+        if self.info is None:
+            self.info = self.registry.get(self.market)
+        order_side = "BUY" if amount > 0 else "SELL"
+        qty = bf.get_decimal_value(abs(amount), self.info.quantity_precision)
+        self.entry_price = entry_price
+        self.order_ids = self.protect(self.protective_orders(order_side, qty, entry_price))
+        return self.order_ids
+
+    def log_entry(self, order_side, qty, entry_price):
+        bf.log_trade(_qty=qty, _market=self.market, _leverage=self.leverage, _side=_side_value(order_side),
+                     _cause="Signal Change", _trigger_price=0, _market_price=entry_price, _type=order_side)
+
+    def enter(self, order_side, price):
+        started = time.perf_counter()
+        if self.balance is None:
+            with metrics.timer("bot_order_step_seconds", step="prepare"):
+                self.prepare()
+
+        with metrics.timer("bot_order_step_seconds", step="size"):
+            qty = self.position_size(price)
+        with metrics.timer("bot_order_step_seconds", step="market_order"):
+            order = self.exchange.new_order(symbol=self.market, side=order_side, type="MARKET", quantity=qty,
+                                            newOrderRespType="RESULT")
+        with metrics.timer("bot_order_step_seconds", step="fill"):
+            try:
+                entry_price = self.wait_for_fill(order)
+            except Exception:
+                # the fill may only have gone unseen, the position says whether the order filled
+                entry_price = self.position_entry_price()
+                if entry_price is None:
+                    raise
+        filled = time.perf_counter()
+        self.entry_price = entry_price
+        self.order_ids = []
+        # the balance changes with the trade, it is loaded again by the next prepare()
+        self.balance = None
+
+        # the position is open from here on, a failure is handed back with it so the caller keeps watching it
+        try:
+            with metrics.timer("bot_order_step_seconds", step="protect"):
+                orders = self.protective_orders(order_side, qty, entry_price)
+                self.order_ids = self.protect(orders)
+        except Exception as e:
+            self.log_entry(order_side, qty, entry_price)
+            if self.account is not None:
+                self.account.wait_for_position(self.market, self.fill_timeout)
+            raise EntryError(f"{self.market}: {order_side} {qty} filled at ${entry_price}, placing its protective "
+                             f"orders failed: {e}", qty, _side_value(order_side), entry_price) from e
+        self.last_latency = time.perf_counter() - started
+        metrics.observe("bot_order_step_seconds", self.last_latency, step="total")
+        metrics.count("bot_entries_total", market=self.market, side=order_side)
+
+        # don't hand back before the account state has seen the position, or the caller would take it as closed
+        if self.account is not None and not self.account.wait_for_position(self.market, self.fill_timeout):
+            bf.singlePrint(f"{self.market}: position not reported by the user data stream yet", self.std)
+
+        bf.singlePrint(f"{order_side}: {qty} ${entry_price} using x{self.leverage} leverage", self.std)
+        if len(self.order_ids) == len(orders):
+            bf.singlePrint(f"Stop Loss ${orders[0]['stopPrice']} and Take Profit ${orders[1]['activationPrice']} "
+                           f"are created", self.std)
+        else:
+            bf.singlePrint(f"Stop Loss ${orders[0]['stopPrice']} is created", self.std)
+        bf.singlePrint(f"Filled in {(filled - started) * 1000:.0f}ms, "
+                       f"protected in {self.last_latency * 1000:.0f}ms", self.std)
+        self.log_entry(order_side, qty, entry_price)
+        return qty, _side_value(order_side), True
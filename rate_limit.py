@@ -0,0 +1,288 @@
+import heapq
+import inspect
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+# Client side accounting of the binance request weight and order count limits, shared by every client of the
+# process since binance counts them per IP (weight) and per account (orders).
+# Each request reserves its cost before it is sent and waits when a window has no room left for it. Waiting
+# requests are served by priority, so order placement and cancels go ahead of account and market data requests,
+# and market data may only use the budget up to a reserve kept for the other two. Every response's
+# X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* headers correct the local count, which also covers other
+# processes on the same IP, and a 429 or 418 holds back all requests for as long as its Retry-After says.
+
+ORDER, ACCOUNT, DATA = range(3)
+PRIORITY_NAMES = ("order", "account", "data")
+
+
+def klines_weight(params):
+    limit = int(params.get("limit") or 500)
+    return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+
+def _symbol_weight(with_symbol, without_symbol):
+    return lambda params: with_symbol if params.get("symbol") else without_symbol
+
+
+# (method, path) -> (priority, request weight, orders counted). weights and counts can be functions of the params
+ENDPOINTS = {
+    ("GET", "/fapi/v1/exchangeInfo"): (DATA, 1, 0),
+    ("GET", "/fapi/v1/klines"): (DATA, klines_weight, 0),
+    ("GET", "/fapi/v1/premiumIndex"): (DATA, _symbol_weight(1, 10), 0),
+    ("GET", "/fapi/v1/ticker/price"): (DATA, _symbol_weight(1, 2), 0),
+    ("GET", "/fapi/v2/balance"): (ACCOUNT, 5, 0),
+    ("GET", "/fapi/v2/positionRisk"): (ACCOUNT, 5, 0),
+    ("POST", "/fapi/v1/leverage"): (ACCOUNT, 1, 0),
+    ("POST", "/fapi/v1/marginType"): (ACCOUNT, 1, 0),
+    ("GET", "/fapi/v1/openOrders"): (ACCOUNT, _symbol_weight(1, 40), 0),
+    ("POST", "/fapi/v1/listenKey"): (ACCOUNT, 1, 0),
+    ("PUT", "/fapi/v1/listenKey"): (ACCOUNT, 1, 0),
+    ("DELETE", "/fapi/v1/listenKey"): (ACCOUNT, 1, 0),
+    ("POST", "/fapi/v1/order"): (ORDER, 1, 1),
+    ("GET", "/fapi/v1/order"): (ORDER, 1, 0),
+    ("DELETE", "/fapi/v1/order"): (ORDER, 1, 0),
+    ("POST", "/fapi/v1/batchOrders"): (ORDER, 5, lambda params: params["batchOrders"].count("{")),
+    ("DELETE", "/fapi/v1/allOpenOrders"): (ORDER, 1, 0),
+}
+
+# the same for the binance_f RequestClient methods, by method name and keyword arguments
+CLIENT_METHODS = {
+    "get_exchange_information": (DATA, 1, 0),
+    "get_candlestick_data": (DATA, klines_weight, 0),
+    "get_mark_price": (DATA, _symbol_weight(1, 10), 0),
+    "get_symbol_price_ticker": (DATA, _symbol_weight(1, 2), 0),
+    "get_balance": (ACCOUNT, 5, 0),
+    "get_balance_v2": (ACCOUNT, 5, 0),
+    "get_account_information": (ACCOUNT, 5, 0),
+    "get_account_information_v2": (ACCOUNT, 5, 0),
+    "get_position": (ACCOUNT, 5, 0),
+    "get_position_v2": (ACCOUNT, 5, 0),
+    "get_open_orders": (ACCOUNT, _symbol_weight(1, 40), 0),
+    "change_initial_leverage": (ACCOUNT, 1, 0),
+    "change_margin_type": (ACCOUNT, 1, 0),
+    "post_order": (ORDER, 1, 1),
+    "get_order": (ORDER, 1, 0),
+    "cancel_order": (ORDER, 1, 0),
+    "cancel_all_orders": (ORDER, 1, 0),
+}
+
+DEFAULT_COST = (ACCOUNT, 1, 0)
+
+
+def _resolve(cost, params):
+    priority, weight, orders = cost
+    return (priority, weight(params) if callable(weight) else weight, orders(params) if callable(orders) else orders)
+
+
+def endpoint_cost(method, path, params=None):
+    return _resolve(ENDPOINTS.get((method, path), DEFAULT_COST), params or {})
+
+
+# params are the call's arguments by name, see RateLimited for binding the positional ones
+def client_method_cost(name, params):
+    return _resolve(CLIENT_METHODS.get(name, DEFAULT_COST), params)
+
+
+# A limit of `limit` units per fixed window of `seconds`, counted per calendar window like binance does
+class Window:
+    def __init__(self, limit, seconds, header):
+        self.limit = limit
+        self.seconds = seconds
+        self.header = header
+        self.start = 0
+        self.used = 0
+
+    def _roll(self, now):
+        start = int(now // self.seconds) * self.seconds
+        if start != self.start:
+            self.start = start
+            self.used = 0
+
+    # seconds until `amount` fits under the limit less `reserve`, 0 if it fits now
+    def wait_time(self, amount, now, reserve=0):
+        self._roll(now)
+        if amount == 0 or self.used + amount <= self.limit - reserve or self.used == 0:
+            return 0.0
+        return self.start + self.seconds - now
+
+    def take(self, amount, now):
+        self._roll(now)
+        self.used += amount
+
+    # the count binance reported, which includes what other processes on the same IP used. It replaces the local
+    # count when the request was sent in the current window, otherwise it may be the last window's and is ignored
+    def sync(self, used, now, sent=None):
+        self._roll(now)
+        if sent is None or int(sent // self.seconds) * self.seconds == self.start:
+            self.used = used
+
+
+class RateLimiter:
+    def __init__(self, weight_limit=2400, orders_10s=300, orders_1m=1200, data_reserve=0.2):
+        self.weight = Window(weight_limit, 60, "X-MBX-USED-WEIGHT-1M")
+        self.orders = [Window(orders_10s, 10, "X-MBX-ORDER-COUNT-10S"), Window(orders_1m, 60, "X-MBX-ORDER-COUNT-1M")]
+        # the share of the weight market data requests leave for orders and account requests
+        self.data_reserve = data_reserve
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._in_flight = {}
+
+    # take the limits of the exchange information "rateLimits" entries (dicts or binance_f objects)
+    def configure(self, rate_limits):
+        seconds = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400}
+        with self.condition:
+            for rate_limit in rate_limits or []:
+                value = rate_limit.get if isinstance(rate_limit, dict) else lambda key: getattr(rate_limit, key, None)
+                window = seconds.get(value("interval"), 60) * int(value("intervalNum") or 1)
+                if value("rateLimitType") == "REQUEST_WEIGHT" and window == 60:
+                    self.weight.limit = int(value("limit"))
+                elif value("rateLimitType") == "ORDERS":
+                    for orders in self.orders:
+                        if orders.seconds == window:
+                            orders.limit = int(value("limit"))
+        return self
+
+    def _wait_time(self, priority, weight, orders, now):
+        reserve = int(self.weight.limit * self.data_reserve) if priority == DATA else 0
+        delays = [self.blocked_until - now, self.weight.wait_time(weight, now, reserve)]
+        delays.extend(window.wait_time(orders, now) for window in self.orders)
+        return max(0.0, *delays)
+
+    def _take(self, weight, orders, now):
+        self.weight.take(weight, now)
+        for window in self.orders:
+            window.take(orders, now)
+        metrics.gauge("bot_rate_limit_used_weight", self.weight.used)
+
+    def _delay(self, entry, weight, orders, now):
+        if self._waiting[0] != entry:
+            return None
+        return self._wait_time(entry[0], weight, orders, now)
+
+    # count the request and return True if it can be sent right away, without blocking.
+    # for callers that can't block their thread, e.g. an event loop
+    def try_acquire(self, weight, orders=0, priority=DATA):
+        with self.condition:
+            now = time.time()
+            if self._waiting or self._wait_time(priority, weight, orders, now) > 0:
+                return False
+            self._take(weight, orders, now)
+            return True
+
+    # block until the request fits the limits and it is the most important one waiting, then count it.
+    # returns the seconds spent waiting
+    def acquire(self, weight, orders=0, priority=DATA):
+        started = time.time()
+        with self.condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.time()
+                    delay = self._delay(entry, weight, orders, now)
+                    if delay == 0:
+                        break
+                    self.condition.wait(delay)
+                self._take(weight, orders, now)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self.condition.notify_all()
+        waited = time.time() - started
+        if waited > 0.001:
+            metrics.observe("bot_rate_limit_wait_seconds", waited, priority=PRIORITY_NAMES[priority])
+        return waited
+
+    # correct the counts from the headers of a response to a request sent at `sent` (time.time())
+    def update(self, headers, sent=None):
+        now = time.time()
+        with self.condition:
+            for window in [self.weight] + self.orders:
+                used = headers.get(window.header)
+                if used is not None:
+                    window.sync(int(used), now, sent)
+            metrics.gauge("bot_rate_limit_used_weight", self.weight.used)
+            self.condition.notify_all()
+
+    # a 429 (over the limit) or 418 (banned for ignoring 429s): hold every request back until Retry-After passes
+    def back_off(self, status, retry_after=None):
+        delay = float(retry_after) if retry_after else 60.0
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.time() + delay)
+            self.condition.notify_all()
+        metrics.count("bot_rate_limit_rejections_total", status=status)
+
+    # run func(*args) once its cost (priority, weight, orders) is acquired. calls with the same key made while
+    # one is in flight don't send another request, they wait for that one and share its result
+    def call(self, cost, func, *args, key=None):
+        if key is None:
+            self.acquire(cost[1], cost[2], cost[0])
+            return func(*args)
+        with self.condition:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            metrics.count("bot_rate_limit_coalesced_total", priority=PRIORITY_NAMES[cost[0]])
+            return future.result()
+        try:
+            self.acquire(cost[1], cost[2], cost[0])
+            result = func(*args)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.condition:
+                self._in_flight.pop(key, None)
+
+
+# the arguments of a call by parameter name, e.g. get_mark_price("ETHUSDT") -> {"symbol": "ETHUSDT"}
+def _bind(signature, args, kwargs):
+    if signature is None:
+        return kwargs
+    try:
+        return signature.bind_partial(*args, **kwargs).arguments
+    except TypeError:
+        return kwargs
+
+
+# Wraps a binance_f RequestClient so every call goes through the limiter with the cost of its method.
+# Market data calls with the same arguments share one request while it is in flight
+class RateLimited:
+    def __init__(self, target, limiter):
+        self._target = target
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        limiter = self._limiter
+        try:
+            signature = inspect.signature(attribute)
+        except (TypeError, ValueError):
+            signature = None
+
+        def call(*args, **kwargs):
+            cost = client_method_cost(name, _bind(signature, args, kwargs))
+            key = (name, args, tuple(sorted(kwargs.items()))) if cost[0] == DATA else None
+            return limiter.call(cost, lambda: attribute(*args, **kwargs), key=key)
+        setattr(self, name, call)
+        return call
+
+
+# the limiter of the process, shared by the binance_f client and the exchange client
+limiter = RateLimiter()
+
+
+def limit(target, rate_limiter=None):
+    return RateLimited(target, rate_limiter or limiter)
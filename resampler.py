@@ -0,0 +1,141 @@
+import logging
+
+import numpy as np
+
+from market_data import OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME, TRADES, INTERVALS
+
+logger = logging.getLogger(__name__)
+
+# Higher interval candles built locally from the 1m stream, so trading on 5m and 1h costs the stream of 1m
+# alone. Every interval is still seeded with one klines request of its own: filling a 4h buffer from 1m
+# candles would take 240 requests where one does. From then on a Bar folds every closed minute of the
+# current candle into running open/high/low/volume/trades and combines them with the minute in progress on
+# each 1m update, which gives the higher interval candle in progress at the same time the 1m one updates.
+# The candles come out as kline dicts (the "k" object of the stream) for CandleBuffer.update, so closes,
+# indicators and the scheduler work as they do for streamed candles.
+
+MINUTE = INTERVALS["1m"]
+
+
+# the candle of one interval in progress
+class Bar:
+    def __init__(self, interval):
+        self.interval = interval
+        self.interval_ms = INTERVALS[interval]
+        self.start = None
+        self.pending = None
+        self.native = None
+        self.covered = False
+        self._clear()
+
+    def _clear(self):
+        self.open = None
+        self.high = -np.inf
+        self.low = np.inf
+        self.volume = 0.0
+        self.trades = 0.0
+
+    def _fold(self, row):
+        if self.open is None:
+            self.open = row[OPEN]
+        self.high = max(self.high, row[HIGH])
+        self.low = min(self.low, row[LOW])
+        self.volume += row[VOLUME]
+        self.trades += row[TRADES]
+
+    # start from the candle of this interval in progress (a column of the layout, from the seeded buffer)
+    # and the 1m history (column layout, the last candle may still be in progress)
+    def seed(self, minutes, candle):
+        self.pending = None
+        self._clear()
+        self.start = int(candle[OPEN_TIME])
+        self.native = candle
+        rows = minutes[:, minutes[OPEN_TIME] >= self.start]
+        # the 1m history may start after the candle opened, e.g. 1000 minutes of a 1d candle
+        self.covered = rows.shape[1] > 0 and minutes[OPEN_TIME, 0] <= self.start
+        if rows.shape[1] == 0:
+            return
+        for row in rows[:, :-1].T:
+            self._fold(row)
+        self.pending = rows[:, -1]
+
+    def _kline(self, row, closed):
+        open_time = int(row[OPEN_TIME])
+        return {"t": self.start, "i": self.interval,
+                "o": self.open if self.open is not None else row[OPEN],
+                "h": max(self.high, row[HIGH]), "l": min(self.low, row[LOW]), "c": row[CLOSE],
+                "v": self.volume + row[VOLUME], "n": self.trades + row[TRADES],
+                "x": closed and open_time + MINUTE == self.start + self.interval_ms}
+
+    # the first candle built replaces the one the exchange returned at seed, so it has to open where that one
+    # opened and reach at least as far. what the minutes don't cover (they start after the candle opened, or
+    # the 1m history has a gap) is taken from the exchange's candle. returns True if the candle changed
+    def _anchor(self, kline):
+        native, self.native = self.native, None
+        if kline["t"] != int(native[OPEN_TIME]):
+            return False
+        differs = [name for name, differ in (("open", kline["o"] != native[OPEN]), ("high", kline["h"] < native[HIGH]),
+                                             ("low", kline["l"] > native[LOW]),
+                                             ("volume", kline["v"] < native[VOLUME] * (1 - 1e-9)),
+                                             ("trades", kline["n"] < native[TRADES])) if differ]
+        if not differs:
+            return False
+        if self.covered:
+            logger.warning(f"{self.interval} candle at {kline['t']} built from 1m candles differs from the "
+                           f"exchange's in {', '.join(differs)}, using the exchange's")
+        self.open = native[OPEN]
+        self.high = max(self.high, native[HIGH])
+        self.low = min(self.low, native[LOW])
+        self.volume += max(native[VOLUME] - kline["v"], 0.0)
+        self.trades += max(native[TRADES] - kline["n"], 0.0)
+        return True
+
+    # apply one 1m candle update, a row of the column layout. returns the kline dict of this interval,
+    # or None for an update older than the candle in progress
+    def update(self, row, closed):
+        open_time = int(row[OPEN_TIME])
+        if self.pending is not None and self.pending[OPEN_TIME] < open_time:
+            # the previous minute closed without us seeing its final message
+            self._fold(self.pending)
+            self.pending = None
+        start = open_time // self.interval_ms * self.interval_ms
+        if self.start is None or start > self.start:
+            self.start = start
+            self._clear()
+        elif start < self.start:
+            return None
+
+        kline = self._kline(row, closed)
+        if self.native is not None and self._anchor(kline):
+            kline = self._kline(row, closed)
+        if closed:
+            self._fold(row)
+            self.pending = None
+        else:
+            self.pending = row
+        return kline
+
+
+# Keeps the buffers of the higher intervals current from the 1m candles
+class Resampler:
+    def __init__(self, buffers):
+        # buffers is {interval: CandleBuffer}, 1m itself is left out
+        self.buffers = {interval: buffer for interval, buffer in buffers.items() if interval != "1m"}
+        self.bars = {interval: Bar(interval) for interval in self.buffers}
+
+    # pick up from the seeded buffers: every interval's own candles from the exchange, the candle in progress
+    # completed from the 1m history
+    def seed(self, minutes):
+        for interval, buffer in self.buffers.items():
+            if buffer.count:
+                self.bars[interval].seed(minutes, buffer.last())
+
+    # apply one 1m kline from the stream to every interval
+    def update(self, kline):
+        row = np.array((float(kline["t"]), float(kline["o"]), float(kline["h"]), float(kline["l"]),
+                        float(kline["c"]), float(kline["v"]), float(kline.get("n", 0))))
+        closed = bool(kline.get("x", False))
+        for interval, bar in self.bars.items():
+            candle = bar.update(row, closed)
+            if candle is not None:
+                self.buffers[interval].update(candle)
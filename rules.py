@@ -0,0 +1,178 @@
+import ast
+import operator
+
+import numpy as np
+
+import config as cfg
+
+# Entry rules as expressions over the indicator names scalp() computes, e.g.
+#   ma_fiftylow < current_price and macdhist_current > 0 and macdhist_last < 0
+# A rule is parsed once into a tree of small functions. Called with a dict of numbers (the live indicator
+# values of the newest candle) it returns a bool, rule.array() takes a dict of arrays (a whole history for
+# the backtests) and returns a bool array. Nothing is evaluated as Python source: only names, numbers,
+# comparisons, and/or/not and arithmetic are accepted, anything else is a RuleError.
+
+# the conditions trade() has always checked
+LONG = "ma_fiftylow < current_price and ma_nineclose < current_price and macdhist_current > 0 and macdhist_last < 0"
+SHORT = "ma_fiftyhigh > current_price and ma_nineclose > current_price and macdhist_current < 0 and macdhist_last > 0"
+
+COMPARISONS = {ast.Lt: ("<", operator.lt), ast.LtE: ("<=", operator.le), ast.Gt: (">", operator.gt),
+               ast.GtE: (">=", operator.ge), ast.Eq: ("==", operator.eq), ast.NotEq: ("!=", operator.ne)}
+ARITHMETIC = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
+
+class RuleError(ValueError):
+    pass
+
+
+def _all(scalars):
+    def scalar(values):
+        for func in scalars:
+            if not func(values):
+                return False
+        return True
+    return scalar
+
+
+def _any(scalars):
+    def scalar(values):
+        for func in scalars:
+            if func(values):
+                return True
+        return False
+    return scalar
+
+
+def _all_arrays(vectors):
+    return lambda values: np.logical_and.reduce([vector(values) for vector in vectors])
+
+
+def _any_arrays(vectors):
+    return lambda values: np.logical_or.reduce([vector(values) for vector in vectors])
+
+
+def _apply(func, left, right):
+    return lambda values: func(left(values), right(values))
+
+
+# (function of a dict of numbers, function of a dict of arrays) for an expression node. names collects
+# the indicator names the expression reads
+def _compile(node, names):
+    if isinstance(node, ast.Name):
+        names.add(node.id)
+        get = operator.itemgetter(node.id)
+        return get, get
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = node.value
+        constant = lambda values: value
+        return constant, constant
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        scalar, vector = _compile(node.operand, names)
+        return (lambda values: -scalar(values)), (lambda values: -vector(values))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        scalar, vector = _compile(node.operand, names)
+        return (lambda values: not scalar(values)), (lambda values: np.logical_not(vector(values)))
+    if isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC:
+        func = ARITHMETIC[type(node.op)]
+        (left, left_vector), (right, right_vector) = _compile(node.left, names), _compile(node.right, names)
+        return _apply(func, left, right), _apply(func, left_vector, right_vector)
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(value, names) for value in node.values]
+        scalars, vectors = [part[0] for part in parts], [part[1] for part in parts]
+        if isinstance(node.op, ast.And):
+            return _all(scalars), _all_arrays(vectors)
+        return _any(scalars), _any_arrays(vectors)
+    if isinstance(node, ast.Compare) and all(type(op) in COMPARISONS for op in node.ops):
+        # a < b < c is a < b and b < c
+        operands = [_compile(operand, names) for operand in [node.left] + node.comparators]
+        parts = [(_apply(COMPARISONS[type(op)][1], left[0], right[0]),
+                  _apply(COMPARISONS[type(op)][1], left[1], right[1]))
+                 for op, left, right in zip(node.ops, operands, operands[1:])]
+        if len(parts) == 1:
+            return parts[0]
+        return _all([part[0] for part in parts]), _all_arrays([part[1] for part in parts])
+    raise RuleError(f"{ast.unparse(node)!r} is not allowed in a rule, use indicator names, numbers, "
+                    f"comparisons, and/or/not and + - * /")
+
+
+# One top level condition of a rule, kept for the report: its source and the functions of its operands
+class Condition:
+    def __init__(self, node, names):
+        self.text = ast.unparse(node)
+        self.scalar, _ = _compile(node, names)
+        self.symbol = None
+        if isinstance(node, ast.Compare) and len(node.ops) == 1:
+            self.symbol = COMPARISONS[type(node.ops[0])][0]
+            self.left, _ = _compile(node.left, names)
+            self.right, _ = _compile(node.comparators[0], names)
+
+    # e.g. "ma_fiftylow < current_price | 1849.4 < 1831.9 | False"
+    def describe(self, values):
+        if self.symbol is None:
+            return f"{self.text} | {self.scalar(values)}"
+        return f"{self.text} | {self.left(values)} {self.symbol} {self.right(values)} | {self.scalar(values)}"
+
+
+class Rule:
+    def __init__(self, text):
+        self.text = " ".join(text.split())
+        try:
+            tree = ast.parse(self.text, mode="eval").body
+        except SyntaxError as e:
+            raise RuleError(f"invalid rule {self.text!r}: {e.msg}") from None
+        self.names = set()
+        self.scalar, self.vector = _compile(tree, self.names)
+        terms = tree.values if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And) else [tree]
+        self.conditions = [Condition(term, self.names) for term in terms]
+
+    # the rule on the values of one candle
+    def __call__(self, values):
+        return bool(self.scalar(values))
+
+    # the rule on arrays of values, element by element. NaNs (indicator warm-up) compare False
+    def array(self, values):
+        with np.errstate(invalid="ignore"):
+            return np.asarray(self.vector(values), dtype=bool)
+
+    # one line per top level condition with its values and result
+    def describe(self, values):
+        return [condition.describe(values) for condition in self.conditions]
+
+    def __repr__(self):
+        return f"Rule({self.text!r})"
+
+
+# The long and short rule of the strategy: 1 long, -1 short, 0 nothing. Like trade() always did, a
+# matched short wins over a matched long
+class Strategy:
+    def __init__(self, long=LONG, short=SHORT):
+        self.long = long if isinstance(long, Rule) else Rule(long)
+        self.short = short if isinstance(short, Rule) else Rule(short)
+        self.names = self.long.names | self.short.names
+
+    def signal(self, values):
+        if self.short(values):
+            return -1
+        if self.long(values):
+            return 1
+        return 0
+
+    # signal() over arrays of values
+    def signals(self, values):
+        missing = self.names - set(values)
+        if missing:
+            raise RuleError(f"no values for {', '.join(sorted(missing))}")
+        long, short = self.long.array(values), self.short.array(values)
+        return np.where(short, -1, np.where(long, 1, 0)).astype(np.int8)
+
+
+DEFAULT = Strategy()
+
+
+# the strategy of settings.json "long_rule" and "short_rule", the default rule for one that is not set
+def load_strategy(settings=None):
+    settings = settings or cfg.getBotSettings()
+    long, short = getattr(settings, "long_rule", None), getattr(settings, "short_rule", None)
+    if long is None and short is None:
+        return DEFAULT
+    return Strategy(long or LONG, short or SHORT)
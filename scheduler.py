@@ -0,0 +1,107 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Runs the bot's work when something happens instead of on a fixed sleep: entries are evaluated when a candle
+# of a trading period closes, open trades are checked when the user data stream reports a fill or a position
+# change, and only housekeeping (symbol refresh, a periodic position check) runs on timers.
+# Events are posted from the stream threads and handled one at a time on the thread that calls run(), so
+# handlers never race each other and a slow handler never holds up the websocket that delivered the event.
+
+# order statuses that change a position
+FILL_STATUSES = ("PARTIALLY_FILLED", "FILLED")
+
+_STOP = object()
+
+
+class Scheduler:
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.timers = []
+        self._sequence = itertools.count()
+        self._running = False
+
+    # queue func(*args) to run on the scheduler thread. the same call posted again while it is still
+    # waiting runs once, e.g. the 1m and 5m candles closing together evaluate the market once
+    def post(self, kind, func, *args):
+        key = (func, args)
+        with self.lock:
+            if key in self.pending:
+                metrics.count("bot_scheduler_coalesced_total", kind=kind)
+                return
+            self.pending.add(key)
+        self.queue.put((kind, key, time.perf_counter()))
+
+    # run func(*args) every `seconds` on the scheduler thread, the first time `seconds` from now
+    def every(self, seconds, func, *args, kind="timer"):
+        heapq.heappush(self.timers, (time.monotonic() + seconds, next(self._sequence), seconds, kind, func, args))
+        return self
+
+    # post func(*args) whenever a candle of one of the intervals closes. register it after the indicators
+    # so they are current by the time func runs
+    def on_candle_close(self, market_data, intervals, func, *args):
+        for interval in intervals:
+            market_data.buffer(interval).on_close(lambda buffer: self.post("candle", func, *args))
+        return self
+
+    # post func(*args) whenever an order fills or a position amount changes on the account
+    def on_fill(self, account, func, *args):
+        def order_update(order):
+            if order["X"] in FILL_STATUSES:
+                self.post("fill", func, *args)
+
+        account.on_order(order_update)
+        account.on_position(lambda position: self.post("fill", func, *args))
+        return self
+
+    def _run_handler(self, kind, func, args):
+        try:
+            with metrics.timer("bot_scheduler_handler_seconds", kind=kind):
+                func(*args)
+        except Exception as e:
+            metrics.count("bot_scheduler_errors_total", kind=kind)
+            logger.error(f"{kind} handler failed: {e}", exc_info=True)
+
+    # run the timers that are due and return the seconds until the next one
+    def _run_timers(self):
+        while self.timers:
+            due, sequence, seconds, kind, func, args = self.timers[0]
+            now = time.monotonic()
+            if due > now:
+                return due - now
+            heapq.heapreplace(self.timers, (max(due + seconds, now), sequence, seconds, kind, func, args))
+            self._run_handler(kind, func, args)
+        return None
+
+    # handle events and timers on the calling thread until stop() is called
+    def run(self):
+        self._running = True
+        while self._running:
+            timeout = self._run_timers()
+            try:
+                event = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            # stop() clears _running before it queues this. one left over by an earlier stop() is skipped, the
+            # loop may have ended on the flag before it got to it
+            if event is _STOP:
+                continue
+            kind, key, posted = event
+            with self.lock:
+                self.pending.discard(key)
+            metrics.observe("bot_scheduler_delay_seconds", time.perf_counter() - posted, kind=kind)
+            self._run_handler(kind, *key)
+        self._running = False
+
+    def stop(self):
+        self._running = False
+        self.queue.put(_STOP)
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import rate_limit
+
+
+def _filter_value(_filter, key, default=None):
+    if isinstance(_filter, dict):
+        return _filter.get(key, default)
+    return getattr(_filter, key, default)
+
+
+def _float(value, default=0.0):
+    return float(value) if value not in (None, "") else default
+
+
+# Trading rules of one futures symbol, flattened from its exchange information entry and filters
+class SymbolInfo:
+    def __init__(self, symbol):
+        self.symbol = symbol.symbol
+        self.status = getattr(symbol, "status", "TRADING")
+        self.quantity_precision = int(symbol.quantityPrecision)
+        self.price_precision = int(symbol.pricePrecision)
+        self.filters = {}
+        for _filter in getattr(symbol, "filters", None) or []:
+            self.filters[_filter_value(_filter, "filterType")] = _filter
+
+        price_filter = self.filters.get("PRICE_FILTER", {})
+        lot_size = self.filters.get("LOT_SIZE", {})
+        market_lot_size = self.filters.get("MARKET_LOT_SIZE", lot_size)
+        min_notional = self.filters.get("MIN_NOTIONAL", {})
+
+        self.tick_size = _float(_filter_value(price_filter, "tickSize"), 10.0 ** -self.price_precision)
+        self.min_price = _float(_filter_value(price_filter, "minPrice"))
+        self.max_price = _float(_filter_value(price_filter, "maxPrice"))
+        self.step_size = _float(_filter_value(lot_size, "stepSize"), 10.0 ** -self.quantity_precision)
+        self.min_qty = _float(_filter_value(lot_size, "minQty"))
+        self.max_qty = _float(_filter_value(lot_size, "maxQty"))
+        self.market_step_size = _float(_filter_value(market_lot_size, "stepSize"), self.step_size)
+        self.market_min_qty = _float(_filter_value(market_lot_size, "minQty"), self.min_qty)
+        self.market_max_qty = _float(_filter_value(market_lot_size, "maxQty"), self.max_qty)
+        self.min_notional = _float(_filter_value(min_notional, "notional",
+                                                 _filter_value(min_notional, "minNotional")))
+
+    def __repr__(self):
+        return f"SymbolInfo({self.symbol}, qty_precision={self.quantity_precision}, " \
+               f"price_precision={self.price_precision}, tick={self.tick_size}, step={self.step_size})"
+
+
+# Exchange information loaded once and indexed by symbol, so the entry path never has to download it.
+# The data is only refreshed by refresh_if_stale(), which the bot calls while it is not trading.
+class SymbolRegistry:
+    def __init__(self, client, ttl=3600):
+        self.client = client
+        self.ttl = ttl
+        self.symbols = {}
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        market_data = self.client.get_exchange_information()
+        symbols = {symbol.symbol: SymbolInfo(symbol) for symbol in market_data.symbols}
+        # the request limits come with the exchange information too
+        rate_limit.limiter.configure(getattr(market_data, "rateLimits", None))
+        with self.lock:
+            self.symbols = symbols
+            self.loaded_at = time.monotonic()
+        return self
+
+    def is_stale(self):
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    def refresh_if_stale(self):
+        if self.is_stale():
+            self.load()
+
+    # O(1) lookup. Only goes to the exchange if the symbol was never seen, e.g. a newly listed market
+    def get(self, _market):
+        info = self.symbols.get(_market)
+        if info is None:
+            self.load()
+            info = self.symbols[_market]
+        return info
+
+    def __contains__(self, _market):
+        return _market in self.symbols
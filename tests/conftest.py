@@ -0,0 +1,42 @@
+import glob
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_data import OPEN, HIGH, LOW, CLOSE, VOLUME  # noqa: E402
+from mock_exchange import synthetic_klines  # noqa: E402
+
+# recorded kline files (csv/npy/.candles, a glob) to run the equivalence tests on as well, e.g.
+#   KLINE_FILES="candles/ETHUSDT/1m.candles" python -m pytest tests
+KLINE_FILES = os.environ.get("KLINE_FILES")
+
+
+# random walks with prices rounded to the tick size like real candles, so flat candles and ties show up
+def rounded_klines(bars, seed, volatility=0.0015):
+    data = synthetic_klines(bars, volatility=volatility, seed=seed)
+    data[[OPEN, HIGH, LOW, CLOSE]] = np.round(data[[OPEN, HIGH, LOW, CLOSE]], 2)
+    data[VOLUME] = np.round(data[VOLUME], 3)
+    return data
+
+
+def _series():
+    series = [
+        pytest.param(lambda: synthetic_klines(3000, seed=0), id="random"),
+        pytest.param(lambda: synthetic_klines(3000, volatility=0.01, seed=1), id="volatile"),
+        pytest.param(lambda: rounded_klines(3000, seed=2, volatility=0.0002), id="rounded"),
+    ]
+    if KLINE_FILES:
+        from backtest import load_klines
+        paths = sorted(glob.glob(KLINE_FILES))
+        series.append(pytest.param(lambda: load_klines(paths)[:, -20000:], id="recorded"))
+    return series
+
+
+# a candle series in the market_data column layout
+@pytest.fixture(params=_series())
+def klines(request):
+    return request.param()
@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from account import AccountState, UserDataStream
+from exchange import ExchangeClient
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+
+MARKET = "ETHUSDT"
+
+
+def account_update(amount, entry_price=2000.0, balance=1000.0, reason="ORDER"):
+    return {"e": "ACCOUNT_UPDATE", "a": {"m": reason, "B": [{"a": "USDT", "wb": str(balance), "cw": str(balance)}],
+                                         "P": [{"s": MARKET, "pa": str(amount), "ep": str(entry_price),
+                                                "up": "0", "mt": "cross", "ps": "BOTH"}]}}
+
+
+def order_update(order_id, status, order_type="MARKET", average_price="0"):
+    return {"e": "ORDER_TRADE_UPDATE", "o": {"s": MARKET, "i": order_id, "o": order_type, "S": "BUY", "X": status,
+                                             "x": "TRADE" if status == "FILLED" else "NEW", "q": "0.5",
+                                             "ap": average_price}}
+
+
+def test_account_update_sets_positions_and_balances():
+    account = AccountState()
+    account.load_snapshot([{"symbol": MARKET, "positionAmt": "0", "entryPrice": "0", "leverage": "5"}], [], [])
+    positions, updates = [], []
+    account.on_position(positions.append)
+    account.on_account(updates.append)
+
+    account.handle_event(account_update(0.5))
+    assert account.position_amount(MARKET) == 0.5 and account.in_position(MARKET)
+    assert account.balance() == 1000.0
+    # the stream doesn't report the leverage, the snapshot's is kept
+    assert account.position(MARKET).leverage == 5 and account.position(MARKET).margin_type == "cross"
+    assert [p.amount for p in positions] == [0.5] and len(updates) == 1
+
+    # an update that doesn't move the amount isn't a position change
+    account.handle_event(account_update(0.5, balance=990.0, reason="FUNDING_FEE"))
+    assert len(positions) == 1 and len(updates) == 2 and account.balance() == 990.0
+    account.handle_event(account_update(0.0))
+    assert not account.in_position(MARKET) and [p.amount for p in positions] == [0.5, 0.0]
+
+
+def test_config_updates_set_the_leverage():
+    account = AccountState()
+    account.handle_event({"e": "ACCOUNT_CONFIG_UPDATE", "ac": {"s": MARKET, "l": 10}})
+    assert account.position(MARKET).leverage == 10 and not account.in_position(MARKET)
+    account.handle_event(account_update(0.5))
+    account.handle_event({"e": "ACCOUNT_CONFIG_UPDATE", "ac": {"s": MARKET, "l": 3}})
+    assert account.position(MARKET).leverage == 3 and account.position_amount(MARKET) == 0.5
+    # a multi-assets mode change carries no leverage
+    account.handle_event({"e": "ACCOUNT_CONFIG_UPDATE", "ai": {"j": True}})
+    assert account.position(MARKET).leverage == 3
+
+
+def test_order_updates_track_open_orders_and_fills():
+    account = AccountState(max_fills=2)
+    orders = []
+    account.on_order(orders.append)
+    account.handle_event(order_update(1, "NEW", "STOP_MARKET"))
+    account.handle_event(order_update(2, "NEW", "TRAILING_STOP_MARKET"))
+    assert sorted(order["i"] for order in account.open_orders(MARKET)) == [1, 2]
+
+    account.handle_event(order_update(2, "CANCELED", "TRAILING_STOP_MARKET"))
+    account.handle_event(order_update(1, "FILLED", "STOP_MARKET", "1990.5"))
+    assert account.open_orders(MARKET) == [] and len(orders) == 4
+    assert account.wait_for_fill(1, timeout=0) == 1990.5
+    assert account.wait_for_fill(2, timeout=0) is None
+
+    # only the newest max_fills fills are kept
+    account.handle_event(order_update(3, "FILLED", average_price="1"))
+    account.handle_event(order_update(4, "FILLED", average_price="1"))
+    assert list(account.fills) == [3, 4]
+
+
+def test_events_wake_the_waiters():
+    account = AccountState()
+    version = account.version
+    account.handle_event(account_update(0.5))
+    assert account.wait_for_change(version, timeout=0) == version + 1
+    assert account.wait_for_position(MARKET, timeout=0)
+
+
+@pytest.fixture
+def mock():
+    exchange = MockExchange(seed=0)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(100, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    yield exchange, server
+    server.stop()
+
+
+# the REST resync replaces everything with what the exchange reports
+def test_resync_loads_the_exchange_account(mock):
+    exchange, server = mock
+    client = ExchangeClient(url=server.url)
+    client.new_order(symbol=MARKET, side="BUY", type="MARKET", quantity="0.5")
+    client.new_order(symbol=MARKET, side="SELL", type="STOP_MARKET", quantity="0.5", reduceOnly="true",
+                     stopPrice=str(round(exchange.markets[MARKET].price * 0.9, 2)))
+    account = AccountState()
+    account.handle_event(order_update(99, "NEW"))
+    UserDataStream(client, account, url=server.ws_url).resync()
+    assert account.loaded
+    assert account.position_amount(MARKET) == 0.5
+    assert account.position(MARKET).entry_price == pytest.approx(exchange.markets[MARKET].entry_price)
+    assert account.balance() == pytest.approx(exchange.wallet)
+    assert [order["o"] for order in account.open_orders(MARKET)] == ["STOP_MARKET"]
+
+
+# an exchange the stream can't get a listen key from
+class NoListenKey:
+    def new_listen_key(self):
+        raise OSError("no listen key")
+
+    def close_listen_key(self):
+        raise OSError("no listen key")
+
+
+def test_stream_errors_are_logged(caplog):
+    stream = UserDataStream(NoListenKey(), AccountState())
+    with caplog.at_level(logging.WARNING, logger="account"):
+        stream._running = True
+        thread = threading.Thread(target=stream._run, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while "can't get a listen key" not in caplog.text and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stream.stop()
+    assert "can't get a listen key" in caplog.text and "can't close the listen key" in caplog.text
+    assert "OSError: no listen key" in caplog.text
@@ -0,0 +1,126 @@
+import math
+
+import pytest
+
+import bot_functions as bf
+from account import AccountState
+from accounting import Accounting
+from journal import TradeJournal, load_journal
+
+
+def fill(market, side, qty, price, realized=0.0, commission=0.0, asset="USDT", order_id=1, reduce_only=False):
+    return {"s": market, "i": order_id, "S": side, "o": "MARKET", "x": "TRADE", "X": "FILLED", "l": str(qty),
+            "L": str(price), "rp": str(realized), "n": str(commission), "N": asset, "R": reduce_only, "sp": "0"}
+
+
+def positions(*rows, reason="ORDER", paid=0.0):
+    return {"m": reason, "B": [{"a": "USDT", "wb": "1000", "bc": str(paid)}],
+            "P": [{"s": market, "pa": str(amount), "ep": str(entry_price), "up": "0", "ps": "BOTH"}
+                  for market, amount, entry_price in rows]}
+
+
+# the totals add up from the markets' books
+def assert_totals(accounting):
+    totals = accounting.totals()
+    books = accounting.snapshot().markets.values()
+    for name in ("realized_pnl", "unrealized_pnl", "commission", "funding", "net_pnl", "exposure", "net_exposure"):
+        assert getattr(totals, name) == pytest.approx(sum(getattr(book, name) for book in books)), name
+    return totals
+
+
+def test_partial_close_realizes_its_share():
+    accounting = Accounting()
+    accounting.on_order(fill("ETHUSDT", "BUY", 1.0, 2000.0, commission=0.8))
+    accounting.on_account_update(positions(("ETHUSDT", 1.0, 2000.0)))
+    accounting.mark("ETHUSDT", 2050.0)
+    accounting.on_order(fill("ETHUSDT", "SELL", 0.4, 2100.0, realized=40.0, commission=0.336, reduce_only=True))
+    accounting.on_account_update(positions(("ETHUSDT", 0.6, 2000.0)))
+
+    eth = accounting.market("ETHUSDT")
+    assert eth.realized_pnl == 40.0 and eth.commission == pytest.approx(1.136)
+    assert eth.unrealized_pnl == pytest.approx(30.0) and eth.exposure == pytest.approx(1230.0)
+    assert eth.net_pnl == pytest.approx(40.0 + 30.0 - 1.136)
+    assert eth.fills == 2 and eth.volume == pytest.approx(2000.0 + 840.0)
+    assert assert_totals(accounting).net_pnl == pytest.approx(eth.net_pnl)
+
+
+# commission paid in BNB is kept apart from the USDT figures
+def test_other_commissions():
+    accounting = Accounting()
+    accounting.on_order(fill("ETHUSDT", "BUY", 1.0, 2000.0, commission=0.002, asset="BNB"))
+    assert accounting.totals().commission == 0.0
+    assert accounting.snapshot().other_commissions == {"BNB": 0.002}
+
+
+# selling more than the long flips the position: the long's loss is realized, the short is marked on
+def test_flip():
+    accounting = Accounting()
+    accounting.on_order(fill("ETHUSDT", "BUY", 1.0, 2000.0))
+    accounting.on_account_update(positions(("ETHUSDT", 1.0, 2000.0)))
+    accounting.mark("ETHUSDT", 1950.0)
+    assert accounting.totals().net_exposure == pytest.approx(1950.0)
+    accounting.on_order(fill("ETHUSDT", "SELL", 1.5, 1900.0, realized=-100.0, order_id=2))
+    accounting.on_account_update(positions(("ETHUSDT", -0.5, 1900.0)))
+    accounting.mark("ETHUSDT", 1800.0)
+
+    eth = accounting.market("ETHUSDT")
+    assert eth.amount == -0.5 and eth.realized_pnl == -100.0 and eth.unrealized_pnl == pytest.approx(50.0)
+    totals = assert_totals(accounting)
+    assert totals.exposure == pytest.approx(900.0) and totals.net_exposure == pytest.approx(-900.0)
+
+
+# before there is a mark price the exposure is at the entry price and the unrealized profit as reported
+def test_exposure_over_markets():
+    accounting = Accounting()
+    accounting.on_account_update({"m": "ORDER", "B": [], "P": [
+        {"s": "ETHUSDT", "pa": "1.0", "ep": "2000.0", "up": "5.0", "ps": "BOTH"},
+        {"s": "BTCUSDT", "pa": "-0.1", "ep": "30000.0", "up": "-2.0", "ps": "BOTH"}]})
+    totals = assert_totals(accounting)
+    assert totals.exposure == pytest.approx(5000.0) and totals.net_exposure == pytest.approx(-1000.0)
+    assert totals.unrealized_pnl == pytest.approx(3.0)
+    accounting.mark("BTCUSDT", 31000.0)
+    totals = assert_totals(accounting)
+    assert totals.exposure == pytest.approx(5100.0) and totals.unrealized_pnl == pytest.approx(5.0 - 100.0)
+
+
+# a cross margin funding payment is split over the open positions by their notional at the mark price
+def test_funding_over_two_positions():
+    accounting = Accounting()
+    accounting.on_account_update(positions(("ETHUSDT", 1.0, 2900.0), ("BTCUSDT", -0.1, 19000.0)))
+    accounting.mark("ETHUSDT", 3000.0)
+    accounting.mark("BTCUSDT", 20000.0)
+    accounting.on_account_update(positions(reason="FUNDING_FEE", paid=-5.0))
+    assert accounting.market("ETHUSDT").funding == pytest.approx(-3.0)
+    assert accounting.market("BTCUSDT").funding == pytest.approx(-2.0)
+    assert assert_totals(accounting).funding == pytest.approx(-5.0)
+
+    # an isolated position's payment names its market
+    accounting.on_account_update(positions(("BTCUSDT", -0.1, 19000.0), reason="FUNDING_FEE", paid=1.0))
+    assert accounting.market("BTCUSDT").funding == pytest.approx(-1.0)
+    assert accounting.market("ETHUSDT").funding == pytest.approx(-3.0)
+    # with no position open it only moves the total
+    accounting.on_account_update(positions(("ETHUSDT", 0.0, 0.0), ("BTCUSDT", 0.0, 0.0)))
+    accounting.on_account_update(positions(reason="FUNDING_FEE", paid=-1.0))
+    assert accounting.totals().funding == pytest.approx(-5.0)
+
+
+# exits are logged with the leverage the account reports for the position
+def test_exits_are_logged_with_the_positions_leverage(tmp_path, monkeypatch):
+    path = tmp_path / "trade_log.csv"
+    monkeypatch.setattr(bf, "_journal", TradeJournal(str(path)))
+    account = AccountState()
+    account.load_snapshot([{"symbol": "ETHUSDT", "positionAmt": "1.0", "entryPrice": "2000.0", "leverage": "7"}],
+                          [], [])
+    Accounting(log_trades=True).attach(account)
+    account.handle_event({"e": "ORDER_TRADE_UPDATE",
+                          "o": fill("ETHUSDT", "SELL", 1.0, 2100.0, realized=100.0, reduce_only=True)})
+    account.handle_event({"e": "ACCOUNT_CONFIG_UPDATE", "ac": {"s": "BTCUSDT", "l": 12}})
+    account.handle_event({"e": "ORDER_TRADE_UPDATE",
+                          "o": fill("BTCUSDT", "BUY", 0.1, 20000.0, realized=-10.0, order_id=2, reduce_only=True)})
+    # an account that doesn't know the leverage leaves it empty
+    Accounting(log_trades=True).on_order(fill("XRPUSDT", "BUY", 10, 0.5, realized=1.0, reduce_only=True))
+    bf._journal.close()
+    log = load_journal(str(path))
+    assert list(log["market"]) == ["ETHUSDT", "BTCUSDT", "XRPUSDT"]
+    assert list(log["leverage"][:2]) == [7.0, 12.0] and math.isnan(log["leverage"][2])
+    assert list(log["pnl"]) == [100.0, -10.0, 1.0]
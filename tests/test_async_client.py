@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+
+from async_client import ConnectionPool, Client, _namespace
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+
+MARKET = "ETHUSDT"
+
+
+def test_namespace_only_converts_numeric_fields():
+    order = _namespace({"orderId": 12, "clientOrderId": "0012345", "symbol": "1000SHIBUSDT", "origQty": "0.500",
+                        "price": "-1.5", "stopPrice": "", "filters": [{"filterType": "LOT_SIZE", "stepSize": "0.001"}]})
+    assert order.clientOrderId == "0012345" and order.symbol == "1000SHIBUSDT"
+    assert order.orderId == 12 and order.origQty == 0.5 and order.price == -1.5 and order.stopPrice == ""
+    # exchange information filters stay strings, like binance_f leaves them
+    assert order.filters[0].stepSize == "0.001"
+
+
+@pytest.fixture
+def mock():
+    exchange = MockExchange(seed=0)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(100, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    yield exchange, server
+    server.stop()
+
+
+# a pool that counts the connections it opens
+def counting_pool(url):
+    pool = ConnectionPool(url)
+    pool.connections = 0
+    connect = pool._connect
+
+    async def counted():
+        pool.connections += 1
+        return await connect()
+    pool._connect = counted
+    return pool
+
+
+def test_pool_reuses_a_kept_alive_connection(mock):
+    _, server = mock
+    pool = counting_pool(server.url)
+
+    async def run():
+        responses = [await pool.request("GET", "/fapi/v1/time") for _ in range(3)]
+        await pool.close()
+        return responses
+
+    responses = asyncio.run(run())
+    assert [status for status, _, _ in responses] == [200, 200, 200]
+    assert "serverTime" in json.loads(responses[-1][2])
+    assert pool.connections == 1
+
+
+# the server closes the connection after answering, the next request goes out on a new one
+def test_pool_reconnects_after_the_server_closes(mock):
+    _, server = mock
+    pool = counting_pool(server.url)
+
+    async def run():
+        first = await pool.request("GET", "/fapi/v1/time", headers={"Connection": "close"})
+        await asyncio.sleep(0.05)
+        second = await pool.request("GET", "/fapi/v1/ticker/price?symbol=ETHUSDT")
+        await pool.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first[0] == 200 and second[0] == 200
+    assert json.loads(second[2])["symbol"] == MARKET
+    assert pool.connections == 2
+
+
+# answers every request with a chunked body, then one without a length that ends with the connection
+async def chunked_server(reader, writer):
+    await reader.readuntil(b"\r\n\r\n")
+    writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                 b"5\r\n{\"a\":\r\n4;ext=1\r\n 1, \r\n7\r\n\"b\": 2}\r\n0\r\n\r\n")
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+    writer.write(b"HTTP/1.1 200 OK\r\n\r\n[1, 2]")
+    await writer.drain()
+    writer.close()
+
+
+def test_pool_reads_chunked_and_unsized_bodies():
+    async def run():
+        server = await asyncio.start_server(chunked_server, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = counting_pool(f"http://127.0.0.1:{port}")
+        chunked = await pool.request("GET", "/")
+        unsized = await pool.request("GET", "/")
+        await pool.close()
+        server.close()
+        return pool, chunked, unsized
+
+    pool, chunked, unsized = asyncio.run(run())
+    assert json.loads(chunked[2]) == {"a": 1, "b": 2}
+    assert unsized[2] == b"[1, 2]"
+    # the chunked response kept the connection, the unsized one ended it
+    assert pool.connections == 1 and pool._idle == []
+
+
+def test_client_facade(mock):
+    exchange, server = mock
+    client = Client(url=server.url)
+    try:
+        assert client.get_mark_price(MARKET).markPrice == pytest.approx(exchange.markets[MARKET].price)
+        order = client.post_order(symbol=MARKET, side="BUY", ordertype="MARKET", quantity="0.5",
+                                  newClientOrderId="42")
+        assert order.clientOrderId == "42" and order.origQty == 0.5
+        assert client.get_position_v2()[0].positionAmt == 0.5
+    finally:
+        client.close()
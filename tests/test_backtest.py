@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import backtest as bt
+import bot_functions as bf
+from market_data import OPEN_TIME, CLOSE
+from mock_exchange import synthetic_klines
+from rules import Strategy
+
+
+# every name scalp() decides on is there, with the value scalp_indicators gives on the same 1000 candles
+def test_indicators_match_bot_functions(klines):
+    window = klines[:, :1000]
+    expected = bf.scalp_indicators(window, window[CLOSE][-1])
+    indicators = bt.scalp_indicators(window)
+    assert set(indicators) == set(expected)
+    for name, value in expected.items():
+        assert indicators[name][999] == pytest.approx(value, rel=1e-9, abs=1e-9), name
+
+
+def test_cache_keeps_the_arrays():
+    data = synthetic_klines(500, seed=0)
+    cache = {}
+    first = bt.scalp_indicators(data, cache=cache)
+    second = bt.scalp_indicators(data, ma_period=30, cache=cache)
+    assert second['rsi'] is first['rsi'] and second['macdhist_last'] is first['macdhist_last']
+    assert second['ma_fiftyhigh'] is not first['ma_fiftyhigh']
+
+
+# a rule on an indicator the default rules don't use backtests like any other
+def test_backtest_a_rule_on_rsi():
+    data = synthetic_klines(3000, volatility=0.003, seed=1)
+    strategy = Strategy(long="rsi < 30", short="rsi > 70")
+    rsi = bt.scalp_indicators(data)['rsi']
+    signals = bt.scalp_signals(bt.scalp_indicators(data), strategy)
+    assert list(signals) == list(np.where(rsi > 70, -1, np.where(rsi < 30, 1, 0)))
+    trades, equity, summary = bt.run_backtest(data, strategy=strategy)
+    assert summary['trades'] == len(trades) > 0
+    assert all(signals[np.searchsorted(data[OPEN_TIME], trade['entry_time'])] == trade['side'] for trade in trades)
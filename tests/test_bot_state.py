@@ -0,0 +1,67 @@
+import pytest
+
+from account import AccountState, UserDataStream
+from bot_state import BotState, FLAT, RESUMED, UNPROTECTED, CLOSED
+
+
+# answers the REST resync with one position and its orders, the user data stream never connects
+class StubExchange:
+    def __init__(self, amount=0.0, orders=(), fail=False):
+        self.amount = amount
+        self.orders = list(orders)
+        self.fail = fail
+
+    def new_listen_key(self):
+        raise OSError("no user data stream")
+
+    def keepalive_listen_key(self):
+        pass
+
+    def position_risk(self):
+        if self.fail:
+            raise OSError("no REST api")
+        return [{"symbol": "ETHUSDT", "positionAmt": str(self.amount), "entryPrice": "2000.0", "leverage": "5"}]
+
+    def balance(self):
+        return [{"asset": "USDT", "balance": "1000.0"}]
+
+    def open_orders(self):
+        return [{"symbol": "ETHUSDT", "orderId": order_id, "type": order_type, "side": "SELL", "status": "NEW",
+                 "origQty": "0.5"} for order_id, order_type in self.orders]
+
+
+def loaded_account(**values):
+    return UserDataStream(StubExchange(**values), AccountState()).start(timeout=0.1).account
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = BotState(str(tmp_path / "bot_state.json"))
+    state.entered("ETHUSDT", 1, 0.5, 2000.0, [11, 12])
+    return state
+
+
+def test_unloaded_account_keeps_the_snapshot(state):
+    with pytest.raises(RuntimeError):
+        state.reconcile("ETHUSDT", AccountState())
+    assert state.in_position("ETHUSDT")
+    assert BotState(state.path).market("ETHUSDT")["qty"] == 0.5
+
+
+def test_start_loads_the_account_without_the_stream(state):
+    account = loaded_account(amount=0.5, orders=[(11, "STOP_MARKET")])
+    assert account.loaded
+    assert state.reconcile("ETHUSDT", account) == RESUMED
+
+
+def test_start_raises_when_the_account_cant_be_loaded():
+    with pytest.raises(OSError):
+        loaded_account(fail=True)
+
+
+def test_reconcile(state):
+    assert state.reconcile("ETHUSDT", loaded_account(amount=-0.5, orders=[(13, "TAKE_PROFIT_MARKET")])) == UNPROTECTED
+    assert state.market("ETHUSDT")["side"] == -1 and state.market("ETHUSDT")["orders"] == [13]
+    assert state.reconcile("ETHUSDT", loaded_account()) == CLOSED
+    assert not state.in_position("ETHUSDT")
+    assert state.reconcile("ETHUSDT", loaded_account()) == FLAT
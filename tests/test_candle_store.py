@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from candle_store import CandleFile, CandleStore, HEADER_SIZE
+from exchange import ExchangeClient
+from market_data import OPEN_TIME, CLOSE, INTERVALS, fetch_candles
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+
+MARKET = "ETHUSDT"
+MINUTE = INTERVALS["1m"]
+
+
+def test_append_and_slice(tmp_path):
+    data = synthetic_klines(30)
+    candle_file = CandleFile(str(tmp_path / "1m.candles"), MINUTE)
+    assert len(candle_file) == 0 and candle_file.last_open_time() == 0
+    assert candle_file.append(data[:, :10]) == 10
+    # candles already stored are skipped, the rest appended
+    assert candle_file.append(data[:, 5:15]) == 5
+    np.testing.assert_array_equal(candle_file.candles(), data[:, :15])
+
+    open_times = data[OPEN_TIME]
+    np.testing.assert_array_equal(candle_file.candles(start_time=open_times[3], end_time=open_times[7]), data[:, 3:7])
+    np.testing.assert_array_equal(candle_file.candles(end_time=open_times[12], limit=4), data[:, 8:12])
+    np.testing.assert_array_equal(candle_file.candles(limit=100), data[:, :15])
+    assert candle_file.candles(start_time=open_times[-1]).shape == (len(data), 0)
+
+
+# with contiguous=True a candle that doesn't follow the last stored one is not written
+def test_contiguous_append_refuses_a_gap(tmp_path):
+    data = synthetic_klines(30)
+    candle_file = CandleFile(str(tmp_path / "1m.candles"), MINUTE)
+    candle_file.append(data[:, :10])
+    assert candle_file.append(data[:, 11:12], contiguous=True) == 0
+    assert candle_file.append(data[:, 10:12], contiguous=True) == 2
+    assert len(candle_file) == 12 and candle_file.last_open_time() == data[OPEN_TIME, 11]
+
+
+# the partial row of an interrupted append is dropped when the file is opened again
+def test_reopen_drops_a_partial_row(tmp_path):
+    path = tmp_path / "1m.candles"
+    data = synthetic_klines(10)
+    CandleFile(str(path), MINUTE).append(data)
+    with open(path, "ab") as f:
+        f.write(b"\1" * 20)
+    candle_file = CandleFile.open(str(path))
+    assert candle_file.interval_ms == MINUTE and len(candle_file) == 10
+    assert path.stat().st_size == HEADER_SIZE + 10 * len(data) * 8
+    np.testing.assert_array_equal(candle_file.candles(), data)
+    with pytest.raises(ValueError):
+        CandleFile(str(path), INTERVALS["5m"])
+
+
+@pytest.fixture
+def mock():
+    exchange = MockExchange(seed=0)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(3000, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    yield exchange, ExchangeClient(url=server.url)
+    server.stop()
+
+
+# move the market on until `candles` more candles have closed
+def ticks(exchange, candles):
+    market = exchange.markets[MARKET]
+    index = market.index + candles
+    while market.index < index:
+        exchange.tick()
+
+
+def assert_contiguous(candle_file):
+    assert np.all(np.diff(candle_file.candles()[OPEN_TIME]) == candle_file.interval_ms)
+
+
+# the first sync stores the newest closed candles and keeps the one in progress aside for recent()
+def test_sync_and_recent(mock, tmp_path):
+    exchange, client = mock
+    store = CandleStore(str(tmp_path))
+    assert store.sync(client, MARKET, "1m", history=100) == 99
+    candle_file = store.file(MARKET, "1m")
+    assert_contiguous(candle_file)
+
+    ticks(exchange, 2)
+    recent = store.recent(client, MARKET, "1m", limit=50)
+    np.testing.assert_array_equal(recent, fetch_candles(client, MARKET, "1m", 50))
+    assert len(candle_file) == 101
+    # the candle in progress moves on, the stored ones don't
+    exchange.tick()
+    assert store.recent(client, MARKET, "1m", limit=50)[CLOSE, -1] == exchange.markets[MARKET].price
+    assert len(candle_file) == 101
+
+
+# history beyond one request pages forward from the oldest candle wanted
+def test_sync_pages_through_a_long_history(mock, tmp_path):
+    _, client = mock
+    store = CandleStore(str(tmp_path))
+    assert store.sync(client, MARKET, "1m", history=250, batch=100) == 249
+    np.testing.assert_array_equal(store.candles(MARKET, "1m"), fetch_candles(client, MARKET, "1m", 250)[:, :-1])
+
+
+# a restart after a partial write and a time gap downloads only what is missing, in batches
+def test_resume_after_a_partial_file_and_a_gap(mock, tmp_path):
+    exchange, client = mock
+    store = CandleStore(str(tmp_path))
+    store.sync(client, MARKET, "1m", history=100)
+    with open(store.path(MARKET, "1m"), "ab") as f:
+        f.write(b"\0" * 30)
+
+    ticks(exchange, 230)
+    restarted = CandleStore(str(tmp_path))
+    assert len(restarted.file(MARKET, "1m")) == 99
+    assert restarted.sync(client, MARKET, "1m", batch=100) == 230
+    candle_file = restarted.file(MARKET, "1m")
+    assert len(candle_file) == 329
+    assert_contiguous(candle_file)
+    np.testing.assert_array_equal(candle_file.candles()[:, -50:], fetch_candles(client, MARKET, "1m", 51)[:, :-1])
+    # streamed candles only extend the file without a gap
+    ticks(exchange, 1)
+    newest = fetch_candles(client, MARKET, "1m", 3)
+    assert restarted.append(MARKET, "1m", newest[:, 2:]) == 0
+    assert restarted.append(MARKET, "1m", newest[:, :2]) == 1
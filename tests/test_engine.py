@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+
+import bot_functions as bf
+from async_client import Client
+from bot_state import BotState
+from engine import MultiMarketEngine
+from journal import TradeJournal
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+
+# MultiMarketEngine.start against the mock exchange, with positions left open by a previous run.
+
+MARKETS = ("ETHUSDT", "BTCUSDT")
+
+
+def settings(market):
+    return SimpleNamespace(market=market, leverage="5", margin_type="CROSSED", trading_periods="5m",
+                           take_profit="1.6", stop_loss="1.3", trailing_percentage="0.4")
+
+
+# exits go to a trade log of their own, not the bot's trade_log.csv
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    journal = TradeJournal(str(tmp_path / "trade_log.csv"))
+    monkeypatch.setattr(bf, "_journal", journal)
+    return journal
+
+
+@pytest.fixture
+def mock():
+    exchange = MockExchange(balance=100000.0, seed=0)
+    for seed, market in enumerate(MARKETS):
+        exchange.add_market(MockMarket(market, synthetic_klines(3000, seed=seed)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    client = Client(url=server.url)
+    yield exchange, server, client
+    client.close()
+    server.stop()
+
+
+def test_start_resumes_open_positions(mock, tmp_path):
+    exchange, server, client = mock
+    client.new_order(symbol="ETHUSDT", side="SELL", type="MARKET", quantity="0.5")
+    bot_state = BotState(str(tmp_path / "bot_state.json"))
+    engine = MultiMarketEngine(client, client, [settings(market) for market in MARKETS], None, url=server.ws_url,
+                               bot_state=bot_state)
+    engine.start()
+    try:
+        eth, btc = engine.states
+        assert (eth.in_position, eth.side, eth.qty) == (True, -1, 0.5)
+        assert (btc.in_position, btc.side) == (False, 0)
+        # the position had no stop loss, it gets its protective orders
+        orders = sorted(order["type"] for order in exchange.open_orders({"symbol": "ETHUSDT"}))
+        assert orders == ["STOP_MARKET", "TRAILING_STOP_MARKET"]
+        # nothing is entered on top of it
+        engine.on_candle_close(eth)
+        assert exchange.markets["ETHUSDT"].amount == -0.5
+        saved = BotState(bot_state.path).market("ETHUSDT")
+        assert (saved["side"], saved["qty"], len(saved["orders"])) == (-1, 0.5, 2)
+
+        # the position closes, the snapshot follows
+        client.new_order(symbol="ETHUSDT", side="BUY", type="MARKET", quantity="0.5", reduceOnly="true")
+        with engine.account.condition:
+            assert engine.account.condition.wait_for(lambda: not engine.account.in_position("ETHUSDT"), 5)
+        engine.check_positions()
+        assert not eth.in_position and not BotState(bot_state.path).in_position("ETHUSDT")
+    finally:
+        engine.stream.stop()
+        engine.user_stream.stop()
+
+
+# leverage and margin type are left alone in a market that already has them
+def test_start_only_initialises_markets_that_need_it(mock, monkeypatch):
+    exchange, server, client = mock
+    exchange.markets["ETHUSDT"].leverage = 5
+    initialised = []
+    monkeypatch.setattr(bf, "initialise_futures", lambda client, _market, **kwargs: initialised.append(_market))
+    engine = MultiMarketEngine(client, client, [settings(market) for market in MARKETS], None, url=server.ws_url)
+    engine.start()
+    try:
+        assert initialised == ["BTCUSDT"]
+    finally:
+        engine.stream.stop()
+        engine.user_stream.stop()
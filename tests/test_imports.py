@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What bot.py and engine.py import on start. pandas, talib and binance_f cost most of the start up time and are
+# only imported by the functions that use them (to_dataframe, scalp_indicators, init_client), so none of these
+# modules may load them.
+START_MODULES = ["bot_functions", "config", "metrics", "market_data", "indicators", "symbols", "orders", "account",
+                 "scheduler", "bot_state", "accounting", "engine", "market_hub", "resampler", "candle_store",
+                 "exchange", "journal"]
+HEAVY_MODULES = ["pandas", "talib", "binance_f"]
+
+
+@pytest.mark.parametrize("module", START_MODULES)
+def test_start_modules_skip_heavy_imports(module):
+    code = "import sys, {}; print(' '.join(m for m in {!r} if m in sys.modules))".format(module, HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == []
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import talib.abstract as ta
+
+from indicators import SMA, EMA, StochF, ADX, CCI, RSI, MFI, MACDExt, ScalpIndicators
+from market_data import CandleBuffer, candle_inputs, HIGH, LOW, CLOSE, VOLUME
+
+# The streaming indicators fed one candle at a time must give the value TA-Lib computes over the whole series
+# at every candle, warm-up NaNs included.
+
+RTOL = 1e-9
+ATOL = 1e-8
+
+
+def assert_close(streamed, batch):
+    np.testing.assert_allclose(np.asarray(streamed, dtype=float), np.asarray(batch, dtype=float), rtol=RTOL,
+                               atol=ATOL, equal_nan=True)
+
+
+# indicator name -> (streaming indicator, input columns, TA-Lib batch output)
+def single_output_cases(inputs):
+    return {
+        "sma": (SMA(50), (HIGH,), ta.MA(inputs, timeperiod=50, price="high")),
+        "ema": (EMA(200), (CLOSE,), ta.EMA(inputs, timeperiod=200, price="close")),
+        "ema_short": (EMA(3), (LOW,), ta.EMA(inputs, timeperiod=3, price="low")),
+        "adx": (ADX(14), (HIGH, LOW, CLOSE), ta.ADX(inputs)),
+        "cci": (CCI(20), (HIGH, LOW, CLOSE), ta.CCI(inputs, timeperiod=20)),
+        "rsi": (RSI(14), (CLOSE,), ta.RSI(inputs, timeperiod=14)),
+        "mfi": (MFI(14), (HIGH, LOW, CLOSE, VOLUME), ta.MFI(inputs)),
+    }
+
+
+@pytest.mark.parametrize("name", ["sma", "ema", "ema_short", "adx", "cci", "rsi", "mfi"])
+def test_streaming_indicator_matches_talib(klines, name):
+    indicator, columns, batch = single_output_cases(candle_inputs(klines))[name]
+    peeked, streamed = [], []
+    for bar in klines.T:
+        values = [bar[column] for column in columns]
+        peeked.append(indicator.peek(*values))
+        streamed.append(indicator.update(*values))
+    assert_close(streamed, batch)
+    assert_close(peeked, streamed)
+
+
+def test_stochf_matches_talib(klines):
+    inputs = candle_inputs(klines)
+    fastk, fastd = ta.STOCHF(inputs["high"], inputs["low"], inputs["close"], fastk_period=5, fastd_period=3,
+                             fastd_matype=0)
+    stochf = StochF(5, 3)
+    streamed = [stochf.update(bar[HIGH], bar[LOW], bar[CLOSE]) for bar in klines.T]
+    assert_close([value[0] for value in streamed], fastk)
+    assert_close([value[1] for value in streamed], fastd)
+
+
+def test_macdext_matches_talib(klines):
+    macd, signal, hist = ta.MACDEXT(candle_inputs(klines), fast_matype=5, slow_period=7, signal_period=9,
+                                    price="close")
+    indicator = MACDExt()
+    streamed = np.array([indicator.update(bar[CLOSE]) for bar in klines.T])
+    assert_close(streamed[:, 0], macd)
+    assert_close(streamed[:, 1], signal)
+    assert_close(streamed[:, 2], hist)
+
+
+# the full ScalpIndicators engine seeded from a buffer against scalp_indicators on the same 1000 candles
+def test_scalp_indicators_match_batch(klines):
+    from bot_functions import scalp_indicators
+
+    size = 1000
+    buffer = CandleBuffer(size=size)
+    indicators = ScalpIndicators().attach(buffer)
+    for end in range(size, klines.shape[1] + 1, 250):
+        window = klines[:, end - size:end]
+        buffer.seed(window)
+        expected = scalp_indicators(window, 1.0)
+        actual = indicators.peek(buffer.last(), 1.0)
+        assert expected.keys() <= actual.keys()
+        for name, value in expected.items():
+            assert_close(actual[name], value)
@@ -0,0 +1,79 @@
+import pytest
+
+import bot_functions as bf
+from accounting import Accounting
+from journal import TradeJournal, LOG_COLUMNS, load_journal, summarise_markets
+
+
+def row(market="ETHUSDT", pnl=1.0, time=1.0):
+    return {"market": market, "leverage": 5, "qty": 0.5, "cause": "STOP_MARKET", "side": -1, "time": time,
+            "trigger_price": 2000.0, "type": "exit", "market_price": 2001.0, "pnl": pnl, "fee": 0.1}
+
+
+def test_append_writes_one_line_per_row(tmp_path):
+    path = tmp_path / "trade_log.csv"
+    journal = TradeJournal(str(path))
+    journal.append(row(pnl=1.0))
+    journal.append(row(pnl=2.0))
+    # every line ends with "\n", the header and the rows alike
+    content = path.read_bytes()
+    assert b"\r" not in content and content.count(b"\n") == 3
+    journal.close()
+    log = load_journal(str(path))
+    assert list(log) == LOG_COLUMNS
+    assert list(log["pnl"]) == [1.0, 2.0] and list(log["market"]) == ["ETHUSDT", "ETHUSDT"]
+
+
+# queued rows are all written by the time close() returns
+def test_close_flushes_the_background_queue(tmp_path):
+    path = tmp_path / "trade_log.csv"
+    journal = TradeJournal(str(path), background=True, flush_interval=60)
+    for i in range(100):
+        journal.append(row(time=float(i)))
+    journal.close()
+    assert not journal._thread.is_alive()
+    assert list(load_journal(str(path))["time"]) == [float(i) for i in range(100)]
+
+
+# reopening drops the partial last line of a crash and upgrades a log without the pnl and fee columns
+def test_reopen_repairs_the_file(tmp_path):
+    path = tmp_path / "trade_log.csv"
+    old_columns = LOG_COLUMNS[:9]
+    path.write_text(",".join(old_columns) + "\n" + "ETHUSDT,5,0.5,signal,1,1.0,0,entry,2000.0\n" + "BTCUSDT,5,0.")
+    journal = TradeJournal(str(path))
+    assert journal.columns == LOG_COLUMNS
+    journal.append(row(time=2.0))
+    journal.close()
+    content = path.read_bytes()
+    assert b"\r" not in content and content.endswith(b"\n")
+    log = load_journal(str(path))
+    assert list(log["market"]) == ["ETHUSDT", "ETHUSDT"] and list(log["time"]) == [1.0, 2.0]
+    assert list(log["type"]) == ["entry", "exit"]
+
+
+def test_summarise_markets(tmp_path):
+    path = tmp_path / "trade_log.csv"
+    journal = TradeJournal(str(path))
+    journal.append(row("ETHUSDT", pnl=1.0, time=1.0))
+    journal.append(row("BTCUSDT", pnl=-2.0, time=2.0))
+    journal.append(row("ETHUSDT", pnl=3.0, time=3.0))
+    journal.close()
+    summary = summarise_markets(load_journal(str(path)))
+    assert summary["ETHUSDT"]["trades"] == 2 and summary["ETHUSDT"]["pnl"] == 4.0
+    assert summary["ETHUSDT"]["fees"] == pytest.approx(0.2) and summary["ETHUSDT"]["last_time"] == 3.0
+    assert summary["BTCUSDT"]["trades"] == 1 and summary["BTCUSDT"]["pnl"] == -2.0
+
+
+# a funding payment for two positions is logged as one row per market with its share
+def test_funding_rows_are_per_market(tmp_path, monkeypatch):
+    path = tmp_path / "trade_log.csv"
+    monkeypatch.setattr(bf, "_journal", TradeJournal(str(path)))
+    accounting = Accounting(log_trades=True)
+    accounting.on_account_update({"m": "ORDER", "B": [], "P": [
+        {"s": "ETHUSDT", "pa": "1.0", "ep": "3000.0", "up": "0"},
+        {"s": "BTCUSDT", "pa": "-0.1", "ep": "10000.0", "up": "0"}]})
+    accounting.on_account_update({"m": "FUNDING_FEE", "B": [{"a": "USDT", "wb": "990", "bc": "-4.0"}], "P": []})
+    bf._journal.close()
+    summary = summarise_markets(load_journal(str(path)))
+    assert sorted(summary) == ["BTCUSDT", "ETHUSDT"]
+    assert summary["ETHUSDT"]["pnl"] == pytest.approx(-3.0) and summary["BTCUSDT"]["pnl"] == pytest.approx(-1.0)
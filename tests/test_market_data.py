@@ -0,0 +1,137 @@
+import threading
+
+import numpy as np
+import pytest
+
+from async_client import Client
+from exchange import ExchangeClient
+from market_data import CandleBuffer, MarketData, MarketStream, OPEN_TIME, CLOSE, COLUMNS
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+
+MARKET = "ETHUSDT"
+
+
+def kline(row, closed=False):
+    return {"t": row[OPEN_TIME], "o": row[1], "h": row[2], "l": row[3], "c": row[4], "v": row[5], "n": row[6],
+            "x": closed}
+
+
+def test_seed_keeps_the_newest_candles():
+    data = synthetic_klines(30)
+    buffer = CandleBuffer(size=20)
+    seeds = []
+    buffer.on_seed(seeds.append)
+    buffer.seed(data[:, :5])
+    np.testing.assert_array_equal(buffer.snapshot(), data[:, :5])
+    buffer.seed(data)
+    np.testing.assert_array_equal(buffer.snapshot(), data[:, -20:])
+    assert buffer.last_open_time() == data[OPEN_TIME, -1]
+    assert seeds == [buffer, buffer]
+
+
+# the in-progress candle is rewritten, a new open time appends and a closed kline runs the close callbacks
+def test_update_and_close():
+    data = synthetic_klines(10)
+    buffer = CandleBuffer(size=20)
+    buffer.seed(data[:, :5])
+    closes = []
+    buffer.on_close(lambda b: closes.append(b.last()))
+
+    row = data[:, 5].copy()
+    assert not buffer.update(kline(row))
+    row[CLOSE] += 1.0
+    assert not buffer.update(kline(row))
+    assert buffer.count == 6 and buffer.last()[CLOSE] == row[CLOSE]
+    assert buffer.update(kline(row, closed=True))
+    np.testing.assert_array_equal(closes[-1], row)
+    # a stale message from before the last candle changes nothing
+    assert not buffer.update(kline(data[:, 2], closed=True))
+    # the first close is the last seeded candle's, reported when the next one started
+    assert len(closes) == 2 and buffer.count == 6
+
+
+# the last seeded candle was still open, its close is reported when the next candle starts
+def test_missed_close_is_reported():
+    data = synthetic_klines(10)
+    buffer = CandleBuffer(size=20)
+    buffer.seed(data[:, :5])
+    closes = []
+    buffer.on_close(lambda b: closes.append(b.last_open_time()))
+    buffer.update(kline(data[:, 5]))
+    assert closes == [data[OPEN_TIME, 4]]
+    buffer.update(kline(data[:, 5], closed=True))
+    buffer.update(kline(data[:, 6]))
+    assert closes == [data[OPEN_TIME, 4], data[OPEN_TIME, 5]]
+
+
+# past the end of the ring the newest candles are still one contiguous view in order
+def test_wraparound():
+    data = synthetic_klines(57)
+    buffer = CandleBuffer(size=20)
+    buffer.seed(data[:, :13])
+    for row in data[:, 13:].T:
+        buffer.update(kline(row, closed=True))
+        view = buffer.view()
+        assert view.shape == (len(COLUMNS), buffer.count)
+    np.testing.assert_array_equal(buffer.snapshot(), data[:, -20:])
+    np.testing.assert_array_equal(buffer.last(), data[:, -1])
+    assert buffer.view().base is buffer._data
+
+
+@pytest.fixture
+def mock():
+    exchange = MockExchange(seed=0)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(3000, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    client = Client(url=server.url)
+    yield exchange, server, client
+    client.close()
+    server.stop()
+
+
+def market_data(server, client):
+    return MarketData(client, market=MARKET, intervals=["1m", "5m"], size=100, url=server.ws_url,
+                      exchange=ExchangeClient(url=server.url))
+
+
+def test_stream_seeds_and_reseeds_after_a_reconnect(mock):
+    exchange, server, client = mock
+    feed = market_data(server, client)
+    seeds = []
+    feed.buffer("1m").on_seed(lambda b: seeds.append(b.last_open_time()))
+    closed = threading.Event()
+    feed.buffer("1m").on_close(lambda b: closed.set())
+    stream = MarketStream([feed], url=server.ws_url).start(timeout=5)
+    try:
+        assert len(seeds) == 1 and feed.buffer("1m").count == 100 and feed.buffer("5m").count == 100
+        assert feed.mark_price == pytest.approx(exchange.markets[MARKET].price)
+        for _ in range(4):
+            exchange.tick()
+        assert closed.wait(5)
+
+        # the server drops the connection, the stream reconnects and seeds again
+        stream.connected.clear()
+        exchange.close_subscriptions()
+        assert stream.connected.wait(10)
+        # the seed holds the candle that closed while connected and the one in progress after it
+        assert len(seeds) == 2 and seeds[1] == seeds[0] + 60000
+    finally:
+        stream.stop()
+
+
+def test_start_raises_when_the_seed_fails(mock):
+    _, server, client = mock
+    feed = market_data(server, client)
+
+    def seed():
+        raise ValueError("no candles")
+    feed.seed = seed
+    with pytest.raises(ValueError):
+        MarketStream([feed], url=server.ws_url).start(timeout=5)
+
+
+def test_start_raises_when_the_socket_never_opens(mock):
+    _, server, client = mock
+    feed = market_data(server, client)
+    with pytest.raises(TimeoutError):
+        MarketStream([feed], url="ws://127.0.0.1:9").start(timeout=1)
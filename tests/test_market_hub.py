@@ -0,0 +1,99 @@
+import os
+import socket
+import stat
+import threading
+from multiprocessing import AuthenticationError
+from types import SimpleNamespace
+
+import pytest
+
+import market_hub
+from async_client import Client
+from exchange import ExchangeClient
+from market_hub import MarketHub, HubClient, SEQUENCE, hub_key, hub_settings
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+
+# A hub streaming from the mock exchange and a worker reading it from shared memory in the same process.
+
+MARKET = "ETHUSDT"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def hub():
+    exchange = MockExchange(seed=0)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(3000, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    client = Client(url=server.url)
+    hub = MarketHub(client, {MARKET: ["1m"]}, size=200, url=server.ws_url, exchange=ExchangeClient(url=server.url),
+                    address=("127.0.0.1", free_port()), prefix=f"bothubtest{free_port()}").start(timeout=5)
+    yield exchange, hub
+    hub.stop()
+    client.close()
+    server.stop()
+
+
+def test_worker_gets_the_mark_prices(hub):
+    exchange, hub = hub
+    worker = HubClient(address=hub.address, authkey=hub.authkey)
+    feed = worker.market_data(MARKET)
+    worker.start()
+    try:
+        assert feed.mark_price == pytest.approx(exchange.markets[MARKET].price)
+        prices = []
+        received = threading.Event()
+        feed.on_mark_price(lambda market, price: (prices.append((market, price)), received.set()))
+        exchange.tick()
+        assert received.wait(5)
+        assert prices[-1] == (MARKET, pytest.approx(exchange.markets[MARKET].price))
+        assert feed.mark_price == pytest.approx(prices[-1][1])
+    finally:
+        worker.stop()
+
+
+# a worker needs the hub's key, the hub makes a random one when it is given none
+def test_workers_need_the_key(hub):
+    _, hub = hub
+    assert len(hub.authkey) == 32
+    with pytest.raises(ValueError):
+        HubClient(address=hub.address)
+    with pytest.raises(AuthenticationError):
+        HubClient(address=hub.address, authkey=b"binance-futures-bot")
+
+
+def test_the_key_file(tmp_path):
+    path = str(tmp_path / "market_hub.key")
+    settings = SimpleNamespace(market_hub_keyfile=path)
+    with pytest.raises(RuntimeError):
+        hub_settings(settings)
+    authkey = hub_key(settings)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert hub_settings(settings) == (market_hub.ADDRESS, authkey)
+    # every hub start makes a new one
+    assert hub_key(settings) != authkey and hub_settings(settings)[1] != authkey
+    # a key in settings.json is used as it is
+    configured = SimpleNamespace(market_hub="127.0.0.1:7000", market_hub_authkey="secret", market_hub_keyfile=path)
+    assert hub_key(configured) == b"secret" and hub_settings(configured) == (("127.0.0.1", 7000), b"secret")
+
+
+# a reader doesn't spin forever on a buffer the hub left mid-write
+def test_read_gives_up_on_a_buffer_left_mid_write(hub, monkeypatch):
+    _, hub = hub
+    monkeypatch.setattr(market_hub, "READ_TIMEOUT", 0.05)
+    worker = HubClient(address=hub.address, authkey=hub.authkey)
+    try:
+        buffer = worker.market_data(MARKET).buffer("1m")
+        assert buffer.snapshot().shape[1] == buffer.count
+        header = hub.feeds[MARKET].buffer("1m").header
+        header[SEQUENCE] += 1
+        with pytest.raises(TimeoutError):
+            buffer.snapshot()
+        header[SEQUENCE] += 1
+        assert buffer.last_open_time() == hub.feeds[MARKET].buffer("1m").last_open_time()
+    finally:
+        worker.stop()
@@ -0,0 +1,80 @@
+import io
+import logging
+import queue
+
+import pytest
+
+import metrics
+from metrics import Registry, Histogram
+
+
+def test_render():
+    registry = Registry()
+    registry.counter("bot_fills_total", "Fills", market="ETHUSDT", side="BUY").inc(2)
+    registry.counter("bot_fills_total", market="ETHUSDT", side="SELL").inc()
+    registry.gauge("bot_exposure", market="ETHUSDT").set(1.5)
+    assert registry.render() == (
+        "# TYPE bot_exposure gauge\n"
+        'bot_exposure{market="ETHUSDT"} 1.5\n'
+        "# HELP bot_fills_total Fills\n"
+        "# TYPE bot_fills_total counter\n"
+        'bot_fills_total{market="ETHUSDT",side="BUY"} 2\n'
+        'bot_fills_total{market="ETHUSDT",side="SELL"} 1\n')
+
+
+def test_render_escapes_label_values():
+    registry = Registry()
+    registry.counter("bot_errors_total", "Errors\nby \\ message", message='bad "key"\\\nretry').inc()
+    assert registry.render().splitlines() == [
+        "# HELP bot_errors_total Errors\\nby \\\\ message",
+        "# TYPE bot_errors_total counter",
+        'bot_errors_total{message="bad \\"key\\"\\\\\\nretry"} 1']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1]
+    assert histogram.samples("latency", (("endpoint", "ping"),)) == [
+        'latency_bucket{endpoint="ping",le="0.1"} 2',
+        'latency_bucket{endpoint="ping",le="1.0"} 3',
+        'latency_bucket{endpoint="ping",le="+Inf"} 4',
+        'latency_sum{endpoint="ping"} 2.65',
+        'latency_count{endpoint="ping"} 4']
+    with histogram.time():
+        pass
+    assert histogram.count == 5
+
+
+@pytest.fixture
+def logging_setup():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    metrics._stop_logging()
+    metrics._listener = None
+    root.handlers, root.level = handlers, level
+
+
+# records are queued as they are and written by the listener thread, console messages to the stream
+def test_logging_goes_through_the_listener(logging_setup, tmp_path):
+    stream = io.StringIO()
+    path = tmp_path / "bot.log"
+    console = metrics.setup_logging(stream, path=str(path))
+    assert any(isinstance(handler, metrics.DeferredQueueHandler) for handler in logging.getLogger().handlers)
+    console.info("Bot Started for %s", "ETHUSDT")
+    logging.getLogger("engine").info("evaluated")
+    # stopping the listener writes out whatever is still queued
+    metrics._stop_logging()
+    metrics._listener = None
+    assert stream.getvalue() == "Bot Started for ETHUSDT\n"
+    log = path.read_text()
+    assert "INFO engine evaluated" in log and "INFO bot.console Bot Started for ETHUSDT" in log
+
+
+def test_deferred_handler_queues_the_record_unformatted():
+    records = queue.SimpleQueue()
+    record = logging.LogRecord("engine", logging.INFO, __file__, 1, "%s closed", ("ETHUSDT",), None)
+    metrics.DeferredQueueHandler(records).handle(record)
+    assert records.get_nowait() is record and record.args == ("ETHUSDT",) and record.msg == "%s closed"
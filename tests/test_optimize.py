@@ -0,0 +1,34 @@
+import optimize
+from mock_exchange import synthetic_klines
+
+# The parameter sweep on synthetic candles with a 2x2 grid.
+
+GRID = {"ma_period": [30, 50], "ma_close_period": [9], "macd_fast": [12], "macd_slow": [26], "macd_signal": [9],
+        "take_profit": [1.2, 1.6], "stop_loss": [1.3], "callback_rate": [0.4]}
+
+
+def test_parse_values():
+    assert optimize.parse_values("1.2") == [1.2]
+    assert optimize.parse_values("1,2,5", int) == [1, 2, 5]
+    assert optimize.parse_values("0.8:2.0:0.4") == [0.8, 1.2, 1.6, 2.0]
+
+
+def test_combinations_are_grouped_by_indicator_periods():
+    combos = list(optimize.combinations(GRID))
+    assert len(combos) == 4
+    groups = list(optimize.group_tasks(combos))
+    assert [key[0] for key, _ in groups] == [30, 50]
+    assert all(exits == [(1.2, 1.3, 0.4), (1.6, 1.3, 0.4)] for _, exits in groups)
+    # a group is split into chunks of at most chunk_size simulations
+    assert [len(exits) for _, exits in optimize.group_tasks(combos, chunk_size=1)] == [1, 1, 1, 1]
+    assert len(list(optimize.combinations(GRID, samples=3, seed=1))) == 3
+
+
+def test_sweep_ranks_every_combination():
+    data = synthetic_klines(3000, seed=0)
+    results = optimize.sweep(data, GRID, workers=2, chunk_size=1, balance=1000.0, leverage=5)
+    assert len(results) == 4
+    assert sorted(zip(results["ma_period"], results["take_profit"])) == [(30, 1.2), (30, 1.6), (50, 1.2), (50, 1.6)]
+    assert list(results["return"]) == sorted(results["return"], reverse=True)
+    by_trades = optimize.sweep(data, GRID, workers=1, balance=1000.0, leverage=5, sort_by="trades")
+    assert list(by_trades["trades"]) == sorted(by_trades["trades"], reverse=True)
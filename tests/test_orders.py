@@ -0,0 +1,140 @@
+import pytest
+
+import bot_functions as bf
+from account import AccountState, UserDataStream
+from async_client import Client
+from exchange import ExchangeClient
+from journal import TradeJournal
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+from orders import EntryPipeline, EntryError
+from symbols import SymbolRegistry
+
+# EntryPipeline.enter against the mock exchange over http, with and without the user data stream.
+
+MARKET = "ETHUSDT"
+
+
+# an ExchangeClient that records the order requests it sends
+class RecordingClient(ExchangeClient):
+    def __init__(self, *args, ack=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ack = ack
+        self.calls = []
+
+    def new_order(self, **params):
+        self.calls.append(("new_order", params["type"]))
+        if self.ack:
+            # answer before the fill like binance's default response, the fill only comes from the stream
+            params.pop("newOrderRespType", None)
+        return super().new_order(**params)
+
+    def get_order(self, symbol, order_id):
+        self.calls.append(("get_order", order_id))
+        return super().get_order(symbol, order_id)
+
+    def batch_orders(self, orders):
+        self.calls.append(("batch_orders", tuple(order["type"] for order in orders)))
+        return super().batch_orders(orders)
+
+
+# entries go to a trade log of their own, not the bot's trade_log.csv
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    journal = TradeJournal(str(tmp_path / "trade_log.csv"))
+    monkeypatch.setattr(bf, "_journal", journal)
+    return journal
+
+
+@pytest.fixture
+def mock():
+    exchange = MockExchange(seed=0)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(3000, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    yield exchange, server
+    server.stop()
+
+
+@pytest.fixture
+def registry(mock):
+    client = Client(url=mock[1].url)
+    yield SymbolRegistry(client).load()
+    client.close()
+
+
+def pipeline(mock, registry, account=None, ack=False, **settings):
+    exchange = RecordingClient(url=mock[1].url, ack=ack)
+    return EntryPipeline(exchange, registry, None, market=MARKET, leverage=5, account=account, fill_timeout=1.0,
+                         **settings)
+
+
+def open_orders(exchange):
+    return sorted(order["type"] for order in exchange.open_orders({"symbol": MARKET}))
+
+
+def test_enter_places_the_protective_orders_in_one_batch(mock, registry):
+    exchange, _ = mock
+    entry = pipeline(mock, registry)
+    qty, side, in_position = entry.enter("BUY", exchange.markets[MARKET].price)
+    assert (side, in_position) == (1, True)
+    assert exchange.markets[MARKET].amount == float(qty)
+    assert entry.entry_price == pytest.approx(exchange.markets[MARKET].entry_price)
+    assert entry.exchange.calls == [("new_order", "MARKET"),
+                                    ("batch_orders", ("STOP_MARKET", "TRAILING_STOP_MARKET"))]
+    assert open_orders(exchange) == ["STOP_MARKET", "TRAILING_STOP_MARKET"]
+    assert sorted(entry.order_ids) == sorted(order["orderId"] for order in exchange.open_orders({"symbol": MARKET}))
+
+
+# the market order is only acknowledged, its fill and the position come from the user data stream
+def test_enter_takes_the_fill_from_the_user_data_stream(mock, registry):
+    exchange, server = mock
+    account = AccountState()
+    stream = UserDataStream(ExchangeClient(url=server.url), account, url=server.ws_url).start(timeout=5)
+    try:
+        assert stream.connected.is_set()
+        entry = pipeline(mock, registry, account=account, ack=True).prepare()
+        assert entry.balance == pytest.approx(exchange.wallet)
+        qty, side, in_position = entry.enter("SELL", exchange.markets[MARKET].price)
+        assert (side, in_position) == (-1, True)
+        assert account.position_amount(MARKET) == -float(qty)
+        assert entry.entry_price == pytest.approx(exchange.markets[MARKET].entry_price)
+        assert [call[0] for call in entry.exchange.calls] == ["new_order", "batch_orders"]
+        # the protective orders' NEW events may still be on their way
+        with account.condition:
+            assert account.condition.wait_for(lambda: sorted(account.orders) == sorted(entry.order_ids), 5)
+    finally:
+        stream.stop()
+
+
+# a take profit rejected by the batch and again on its own leaves the position open with its stop loss
+def test_rejected_take_profit_keeps_the_position(mock, registry):
+    exchange, _ = mock
+    entry = pipeline(mock, registry, callback_rate=20)
+    qty, side, in_position = entry.enter("BUY", exchange.markets[MARKET].price)
+    assert (side, in_position) == (1, True)
+    assert exchange.markets[MARKET].amount == float(qty)
+    assert open_orders(exchange) == ["STOP_MARKET"]
+    assert len(entry.order_ids) == 1
+    assert entry.exchange.calls[-1] == ("new_order", "TRAILING_STOP_MARKET")
+
+
+# a stop loss that can't be placed closes the position, the caller still learns the order filled
+def test_rejected_stop_loss_raises_with_the_fill(mock, registry):
+    exchange, _ = mock
+    entry = pipeline(mock, registry, stop_loss=-5)
+    with pytest.raises(EntryError) as error:
+        entry.enter("BUY", exchange.markets[MARKET].price)
+    assert (error.value.side, error.value.entry_price) == (1, entry.entry_price)
+    assert float(error.value.qty) > 0
+    assert exchange.markets[MARKET].amount == 0.0
+    assert entry.balance is None
+
+
+# a fill that isn't seen in time is looked up in the position instead of taken as no fill
+def test_unseen_fill_is_found_in_the_position(mock, registry, monkeypatch):
+    exchange, _ = mock
+    entry = pipeline(mock, registry, ack=True)
+    monkeypatch.setattr(entry.exchange, "get_order", lambda symbol, order_id: {"orderId": order_id, "status": "NEW"})
+    qty, side, in_position = entry.enter("BUY", exchange.markets[MARKET].price)
+    assert in_position
+    assert entry.entry_price == pytest.approx(exchange.markets[MARKET].entry_price)
+    assert open_orders(exchange) == ["STOP_MARKET", "TRAILING_STOP_MARKET"]
@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import Window, RateLimiter, ORDER, DATA
+
+HEADER = "X-MBX-USED-WEIGHT-1M"
+
+
+def test_window_waits_for_the_next_window():
+    window = Window(10, 60, HEADER)
+    assert window.wait_time(10, 120.0) == 0.0
+    window.take(8, 120.0)
+    assert window.wait_time(2, 130.0) == 0.0
+    assert window.wait_time(3, 130.0) == 50.0
+    # the reserve is kept for other requests
+    assert window.wait_time(1, 130.0, reserve=2) == 50.0
+    # a new window starts from nothing
+    assert window.wait_time(10, 180.0) == 0.0 and window.used == 0
+    # a request bigger than the whole limit still goes when the window is empty
+    assert window.wait_time(50, 180.0) == 0.0
+
+
+def test_window_sync_takes_the_reported_count():
+    window = Window(10, 60, HEADER)
+    window.take(5, 120.0)
+    window.sync(8, 125.0, sent=124.0)
+    assert window.used == 8
+    # lower than the local count, e.g. requests counted here that the exchange didn't count
+    window.sync(3, 126.0, sent=125.5)
+    assert window.used == 3
+    # a response to a request sent in the last window may hold that window's count
+    window.sync(9, 181.0, sent=179.5)
+    assert window.used == 0
+
+
+# a target with binance_f-like signatures
+class Target:
+    def get_mark_price(self, symbol=None):
+        return symbol
+
+    def get_open_orders(self, symbol=None):
+        return symbol
+
+    def get_candlestick_data(self, symbol, interval, startTime=None, endTime=None, limit=None):
+        return symbol
+
+    def cancel_all_orders(self, symbol):
+        return symbol
+
+
+def test_positional_symbols_cost_the_single_symbol_weight():
+    limiter = RateLimiter()
+    client = rate_limit.limit(Target(), limiter)
+    weights = []
+    for call in (lambda: client.get_mark_price("ETHUSDT"), lambda: client.get_mark_price(),
+                 lambda: client.get_open_orders("ETHUSDT"), lambda: client.get_open_orders(symbol="ETHUSDT"),
+                 lambda: client.get_open_orders(),
+                 lambda: client.get_candlestick_data("ETHUSDT", "1m", None, None, 1000),
+                 lambda: client.get_candlestick_data("ETHUSDT", "1m", limit=50)):
+        used = limiter.weight.used
+        call()
+        weights.append(limiter.weight.used - used)
+    assert weights == [1, 10, 1, 1, 40, 5, 1]
+    client.cancel_all_orders("ETHUSDT")
+    assert rate_limit.client_method_cost("cancel_all_orders", {"symbol": "ETHUSDT"}) == (ORDER, 1, 0)
+
+
+# a limiter whose weight window is a second long, so waiting for the next one is quick. Starts just after a
+# window began, so the test isn't cut by the next one
+def short_limiter(limit=10):
+    limiter = RateLimiter(data_reserve=0.2)
+    limiter.weight = Window(limit, 1, HEADER)
+    time.sleep(1.0 - time.time() % 1.0 + 0.01)
+    return limiter
+
+
+def test_acquire_waits_for_room():
+    limiter = short_limiter()
+    assert limiter.acquire(8, priority=ORDER) < 0.01
+    assert not limiter.try_acquire(3, priority=ORDER)
+    # market data leaves 2 of 10 for orders
+    assert not limiter.try_acquire(1, priority=DATA)
+    assert limiter.try_acquire(2, priority=ORDER)
+    waited = limiter.acquire(5, priority=DATA)
+    assert 0 < waited <= 1.1 and limiter.weight.used == 5
+
+
+# waiting requests go by priority, not by arrival
+def test_orders_go_ahead_of_market_data():
+    limiter = short_limiter()
+    limiter.acquire(10, priority=ORDER)
+    served = []
+
+    def acquire(name, priority):
+        limiter.acquire(6, priority=priority)
+        served.append(name)
+
+    data = threading.Thread(target=acquire, args=("data", DATA))
+    data.start()
+    time.sleep(0.05)
+    order = threading.Thread(target=acquire, args=("order", ORDER))
+    order.start()
+    data.join(5)
+    order.join(5)
+    assert served == ["order", "data"]
+
+
+def test_update_frees_room_for_waiting_requests():
+    limiter = RateLimiter(weight_limit=1000)
+    limiter.acquire(1000)
+    waiting = threading.Thread(target=limiter.acquire, args=(100, 0, ORDER))
+    waiting.start()
+    time.sleep(0.05)
+    assert waiting.is_alive()
+    limiter.update({HEADER: "200", "X-MBX-ORDER-COUNT-10S": "3"}, sent=time.time())
+    waiting.join(5)
+    assert not waiting.is_alive()
+    assert limiter.weight.used == 300 and limiter.orders[0].used == 3
+
+
+def test_back_off_holds_every_request():
+    limiter = RateLimiter()
+    limiter.back_off(429, "0.2")
+    assert not limiter.try_acquire(1, priority=ORDER)
+    assert limiter.acquire(1, priority=ORDER) >= 0.15
+
+
+def test_calls_in_flight_are_shared():
+    limiter = RateLimiter()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "candles"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(limiter.call((DATA, 5, 0), fetch, key="klines")))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["candles"] * 3 and len(calls) == 1 and limiter.weight.used == 5
+    # once it is done the next call is sent again
+    assert limiter.call((DATA, 5, 0), fetch, key="klines") == "candles" and len(calls) == 2
+
+
+def test_a_failed_call_fails_every_caller():
+    limiter = RateLimiter()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise OSError("down")
+
+    errors = []
+
+    def call():
+        try:
+            limiter.call((DATA, 1, 0), fail, key="klines")
+        except OSError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    call()
+    leader.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
+    with pytest.raises(OSError):
+        limiter.call((DATA, 1, 0), fail, key="klines")
@@ -0,0 +1,135 @@
+import logging
+
+import numpy as np
+import pytest
+
+from async_client import Client
+from exchange import ExchangeClient
+from market_data import CandleBuffer, MarketData, OPEN_TIME, OPEN, HIGH, LOW, VOLUME, TRADES, INTERVALS, aggregate, \
+    fetch_candles
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+from resampler import Bar, Resampler
+
+MARKET = "ETHUSDT"
+
+
+def kline(row, closed):
+    return {"t": row[OPEN_TIME], "o": row[1], "h": row[2], "l": row[3], "c": row[4], "v": row[5], "n": row[6],
+            "x": closed, "i": "1m"}
+
+
+# buffers of the higher intervals seeded like the exchange would, up to and with minute `now` in progress
+def seeded(data, now, intervals=("5m", "1h")):
+    buffers = {interval: CandleBuffer(size=50) for interval in intervals}
+    for interval, buffer in buffers.items():
+        buffer.seed(aggregate(data[:, :now + 1], INTERVALS[interval]))
+    resampler = Resampler(buffers)
+    resampler.seed(data[:, :now + 1])
+    return buffers, resampler
+
+
+# the candles built from the stream are the exchange's candles, whichever minute they were seeded at
+@pytest.mark.parametrize("now", [300, 303, 359])
+def test_candles_follow_the_minutes(now):
+    data = synthetic_klines(600, seed=0)
+    buffers, resampler = seeded(data, now)
+    for i in range(now, data.shape[1]):
+        resampler.update(kline(data[:, i], closed=True))
+    for interval, buffer in buffers.items():
+        expected = aggregate(data, INTERVALS[interval])[:, -buffer.count:]
+        np.testing.assert_allclose(buffer.snapshot(), expected, rtol=1e-12)
+
+
+def test_partial_and_complete_candles():
+    data = synthetic_klines(20, seed=0)
+    bar = Bar("5m")
+    bar.seed(data[:, :1], aggregate(data[:, :1], INTERVALS["5m"])[:, -1])
+    first = data[:, 0].copy()
+    first[HIGH] += 1.0
+    candle = bar.update(first, closed=False)
+    assert not candle["x"] and candle["h"] == first[HIGH] and candle["v"] == first[VOLUME]
+    # the minute closes lower than its update went, the candle keeps only the close
+    candle = bar.update(data[:, 0], closed=True)
+    assert not candle["x"] and candle["h"] == data[HIGH, 0]
+    for i in range(1, 4):
+        assert not bar.update(data[:, i], closed=True)["x"]
+    candle = bar.update(data[:, 4], closed=True)
+    expected = aggregate(data[:, :5], INTERVALS["5m"])[:, 0]
+    assert candle["x"] and candle["t"] == expected[OPEN_TIME] and candle["v"] == pytest.approx(expected[VOLUME])
+    # a minute that closed without its final message is folded in once the next one shows up
+    bar.update(data[:, 5], closed=False)
+    candle = bar.update(data[:, 6], closed=False)
+    assert candle["t"] == data[OPEN_TIME, 5] and candle["o"] == data[OPEN, 5]
+    assert candle["v"] == pytest.approx(data[VOLUME, 5] + data[VOLUME, 6])
+    # an update older than the candle in progress is ignored
+    assert bar.update(data[:, 4], closed=True) is None
+
+
+# a 1h candle seeded from the exchange while the 1m history only holds its last minutes
+def test_minutes_that_start_late_take_the_rest_from_the_exchange(caplog):
+    data = synthetic_klines(200, seed=0)
+    now = 150
+    buffer = CandleBuffer(size=10)
+    buffer.seed(aggregate(data[:, :now + 1], INTERVALS["1h"]))
+    resampler = Resampler({"1h": buffer})
+    resampler.seed(data[:, now - 10:now + 1])
+    for i in range(now, 180):
+        resampler.update(kline(data[:, i], closed=True))
+    np.testing.assert_allclose(buffer.snapshot(), aggregate(data[:, :180], INTERVALS["1h"]), rtol=1e-12)
+    assert "differs" not in caplog.text
+
+
+# a gap in the 1m history is noticed against the exchange's candle and filled from it
+def test_a_gap_in_the_minutes_is_filled_from_the_exchange(caplog):
+    data = synthetic_klines(200, seed=0)
+    now = 150
+    buffer = CandleBuffer(size=10)
+    buffer.seed(aggregate(data[:, :now + 1], INTERVALS["1h"]))
+    resampler = Resampler({"1h": buffer})
+    minutes = np.delete(data[:, :now + 1], 125, axis=1)
+    with caplog.at_level(logging.WARNING, logger="resampler"):
+        resampler.seed(minutes)
+        resampler.update(kline(data[:, now], closed=True))
+    assert "1h candle at" in caplog.text and "volume" in caplog.text
+    expected = aggregate(data[:, :now + 1], INTERVALS["1h"])[:, -1]
+    assert buffer.last()[OPEN] == expected[OPEN] and buffer.last()[HIGH] >= expected[HIGH]
+    assert buffer.last()[LOW] <= expected[LOW]
+    assert buffer.last()[VOLUME] == pytest.approx(expected[VOLUME])
+    assert buffer.last()[TRADES] == expected[TRADES]
+
+
+@pytest.fixture
+def mock():
+    exchange = MockExchange(seed=0)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(3000, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    client = Client(url=server.url)
+    yield exchange, server, client
+    client.close()
+    server.stop()
+
+
+# every interval is seeded from its own klines, only the 1m candles are streamed
+def test_market_data_seeds_every_interval_from_its_own_candles(mock):
+    exchange, server, client = mock
+    rest = ExchangeClient(url=server.url)
+    feed = MarketData(client, market=MARKET, intervals=["5m", "1h"], size=20, url=server.ws_url, exchange=rest,
+                      resample=True)
+    assert [stream.split("@")[1] for stream in feed.streams()] == ["kline_1m", "markPrice"]
+    feed.seed()
+    for interval in ("1m", "5m", "1h"):
+        np.testing.assert_array_equal(feed.buffer(interval).snapshot(), fetch_candles(rest, MARKET, interval, 20))
+
+    market = exchange.markets[MARKET]
+    for _ in range(90):
+        index = market.index
+        while market.index == index:
+            exchange.tick()
+        feed.handle_event({"e": "kline", "k": kline(market.data[:, index], closed=True)})
+    # the candles the exchange has closed since, its volumes are rounded to 3 decimals
+    for interval in ("5m", "1h"):
+        expected = fetch_candles(rest, MARKET, interval, 20)[:, :-1]
+        candles = feed.buffer(interval).snapshot()
+        candles = candles[:, np.isin(candles[OPEN_TIME], expected[OPEN_TIME])]
+        assert candles.shape[1] >= 2
+        np.testing.assert_allclose(candles, expected[:, -candles.shape[1]:], rtol=1e-5)
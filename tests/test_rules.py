@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import rules
+from rules import Rule, RuleError, Strategy
+
+
+def test_operators():
+    values = {"a": 2.0, "b": 3.0, "c": -1.0}
+    accepted = {"a < b": True, "a <= 2": True, "a > b": False, "b >= 3.0": True, "a == 2": True, "a != 2": False,
+                "c < a < b": True, "b > a > b": False, "a + b == 5": True, "b - a * 2 < 0": True,
+                "b / a == 1.5": True, "-c == 1": True, "not a > b": True, "a > b or c < 0": True,
+                "(a > b or c < 0) and not (a == 2)": False, "1 < 2": True}
+    for text, expected in accepted.items():
+        assert Rule(text)(values) is expected, text
+    assert Rule("c < a < b and a + 1 > b or c > 0").names == {"a", "b", "c"}
+
+
+@pytest.mark.parametrize("text", [
+    "__import__('os').system('true')", "open('settings.json')", "a.real > 0", "a[0] > 0", "a if b else c",
+    "lambda: 1", "a ** 2 > 1", "a % 2 == 0", "a in b", "a is b", "True", "'a' < 'b'", "[a] == [b]",
+    "a < b; a > b", "a <", "a = 1", "~a > 0",
+])
+def test_anything_else_is_rejected(text):
+    with pytest.raises(RuleError):
+        Rule(text)
+
+
+def test_rule_error_is_a_value_error():
+    with pytest.raises(ValueError):
+        Strategy(long="exec('1')")
+
+
+def test_array_matches_the_scalar_rule():
+    rng = np.random.default_rng(0)
+    values = {"a": rng.normal(size=200), "b": rng.normal(size=200)}
+    values["a"][:5] = np.nan
+    rule = Rule("a > b and not (a < -1 or b > 1)")
+    result = rule.array(values)
+    assert result.dtype == bool and not result[:5].any()
+    assert list(result) == [rule({"a": a, "b": b}) for a, b in zip(values["a"], values["b"])]
+
+
+def test_describe():
+    rule = Rule("ma_fiftylow  <  current_price and macdhist_last < 0 and (rsi > 70 or rsi < 30)")
+    values = {"ma_fiftylow": 1849.4, "current_price": 1831.9, "macdhist_last": -0.5, "rsi": 25.0}
+    assert rule.text == "ma_fiftylow < current_price and macdhist_last < 0 and (rsi > 70 or rsi < 30)"
+    assert rule.describe(values) == ["ma_fiftylow < current_price | 1849.4 < 1831.9 | False",
+                                     "macdhist_last < 0 | -0.5 < 0 | True",
+                                     "rsi > 70 or rsi < 30 | True"]
+
+
+# the conditions trade() checked before the rules, a matched short overriding a matched long
+def hard_coded(my_dict):
+    entry = 0
+    if ((my_dict['ma_fiftylow'] < my_dict['current_price']) and
+            (my_dict['ma_nineclose'] < my_dict['current_price']) and
+            (my_dict['macdhist_current'] > 0) and
+            (my_dict['macdhist_last'] < 0)):
+        entry = 1
+    if ((my_dict['ma_fiftyhigh'] > my_dict['current_price']) and
+            (my_dict['ma_nineclose'] > my_dict['current_price']) and
+            (my_dict['macdhist_current'] < 0) and
+            (my_dict['macdhist_last'] > 0)):
+        entry = -1
+    return entry
+
+
+def fixtures(count=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    price = 2000.0
+    for _ in range(count):
+        yield {"current_price": price, "ma_fiftyhigh": price + rng.normal(0, 10),
+               "ma_fiftylow": price + rng.normal(0, 10), "ma_nineclose": price + rng.normal(0, 10),
+               "macdhist_current": rng.choice([-1.0, 0.0, 1.0]) * rng.random(),
+               "macdhist_last": rng.choice([-1.0, 0.0, 1.0]) * rng.random(), "rsi": 50.0}
+
+
+def test_default_rules_enter_like_the_old_conditions():
+    dicts = list(fixtures())
+    expected = [hard_coded(my_dict) for my_dict in dicts]
+    assert {-1, 0, 1} <= set(expected)
+    assert [rules.DEFAULT.signal(my_dict) for my_dict in dicts] == expected
+    arrays = {name: np.array([my_dict[name] for my_dict in dicts]) for name in dicts[0]}
+    assert list(rules.DEFAULT.signals(arrays)) == expected
+
+
+# the default rules can't both match, rules that do: the short wins, as it did in trade()
+def test_short_wins_over_long():
+    my_dict = {"current_price": 2000.0, "ma_fiftyhigh": 2010.0, "ma_fiftylow": 1990.0, "ma_nineclose": 2000.0,
+               "macdhist_current": 0.5, "macdhist_last": -0.5}
+    strategy = Strategy(long="macdhist_current > 0", short="ma_fiftyhigh > current_price")
+    assert strategy.long(my_dict) and strategy.short(my_dict)
+    assert strategy.signal(my_dict) == -1
+    assert list(strategy.signals({name: np.array([value]) for name, value in my_dict.items()})) == [-1]
+
+
+def test_signals_need_every_name():
+    with pytest.raises(RuleError):
+        Strategy(long="rsi < 30").signals({"current_price": np.zeros(3)})
+
+
+def test_load_strategy():
+    assert rules.load_strategy(SimpleNamespace()) is rules.DEFAULT
+    strategy = rules.load_strategy(SimpleNamespace(long_rule="rsi < 30"))
+    assert strategy.long.text == "rsi < 30" and strategy.short.text == rules.SHORT
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from account import AccountState
+from market_data import CandleBuffer, OPEN_TIME
+from mock_exchange import synthetic_klines
+from scheduler import Scheduler
+
+
+# run the scheduler on a thread of its own, returns the thread
+def start(scheduler):
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_the_same_call_posted_while_waiting_runs_once():
+    scheduler = Scheduler()
+    calls = []
+    for market in ("ETHUSDT", "ETHUSDT", "BTCUSDT", "ETHUSDT"):
+        scheduler.post("candle", calls.append, market)
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    assert calls == ["ETHUSDT", "BTCUSDT"]
+    # once it ran it can be posted again
+    scheduler.post("candle", calls.append, "ETHUSDT")
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    assert calls == ["ETHUSDT", "BTCUSDT", "ETHUSDT"]
+
+
+def test_every_runs_on_its_interval():
+    scheduler = Scheduler()
+    times = []
+    started = time.monotonic()
+    scheduler.every(0.05, lambda: times.append(time.monotonic() - started))
+    thread = start(scheduler)
+    time.sleep(0.32)
+    scheduler.stop()
+    thread.join(1)
+    assert not thread.is_alive()
+    assert 5 <= len(times) <= 7
+    assert times[0] >= 0.05
+    # the next run is due an interval after the last one was due, the delays don't add up
+    assert abs(times[-1] - 0.05 * len(times)) < 0.04
+
+
+# a failing handler is logged and the scheduler carries on
+def test_a_failing_handler_doesnt_stop_the_loop(caplog):
+    scheduler = Scheduler()
+    calls = []
+
+    def fail():
+        raise ValueError("no candles")
+
+    scheduler.post("candle", fail)
+    scheduler.post("candle", calls.append, 1)
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    assert calls == [1] and "candle handler failed: no candles" in caplog.text
+
+
+def test_stop_ends_run_while_it_waits():
+    scheduler = Scheduler()
+    scheduler.every(3600, print)
+    thread = start(scheduler)
+    time.sleep(0.05)
+    scheduler.stop()
+    thread.join(1)
+    assert not thread.is_alive()
+
+
+def kline(row, closed):
+    return {"t": row[OPEN_TIME], "o": row[1], "h": row[2], "l": row[3], "c": row[4], "v": row[5], "n": row[6],
+            "x": closed}
+
+
+class Feed:
+    def __init__(self, intervals):
+        self.buffers = {interval: CandleBuffer(size=10) for interval in intervals}
+
+    def buffer(self, interval):
+        return self.buffers[interval]
+
+
+# candles of several periods closing together evaluate the market once, closing apart once each
+def test_candle_closes_across_periods():
+    data = synthetic_klines(10)
+    feed = Feed(["1m", "5m"])
+    for buffer in feed.buffers.values():
+        buffer.seed(data[:, :3])
+    scheduler = Scheduler()
+    evaluated = []
+    scheduler.on_candle_close(feed, ["1m", "5m"], evaluated.append, "ETHUSDT")
+
+    for buffer in feed.buffers.values():
+        buffer.update(kline(data[:, 2], closed=True))
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    assert evaluated == ["ETHUSDT"]
+
+    feed.buffer("1m").update(kline(data[:, 3], closed=True))
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    feed.buffer("5m").update(kline(data[:, 3], closed=True))
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    assert evaluated == ["ETHUSDT"] * 3
+
+
+def test_fills_and_position_changes_post_the_check():
+    account = AccountState()
+    scheduler = Scheduler()
+    checks = []
+    scheduler.on_fill(account, checks.append, "check")
+    account.handle_event({"e": "ORDER_TRADE_UPDATE", "o": {"s": "ETHUSDT", "i": 1, "X": "NEW"}})
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    assert checks == []
+
+    account.handle_event({"e": "ORDER_TRADE_UPDATE", "o": {"s": "ETHUSDT", "i": 1, "X": "FILLED", "ap": "1"}})
+    account.handle_event({"e": "ACCOUNT_UPDATE", "a": {"B": [], "P": [{"s": "ETHUSDT", "pa": "0.5", "ep": "1"}]}})
+    scheduler.post("candle", scheduler.stop)
+    scheduler.run()
+    assert checks == ["check"]
@@ -0,0 +1,75 @@
+import pytest
+
+import mock_exchange
+import rate_limit
+from async_client import Client
+from mock_exchange import MockExchange, MockMarket, MockServer, synthetic_klines
+from symbols import SymbolRegistry
+
+# SymbolRegistry against the exchange information of the mock exchange.
+
+MARKET = "ETHUSDT"
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    limits = mock_exchange.RateLimiter(weight_limit=1800, orders_10s=250, orders_1m=1000)
+    exchange = MockExchange(seed=0, limiter=limits)
+    exchange.add_market(MockMarket(MARKET, synthetic_klines(100, seed=0)))
+    server = MockServer(exchange, port=0, tick_interval=0).start()
+    client = Client(url=server.url)
+    # load() configures the process limiter, the test gets one of its own
+    monkeypatch.setattr(rate_limit, "limiter", rate_limit.RateLimiter())
+    yield exchange, client
+    client.close()
+    server.stop()
+
+
+# a client that counts its exchange information downloads
+class Counting:
+    def __init__(self, client):
+        self.client = client
+        self.loads = 0
+
+    def get_exchange_information(self):
+        self.loads += 1
+        return self.client.get_exchange_information()
+
+
+def test_load_indexes_the_symbols_and_configures_the_limiter(mock):
+    _, client = mock
+    registry = SymbolRegistry(client).load()
+    assert MARKET in registry and "BTCUSDT" not in registry
+    info = registry.get(MARKET)
+    assert info.symbol == MARKET and info.step_size > 0 and info.tick_size > 0
+    assert rate_limit.limiter.weight.limit == 1800
+    assert sorted(window.limit for window in rate_limit.limiter.orders) == [250, 1000]
+
+
+def test_get_loads_an_unseen_symbol_once(mock):
+    exchange, client = mock
+    counting = Counting(client)
+    registry = SymbolRegistry(counting).load()
+    registry.get(MARKET)
+    assert counting.loads == 1
+
+    exchange.add_market(MockMarket("BTCUSDT", synthetic_klines(100, seed=1)))
+    assert registry.get("BTCUSDT").symbol == "BTCUSDT"
+    registry.get("BTCUSDT")
+    assert counting.loads == 2
+    with pytest.raises(KeyError):
+        registry.get("XRPUSDT")
+
+
+def test_refresh_if_stale_waits_for_the_ttl(mock):
+    _, client = mock
+    counting = Counting(client)
+    registry = SymbolRegistry(counting, ttl=60)
+    assert registry.is_stale()
+    registry.refresh_if_stale()
+    registry.refresh_if_stale()
+    assert counting.loads == 1
+
+    registry.loaded_at -= 61
+    registry.refresh_if_stale()
+    assert counting.loads == 2 and not registry.is_stale()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import bot_functions as bf
+from indicators import TalonSniper
+from market_data import CandleBuffer, OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME
+
+# TalonSniper fed one closed candle at a time must give the entry bot_functions.trading_signal computes over the
+# whole series at every candle. The first candle only starts the heikin ashi series, the batch output leaves it out.
+
+
+def batch_signal(klines, use_last):
+    heikin_ashi = bf.construct_heikin_ashi(*(klines[column].tolist() for column in (OPEN, HIGH, LOW, CLOSE)))
+    return bf.trading_signal(*heikin_ashi, use_last=use_last)
+
+
+def kline(bar, closed=True):
+    return {"t": bar[OPEN_TIME], "o": bar[OPEN], "h": bar[HIGH], "l": bar[LOW], "c": bar[CLOSE], "v": bar[VOLUME],
+            "x": closed}
+
+
+@pytest.mark.parametrize("use_last", [False, True])
+def test_replay_matches_trading_signal(klines, use_last):
+    signal = TalonSniper(use_last=use_last)
+    peeked, streamed = [], []
+    for bar in klines.T:
+        peeked.append(signal.peek(bar[OPEN], bar[HIGH], bar[LOW], bar[CLOSE]))
+        streamed.append(signal.update(bar[OPEN], bar[HIGH], bar[LOW], bar[CLOSE]))
+        assert signal.value == streamed[-1]
+    assert streamed[0] == 0
+    np.testing.assert_array_equal(streamed[1:], batch_signal(klines, use_last))
+    assert peeked == streamed
+
+
+# seeded from a buffer and kept current by its closed candles, the signal is the batch one at every candle
+@pytest.mark.parametrize("use_last", [False, True])
+def test_attach_follows_the_buffer(klines, use_last):
+    expected = batch_signal(klines, use_last)
+    seeded = 500
+    buffer = CandleBuffer(size=1000)
+    buffer.seed(klines[:, :seeded])
+    signal = TalonSniper(use_last=use_last).attach(buffer)
+    # the last seeded candle is still open
+    assert signal.value == expected[seeded - 3]
+    assert signal.open_time == klines[OPEN_TIME, seeded - 2]
+
+    for i in range(seeded - 1, klines.shape[1]):
+        buffer.update(kline(klines[:, i], closed=False))
+        assert signal.open_time == klines[OPEN_TIME, i - 1]
+        buffer.update(kline(klines[:, i]))
+        assert signal.value == expected[i - 1]
+        assert signal.open_time == klines[OPEN_TIME, i]
+
+    # a re-seed rebuilds the signal from the buffer
+    buffer.seed(klines[:, -seeded:])
+    assert signal.value == batch_signal(klines[:, -seeded:-1], use_last)[-1]
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import bot_functions as bf
+import vectorized
+from market_data import OPEN, HIGH, LOW, CLOSE
+
+# The NumPy versions must give exactly what the list based originals in bot_functions give on the same candles.
+
+
+def columns(klines):
+    return [klines[column].tolist() for column in (OPEN, HIGH, LOW, CLOSE)]
+
+
+def test_heikin_ashi_matches_bot_functions(klines):
+    expected = bf.construct_heikin_ashi(*columns(klines))
+    actual = vectorized.construct_heikin_ashi(*columns(klines))
+    for value, reference in zip(actual, expected):
+        np.testing.assert_array_equal(value, reference)
+
+
+def test_average_true_range_matches_bot_functions(klines):
+    h_o, h_h, h_l, h_c = bf.construct_heikin_ashi(*columns(klines))
+    np.testing.assert_array_equal(vectorized.avarage_true_range(h_h, h_l, h_c), bf.avarage_true_range(h_h, h_l, h_c))
+
+
+@pytest.mark.parametrize("use_last", [False, True])
+def test_trading_signal_matches_bot_functions(klines, use_last):
+    heikin_ashi = bf.construct_heikin_ashi(*columns(klines))
+    expected = bf.trading_signal(*heikin_ashi, use_last=use_last)
+    np.testing.assert_array_equal(vectorized.trading_signal(*heikin_ashi, use_last=use_last), expected)
+    # on the arrays vectorized.construct_heikin_ashi returns as well
+    heikin_ashi = vectorized.construct_heikin_ashi(*columns(klines))
+    np.testing.assert_array_equal(vectorized.trading_signal(*heikin_ashi, use_last=use_last), expected)
+
+
+@pytest.mark.parametrize("bars", [0, 1, 2, 3])
+def test_short_series(bars):
+    candles = [[100.0 + i for i in range(bars)] for _ in range(4)]
+    expected = bf.construct_heikin_ashi(*candles)
+    actual = vectorized.construct_heikin_ashi(*candles)
+    for value, reference in zip(actual, expected):
+        np.testing.assert_array_equal(value, reference)
+    if bars >= 2:
+        np.testing.assert_array_equal(vectorized.trading_signal(*actual), bf.trading_signal(*expected))
@@ -0,0 +1,75 @@
+import numpy as np
+
+# NumPy versions of the candle/strategy functions in bot_functions. They take and return arrays and give
+# exactly the same output as the list based originals, which stay in bot_functions as the reference path.
+# Recurrences (heikin ashi open, supertrend bands) run as one pass over plain floats, everything else is vectorized.
+
+
+# convert candle arrays into heikin ashi candle arrays
+def construct_heikin_ashi(o, h, l, c):
+    o, h, l, c = (np.asarray(x, dtype=np.float64) for x in (o, h, l, c))
+    h_c = (o + h + l + c) / 4
+
+    h_o = np.empty_like(h_c)
+    if len(h_c):
+        closes = h_c.tolist()
+        opens = [0.0] * len(closes)
+        opens[0] = closes[0]
+        for i in range(1, len(closes)):
+            opens[i] = (opens[i - 1] + closes[i - 1]) / 2
+        h_o[:] = opens
+
+    h_h = np.maximum(np.maximum(h, h_c), h_o)
+    h_l = np.minimum(np.minimum(l, h_c), h_o)
+    return h_o, h_h, h_l, h_c
+
+
+# true range of every candle but the first, same as bot_functions.avarage_true_range
+def avarage_true_range(high, low, close):
+    high, low, close = (np.asarray(x, dtype=np.float64) for x in (high, low, close))
+    prev_close = close[:-1]
+    high, low = high[1:], low[1:]
+    return np.maximum(np.maximum(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+
+# carry the last non-zero value forward over zeros, starting from 0
+def forward_fill(values):
+    index = np.where(values != 0, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+
+# TalonSniper signal from heikin ashi arrays, same output as bot_functions.trading_signal
+def trading_signal(h_o, h_h, h_l, h_c, use_last=False):
+    h_h, h_l, h_c = (np.asarray(x, dtype=np.float64) for x in (h_h, h_l, h_c))
+    factor = 1
+    n = len(h_c)
+    if n < 2:
+        return np.zeros(max(n - 1, 1), dtype=np.int64)
+
+    hl2 = ((h_h + h_l) / 2)[1:]
+    atr = avarage_true_range(h_h, h_l, h_c)
+    up = (hl2 - (factor * atr)).tolist()
+    dn = (hl2 + (factor * atr)).tolist()
+    closes = h_c.tolist()
+
+    trend_up = [0.0] * (n - 1)
+    trend_down = [0.0] * (n - 1)
+    for i in range(1, n - 1):
+        last_up = trend_up[i - 1]
+        trend_up[i] = max(up[i], last_up) if closes[i - 1] > last_up else up[i]
+        last_down = trend_down[i - 1]
+        trend_down[i] = min(dn[i], last_down) if closes[i - 1] < last_down else dn[i]
+
+    trend_up = np.array(trend_up)
+    trend_down = np.array(trend_down)
+    close = h_c[1:]
+    trend = np.where(close > trend_down, 1, np.where(close < trend_up, -1, 0))
+    trend = forward_fill(trend)
+
+    entry = np.zeros(n - 1, dtype=np.int64)
+    entry[1:][(trend[1:] == 1) & (trend[:-1] == -1)] = 1
+    entry[1:][(trend[1:] == -1) & (trend[:-1] == 1)] = -1
+    if use_last:
+        entry = forward_fill(entry)
+    return entry